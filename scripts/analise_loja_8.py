@@ -7,19 +7,23 @@ Processa APENAS a loja 1 para evitar rate limit da API.
 from __future__ import annotations
 
 import logging
-import os
 import sys
 import json
 import time
-import random
 from typing import Any, Optional
 from pathlib import Path
 
 import pandas as pd
 import google.generativeai as genai
-from google.api_core import exceptions as google_exceptions
 from dotenv import load_dotenv
 
+from vendas_core.cache_ia import assinatura_prompt, chave_resposta
+from vendas_core.cliente_ia import ConfigClienteIA, gerar_respostas
+from vendas_core.cubo import agregar_cubo, obter_cubo
+from vendas_core.ia import config_geracao, configurar_ia as configurar_modelo
+from vendas_core.particoes import indexar_particoes, iterar_particoes
+from vendas_core.ranking import ranquear_top_bottom
+
 # Carrega variÃ¡veis do arquivo .env
 load_dotenv()
 
@@ -42,23 +46,35 @@ logger = logging.getLogger(__name__)
 NOME_ARQUIVO = sys.argv[1] if len(sys.argv) > 1 else "dados_vendas.xlsx"
 ARQUIVO_SAIDA = f"analise_temporal_loja_{LOJA_ID}.json"
 
-# Colunas do CSV
-COL_LOJA = 'FtoResumoVendaGeralItem[loja_id]'
-COL_PRODUTO = 'FtoResumoVendaGeralItem[material_descr]'
-COL_VALOR = 'FtoResumoVendaGeralItem[vl_total]'
-COL_DATA = 'FtoResumoVendaGeralItem[dt_contabil]'
-
 # ParÃ¢metros de anÃ¡lise
 TOP_N = 10
 BOTTOM_N = 10
-PAUSA_ENTRE_REQUISICOES = 2.0
 MAX_TENTATIVAS_API = 5
 MAX_TENTATIVAS_RATE_LIMIT = 8
 DELAY_BASE_RATE_LIMIT = 30
-DELAY_ENTRE_CHAMADAS = 35.0  # 35 segundos entre cada chamada
-
-# API Key
-API_KEY = os.environ.get('GEMINI_API_KEY', '')
+MAX_TENTATIVAS_JSON = 3
+# Cota do modelo, compartilhada com as outras lojas rodando em paralelo
+# (sobrescrita por GEMINI_RPM / GEMINI_TPM / GEMINI_RPD / GEMINI_CONCORRENCIA)
+LIMITE_RPM_IA = 30
+LIMITE_TPM_IA = 1_000_000
+LIMITE_RPD_IA = 0  # 0 = sem limite diÃ¡rio
+CONCORRENCIA_IA = 4
+
+# Modelo Gemini (API Key lida de GEMINI_API_KEY via .env)
+MODELO_IA = "gemini-2.0-flash-lite"
+TEMPERATURA_IA = 0.25
+CONFIG_CLIENTE_IA = ConfigClienteIA(
+    rpm=LIMITE_RPM_IA,
+    tpm=LIMITE_TPM_IA,
+    rpd=LIMITE_RPD_IA,
+    concorrencia=CONCORRENCIA_IA,
+    tentativas_api=MAX_TENTATIVAS_API,
+    tentativas_rate_limit=MAX_TENTATIVAS_RATE_LIMIT,
+    delay_base_rate_limit=DELAY_BASE_RATE_LIMIT,
+    tentativas_json=MAX_TENTATIVAS_JSON,
+)
+VERSAO_PROMPT_IA = 1  # incrementar ao alterar o prompt (invalida respostas em cache)
+ASSINATURA_IA = assinatura_prompt('analise_loja', VERSAO_PROMPT_IA, MODELO_IA, config_geracao(TEMPERATURA_IA))
 
 # Contexto sazonal brasileiro
 CONTEXTO_SAZONAL = {
@@ -80,19 +96,6 @@ CONTEXTO_SAZONAL = {
 # FUNÃ‡Ã•ES AUXILIARES
 # ==========================================
 
-def limpar_valor_monetario(valor: Any) -> float:
-    if pd.isna(valor):
-        return 0.0
-    if isinstance(valor, (int, float)):
-        return float(valor)
-    if isinstance(valor, str):
-        try:
-            return float(valor.strip().replace('.', '').replace(',', '.'))
-        except ValueError:
-            return 0.0
-    return 0.0
-
-
 def extrair_nome_mes(mes_periodo: str) -> str:
     meses = {
         '01': 'Janeiro', '02': 'Fevereiro', '03': 'MarÃ§o', '04': 'Abril',
@@ -121,24 +124,7 @@ def obter_contexto_sazonal(mes_ref: str) -> dict[str, str]:
 # ==========================================
 
 def configurar_ia() -> Optional[genai.GenerativeModel]:
-    if not API_KEY:
-        logger.warning("API Key nÃ£o configurada. AnÃ¡lise IA serÃ¡ pulada.")
-        return None
-
-    try:
-        genai.configure(api_key=API_KEY)
-        modelo = genai.GenerativeModel(
-            model_name="gemini-2.0-flash-lite",
-            generation_config={
-                "temperature": 0.25,
-                "response_mime_type": "application/json"
-            }
-        )
-        logger.info("Modelo Gemini 2.0 Flash Lite configurado com sucesso")
-        return modelo
-    except Exception as e:
-        logger.error(f"Erro ao configurar modelo: {e}")
-        return None
+    return configurar_modelo(MODELO_IA, TEMPERATURA_IA)
 
 
 def construir_prompt_analise(
@@ -219,220 +205,121 @@ def limpar_json_resposta(texto: str) -> str:
     return texto.strip()
 
 
-def analisar_mes_com_ia(
-    modelo: genai.GenerativeModel, id_loja: Any, mes_ref: str,
-    lista_itens: list[dict], total_mensal: float, tentativas_max: int = MAX_TENTATIVAS_API
-) -> list[dict]:
-    if not modelo or not lista_itens:
-        return []
-
-    nome_mes = extrair_nome_mes(mes_ref)
-    contexto_sazonal = obter_contexto_sazonal(mes_ref)
-    prompt = construir_prompt_analise(id_loja, mes_ref, nome_mes, lista_itens, contexto_sazonal, total_mensal)
-
-    tentativas_rate_limit = 0
-    tentativas_json_error = 0
-    max_tentativas_json = 3
-    tentativa = 0
-
-    while tentativa < tentativas_max or tentativas_rate_limit < MAX_TENTATIVAS_RATE_LIMIT:
-        tentativa += 1
-        try:
-            time.sleep(DELAY_ENTRE_CHAMADAS)
-            resposta = modelo.generate_content(prompt)
-
-            if not resposta or not resposta.text:
-                logger.warning(f"Resposta vazia da IA ({mes_ref})")
-                continue
-
-            # Limpa o JSON antes de parsear
-            texto_limpo = limpar_json_resposta(resposta.text)
-            resultado = json.loads(texto_limpo)
-
-            if not isinstance(resultado, list):
-                logger.warning(f"Resposta nÃ£o Ã© lista: {type(resultado)}")
-                return []
-
-            for item in resultado:
-                if isinstance(item, dict):
-                    item.setdefault('diagnostico', 'AnÃ¡lise indisponÃ­vel')
-                    item.setdefault('acao', '-')
-
-            logger.debug(f"IA retornou {len(resultado)} anÃ¡lises para {mes_ref}")
-            return resultado
-
-        except json.JSONDecodeError as e:
-            tentativas_json_error += 1
-            logger.warning(f"Erro ao parsear JSON ({mes_ref}), tentativa {tentativas_json_error}/{max_tentativas_json}: {e}")
-            if tentativas_json_error >= max_tentativas_json:
-                logger.error(f"âŒ JSON invÃ¡lido persistente para {mes_ref}. Pulando.")
-                return []
-            tentativa -= 1  # NÃ£o conta como tentativa normal
-            continue
+def interpretar_resposta(texto: str) -> Any:
+    """Limpa e interpreta o JSON da resposta da IA."""
+    return json.loads(limpar_json_resposta(texto))
 
-        except google_exceptions.ResourceExhausted:
-            tentativas_rate_limit += 1
-            tempo = DELAY_BASE_RATE_LIMIT * tentativas_rate_limit + random.uniform(0, 5)
-            logger.warning(f"âš ï¸ Rate limit! Tentativa {tentativas_rate_limit}/{MAX_TENTATIVAS_RATE_LIMIT}. Aguardando {tempo:.0f}s...")
-            time.sleep(tempo)
-
-            if tentativas_rate_limit >= MAX_TENTATIVAS_RATE_LIMIT:
-                logger.error(f"âŒ Rate limit persistente para {mes_ref}. Pulando.")
-                return []
-            tentativa -= 1
-            continue
 
-        except (google_exceptions.ServiceUnavailable, google_exceptions.DeadlineExceeded, ConnectionError) as e:
-            tempo = (2 ** tentativa) + random.uniform(0, 1)
-            logger.warning(f"Erro de conexÃ£o ({mes_ref}), tentativa {tentativa}/{tentativas_max}: {e}")
-            if tentativa < tentativas_max:
-                time.sleep(tempo)
-            else:
-                return []
-
-        except Exception as e:
-            logger.error(f"Erro inesperado ({mes_ref}): {type(e).__name__}: {e}")
-            return []
-
-    return []
+def analisar_meses_com_ia(
+    modelo: genai.GenerativeModel, id_loja: Any, pedidos: list[tuple[str, list[dict], float]]
+) -> list[list[dict]]:
+    # Um prompt por (mÃªs, itens, total), enviados em paralelo no ritmo da cota (ver vendas_core.cliente_ia)
+    if not modelo or not pedidos:
+        return [[] for _ in pedidos]
 
+    prompts = [
+        construir_prompt_analise(
+            id_loja, mes_ref, extrair_nome_mes(mes_ref), lista_itens, obter_contexto_sazonal(mes_ref), total_mensal
+        )
+        for mes_ref, lista_itens, total_mensal in pedidos
+    ]
+    meses = [mes_ref for mes_ref, _, _ in pedidos]
+    # Meses com as mesmas entradas reaproveitam a resposta anterior (ver vendas_core.cache_ia)
+    chaves = [
+        chave_resposta(ASSINATURA_IA, {
+            "loja": str(id_loja), "mes": mes_ref, "itens": lista_itens, "total": round(total_mensal, 2)
+        })
+        for mes_ref, lista_itens, total_mensal in pedidos
+    ]
+    respostas = gerar_respostas(
+        modelo, prompts, CONFIG_CLIENTE_IA, rotulos=meses, interpretar=interpretar_resposta, chaves_cache=chaves,
+        produtos=[[item['produto'] for item in lista_itens] for _, lista_itens, _ in pedidos]
+    )
+
+    resultados = []
+    for resultado, mes_ref in zip(respostas, meses):
+        if resultado is not None and not isinstance(resultado, list):
+            logger.warning(f"Resposta nÃ£o Ã© lista: {type(resultado)}")
+        if not isinstance(resultado, list):
+            resultados.append([])
+            continue
 
-# ==========================================
-# CARREGAMENTO E PREPARAÃ‡ÃƒO DOS DADOS
-# ==========================================
+        for item in resultado:
+            if isinstance(item, dict):
+                item.setdefault('diagnostico', 'AnÃ¡lise indisponÃ­vel')
+                item.setdefault('acao', '-')
 
-def carregar_dados(caminho: str) -> Optional[pd.DataFrame]:
-    """Carrega arquivo de dados (CSV ou XLSX) com tratamento automÃ¡tico de formato."""
-    if not os.path.exists(caminho):
-        logger.error(f"Arquivo nÃ£o encontrado: {caminho}")
-        return None
-
-    # Detecta formato pela extensÃ£o
-    extensao = caminho.lower().split('.')[-1]
-
-    # Arquivos Excel (.xlsx)
-    if extensao in ['xlsx', 'xls']:
-        try:
-            df = pd.read_excel(caminho, engine='openpyxl', dtype={COL_LOJA: str})
-            logger.info(f"Arquivo Excel carregado - {len(df)} registros")
-            return df
-        except Exception as e:
-            logger.error(f"Erro ao carregar Excel: {e}")
-            return None
-
-    # Arquivos CSV
-    encodings = ['latin1', 'utf-8', 'cp1252']
-    for encoding in encodings:
-        try:
-            df = pd.read_csv(caminho, sep=';', encoding=encoding, on_bad_lines='skip', dtype={COL_LOJA: str})
-            logger.info(f"CSV carregado (encoding: {encoding}) - {len(df)} registros")
-            return df
-        except UnicodeDecodeError:
-            continue
-        except Exception as e:
-            logger.error(f"Erro ao carregar CSV: {e}")
-            return None
-    logger.error("NÃ£o foi possÃ­vel carregar o arquivo")
-    return None
-
-
-def preparar_dados(df: pd.DataFrame) -> Optional[pd.DataFrame]:
-    colunas_necessarias = [COL_LOJA, COL_PRODUTO, COL_VALOR, COL_DATA]
-    faltantes = [c for c in colunas_necessarias if c not in df.columns]
-    if faltantes:
-        logger.error(f"Colunas faltantes: {faltantes}")
-        return None
-
-    df = df.copy()
-    df['valor_limpo'] = df[COL_VALOR].apply(limpar_valor_monetario)
-    df = df[df['valor_limpo'] > 0]
-    df['data_obj'] = pd.to_datetime(df[COL_DATA], dayfirst=True, errors='coerce')
-    df['mes_ano'] = df['data_obj'].dt.to_period('M').astype(str)
-    df = df.dropna(subset=['mes_ano'])
-    df['produto'] = df[COL_PRODUTO].astype(str).str.strip().str.upper().str.replace(r'\s+', ' ', regex=True)
-    df['loja_id'] = df[COL_LOJA].astype(str)
-
-    df_agrupado = df.groupby(['loja_id', 'mes_ano', 'produto'])['valor_limpo'].sum().reset_index()
-    logger.info(f"Dados preparados: {len(df_agrupado)} registros agregados")
-    return df_agrupado
+        logger.debug(f"IA retornou {len(resultado)} anÃ¡lises para {mes_ref}")
+        resultados.append(resultado)
+    return resultados
 
 
 # ==========================================
 # PROCESSAMENTO DE RANKING MENSAL
 # ==========================================
 
-def selecionar_top_bottom(df_mes: pd.DataFrame) -> pd.DataFrame:
-    df_mes = df_mes.sort_values(by='valor_limpo', ascending=False)
-    total = len(df_mes)
-    if total == 0:
-        return pd.DataFrame()
-    if total <= (TOP_N + BOTTOM_N):
-        df_mes = df_mes.copy()
-        df_mes['tipo_ranking'] = 'GERAL'
-        return df_mes
-
-    top = df_mes.head(TOP_N).copy()
-    top['tipo_ranking'] = f'TOP {TOP_N}'
-    bottom = df_mes.tail(BOTTOM_N).copy()
-    bottom['tipo_ranking'] = f'BOTTOM {BOTTOM_N}'
-    return pd.concat([top, bottom], ignore_index=True)
-
-
-def processar_mes(df_loja: pd.DataFrame, mes_atual: str) -> tuple[list[dict], float]:
-    df_mes = df_loja[df_loja['mes_ano'] == mes_atual].copy()
-    total_mensal = df_mes['valor_limpo'].sum()
-    selecao = selecionar_top_bottom(df_mes)
-
-    if selecao.empty:
-        return [], total_mensal
-
-    itens = selecao.apply(
-        lambda row: {
-            "produto": row['produto'],
-            "tipo": row['tipo_ranking'],
-            "venda_este_mes": round(row['valor_limpo'], 2)
-        }, axis=1
-    ).tolist()
+def selecionar_top_bottom(df_loja: pd.DataFrame) -> pd.DataFrame:
+    # Ranking de todos os meses em uma Ãºnica ordenaÃ§Ã£o (GERAL se couber inteiro)
+    return ranquear_top_bottom(
+        df_loja, ['mes_ano'], TOP_N, BOTTOM_N,
+        rotulo_top=f'TOP {TOP_N}',
+        rotulo_bottom=f'BOTTOM {BOTTOM_N}',
+        rotulo_geral='GERAL',
+        coluna_tipo='tipo_ranking',
+    )
+
+
+def processar_mes(df_mes: pd.DataFrame) -> tuple[list[dict], float]:
+    if df_mes.empty:
+        return [], 0.0
+
+    total_mensal = df_mes['total_grupo'].iat[0]
+    itens = [
+        {"produto": produto, "tipo": tipo, "venda_este_mes": round(valor, 2)}
+        for produto, tipo, valor in zip(
+            df_mes['produto'], df_mes['tipo_ranking'], df_mes['valor_limpo'].to_numpy()
+        )
+    ]
     return itens, total_mensal
 
 
-def aplicar_analise_ia(modelo: Optional[genai.GenerativeModel], id_loja: str, mes: str, itens: list[dict], total_mensal: float) -> list[dict]:
+def aplicar_analise_ia(modelo: Optional[genai.GenerativeModel], id_loja: str, pedidos: list[tuple[str, list[dict], float]]) -> None:
     if not modelo:
-        for item in itens:
-            item['analise_ia'] = {"diagnostico": "IA nÃ£o disponÃ­vel", "acao": "-"}
-        return itens
+        for _, itens, _ in pedidos:
+            for item in itens:
+                item['analise_ia'] = {"diagnostico": "IA nÃ£o disponÃ­vel", "acao": "-"}
+        return
 
-    resultado_ia = analisar_mes_com_ia(modelo, id_loja, mes, itens, total_mensal)
-    dict_analises = {item['produto']: item for item in resultado_ia if isinstance(item, dict) and 'produto' in item}
+    resultados_ia = analisar_meses_com_ia(modelo, id_loja, pedidos)
+    for (_, itens, _), resultado_ia in zip(pedidos, resultados_ia):
+        dict_analises = {item['produto']: item for item in resultado_ia if isinstance(item, dict) and 'produto' in item}
 
-    for item in itens:
-        analise = dict_analises.get(item['produto'], {})
-        item['analise_ia'] = {
-            "diagnostico": analise.get('diagnostico', 'AnÃ¡lise indisponÃ­vel'),
-            "acao": analise.get('acao', '-')
-        }
-    return itens
+        for item in itens:
+            analise = dict_analises.get(item['produto'], {})
+            item['analise_ia'] = {
+                "diagnostico": analise.get('diagnostico', 'AnÃ¡lise indisponÃ­vel'),
+                "acao": analise.get('acao', '-')
+            }
 
 
 def processar_loja(df_loja: pd.DataFrame, id_loja: str, modelo: Optional[genai.GenerativeModel]) -> dict:
-    meses = sorted(df_loja['mes_ano'].unique())
     analises_mensais = {}
+    pedidos = []
 
-    for i, mes_atual in enumerate(meses):
-        itens, total_mensal = processar_mes(df_loja, mes_atual)
+    for mes_atual, df_mes in iterar_particoes(df_loja, 'mes_ano'):
+        itens, total_mensal = processar_mes(df_mes)
         if not itens:
             continue
 
         logger.info(f"  ðŸ“… {extrair_nome_mes(mes_atual)}: {len(itens)} itens | Total: R$ {total_mensal:,.2f}")
-        itens = aplicar_analise_ia(modelo, id_loja, mes_atual, itens, total_mensal)
-
         analises_mensais[mes_atual] = {
             "total_mensal": round(total_mensal, 2),
             "itens": itens
         }
+        pedidos.append((mes_atual, itens, total_mensal))
 
-        if modelo and i < len(meses) - 1:
-            time.sleep(PAUSA_ENTRE_REQUISICOES)
+    # Todos os meses vÃ£o Ã  IA juntos
+    aplicar_analise_ia(modelo, id_loja, pedidos)
 
     try:
         id_loja_final = int(id_loja)
@@ -459,29 +346,26 @@ def salvar_resultado(resultado: list[dict], caminho: str) -> bool:
 # FUNÃ‡ÃƒO PRINCIPAL
 # ==========================================
 
-def main() -> None:
+def main() -> int:
+    """Executa a anÃ¡lise da loja e retorna o cÃ³digo de saÃ­da (0 = sucesso)."""
     logger.info("=" * 60)
     logger.info(f"ANÃLISE TEMPORAL - LOJA {LOJA_ID}")
     logger.info("=" * 60)
 
     inicio = time.time()
 
-    # 1. Carrega dados
-    df_raw = carregar_dados(NOME_ARQUIVO)
-    if df_raw is None:
-        return
-
-    # 2. Prepara dados
-    df = preparar_dados(df_raw)
-    if df is None:
-        return
-    del df_raw
+    # 1-2. Abre o cubo diÃ¡rio e agrega por mÃªs
+    cubo = obter_cubo(NOME_ARQUIVO)
+    if cubo is None:
+        return 1
+    df = agregar_cubo(cubo, 'mes').rename(columns={'periodo': 'mes_ano'})
 
-    # 3. Filtra APENAS a loja especÃ­fica
-    df_loja = df[df['loja_id'] == LOJA_ID]
-    if df_loja.empty:
+    # 3. Filtra APENAS a loja especÃ­fica (fatia contÃ­gua do agregado)
+    fatia = indexar_particoes(df['loja_id']).get(LOJA_ID)
+    if fatia is None:
         logger.error(f"Loja {LOJA_ID} nÃ£o encontrada nos dados")
-        return
+        return 1
+    df_loja = df.iloc[fatia]
 
     logger.info(f"Processando loja {LOJA_ID} com {len(df_loja)} registros")
 
@@ -496,7 +380,7 @@ def main() -> None:
     meses_disponiveis = sorted(df_loja['mes_ano'].unique())
     logger.info(f"PerÃ­odo: {meses_disponiveis[0]} a {meses_disponiveis[-1]}")
 
-    resultado_loja = processar_loja(df_loja, LOJA_ID, modelo)
+    resultado_loja = processar_loja(selecionar_top_bottom(df_loja), LOJA_ID, modelo)
 
     # 6. Salva resultado
     if salvar_resultado([resultado_loja], ARQUIVO_SAIDA):
@@ -506,10 +390,12 @@ def main() -> None:
         logger.info(f"â±ï¸  Tempo total: {tempo_total:.1f} segundos")
         logger.info(f"ðŸ“ Arquivo: {ARQUIVO_SAIDA}")
         logger.info("=" * 60)
-    else:
-        logger.error("âŒ Falha ao salvar resultado")
+        return 0
+
+    logger.error("âŒ Falha ao salvar resultado")
+    return 1
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
 
@@ -18,19 +18,26 @@ Estrutura de saída:
 from __future__ import annotations
 
 import logging
-import os
 import sys
 import json
 import time
-import random
 from typing import Any, Optional
 from pathlib import Path
 
 import pandas as pd
 import google.generativeai as genai
-from google.api_core import exceptions as google_exceptions
 from dotenv import load_dotenv
 
+from vendas_core.cache_ia import abrir_cache_respostas, assinatura_prompt, chave_resposta
+from vendas_core.cliente_ia import ConfigClienteIA, gerar_respostas
+from vendas_core.cubo import agregar_cubo, obter_cubo
+from vendas_core.fechados import (
+    carregar_fechados, congelados_da_loja, impressoes_periodos, periodos_alterados, salvar_fechados
+)
+from vendas_core.ia import config_geracao, configurar_ia as configurar_modelo
+from vendas_core.particoes import indexar_particoes, iterar_particoes
+from vendas_core.ranking import ranquear_top_bottom
+
 # Carrega variáveis do arquivo .env
 load_dotenv()
 
@@ -50,23 +57,33 @@ logger = logging.getLogger(__name__)
 NOME_ARQUIVO = sys.argv[1] if len(sys.argv) > 1 else "dados_vendas.xlsx"
 ARQUIVO_SAIDA = "analise_mensal_sazonal.json"
 
-# Colunas do CSV
-COL_LOJA = 'FtoResumoVendaGeralItem[loja_id]'
-COL_PRODUTO = 'FtoResumoVendaGeralItem[material_descr]'
-COL_VALOR = 'FtoResumoVendaGeralItem[vl_total]'
-COL_DATA = 'FtoResumoVendaGeralItem[dt_contabil]'
-
 # Parâmetros de análise
 TOP_N = 10
 BOTTOM_N = 10
-PAUSA_ENTRE_REQUISICOES = 2.0  # segundos entre requisições
 MAX_TENTATIVAS_API = 5   # tentativas para erros gerais
 MAX_TENTATIVAS_RATE_LIMIT = 8  # tentativas extras para rate limit
 DELAY_BASE_RATE_LIMIT = 30  # segundos base para rate limit
-DELAY_ENTRE_CHAMADAS = 20.0  # segundos entre cada chamada (3 req/min seguro)
-
-# API Key - carrega de variável de ambiente via .env
-API_KEY = os.environ.get('GEMINI_API_KEY', '')
+# Cota do modelo, compartilhada entre processos (sobrescrita por GEMINI_RPM / GEMINI_TPM /
+# GEMINI_RPD / GEMINI_CONCORRENCIA)
+LIMITE_RPM_IA = 15           # requisições por minuto
+LIMITE_TPM_IA = 1_000_000    # tokens por minuto
+LIMITE_RPD_IA = 0            # requisições por dia (0 = sem limite)
+CONCORRENCIA_IA = 4          # requisições simultâneas
+
+# Modelo Gemini (API Key lida de GEMINI_API_KEY via .env)
+MODELO_IA = "gemini-2.0-flash"
+TEMPERATURA_IA = 0.25
+CONFIG_CLIENTE_IA = ConfigClienteIA(
+    rpm=LIMITE_RPM_IA,
+    tpm=LIMITE_TPM_IA,
+    rpd=LIMITE_RPD_IA,
+    concorrencia=CONCORRENCIA_IA,
+    tentativas_api=MAX_TENTATIVAS_API,
+    tentativas_rate_limit=MAX_TENTATIVAS_RATE_LIMIT,
+    delay_base_rate_limit=DELAY_BASE_RATE_LIMIT,
+)
+VERSAO_PROMPT_IA = 1  # incrementar ao alterar o prompt (invalida respostas em cache)
+ASSINATURA_IA = assinatura_prompt('analise_temporal', VERSAO_PROMPT_IA, MODELO_IA, config_geracao(TEMPERATURA_IA))
 
 # Mapeamento de meses para contexto sazonal brasileiro
 CONTEXTO_SAZONAL = {
@@ -88,20 +105,6 @@ CONTEXTO_SAZONAL = {
 # 2. FUNÇÕES AUXILIARES
 # ==========================================
 
-def limpar_valor_monetario(valor: Any) -> float:
-    """Converte valor monetário BR (1.234,56) para float."""
-    if pd.isna(valor):
-        return 0.0
-    if isinstance(valor, (int, float)):
-        return float(valor)
-    if isinstance(valor, str):
-        try:
-            return float(valor.strip().replace('.', '').replace(',', '.'))
-        except ValueError:
-            return 0.0
-    return 0.0
-
-
 def calcular_variacao(atual: float, anterior: float) -> tuple[float, str]:
     """
     Calcula variação percentual entre dois valores.
@@ -137,24 +140,7 @@ def extrair_nome_mes(mes_periodo: str) -> str:
 
 def configurar_ia() -> Optional[genai.GenerativeModel]:
     """Configura e retorna o modelo Gemini."""
-    if not API_KEY:
-        logger.warning("API Key não configurada. Análise IA será pulada.")
-        return None
-
-    try:
-        genai.configure(api_key=API_KEY)
-        modelo = genai.GenerativeModel(
-            model_name="gemini-2.0-flash",  # Modelo leve com rate limits mais altos
-            generation_config={
-                "temperature": 0.25,
-                "response_mime_type": "application/json"
-            }
-        )
-        logger.info("Modelo Gemini 2.0 Flash Lite configurado com sucesso")
-        return modelo
-    except Exception as e:
-        logger.error(f"Erro ao configurar modelo: {e}")
-        return None
+    return configurar_modelo(MODELO_IA, TEMPERATURA_IA)
 
 
 def obter_contexto_sazonal(mes_ref: str) -> dict[str, str]:
@@ -290,238 +276,134 @@ Retorne EXATAMENTE um array JSON com um objeto para CADA produto:
     return prompt
 
 
-def analisar_mes_com_ia(
-    modelo: genai.GenerativeModel,
-    id_loja: Any,
-    mes_ref: str,
-    lista_itens: list[dict],
-    total_mensal: float,
-    tentativas_max: int = MAX_TENTATIVAS_API
-) -> list[dict]:
+def validar_resposta_mes(resultado: Any, mes_ref: str) -> list[dict]:
     """
-    Analisa desempenho mensal de produtos usando IA com retry robusto.
-
-    Implementa exponential backoff para lidar com rate limits e erros
-    de conexão, garantindo resiliência nas chamadas à API.
-
-    Para rate limit (429), usa delays maiores e mais tentativas.
+    Valida a resposta da IA de um mês e garante os campos mínimos de cada item.
 
     Args:
-        modelo: Modelo Gemini configurado
-        id_loja: Identificador da loja
+        resultado: JSON interpretado da resposta (None = falha)
         mes_ref: Período no formato '2024-01'
-        lista_itens: Lista de produtos com dados de vendas
-        total_mensal: Valor total de vendas do mês
-        tentativas_max: Número máximo de tentativas em caso de erro
 
     Returns:
-        Lista de dicionários com análises por produto
+        Lista de análises por produto (vazia se inválida)
     """
-    if not modelo or not lista_itens:
+    if resultado is None:
         return []
 
-    nome_mes = extrair_nome_mes(mes_ref)
-    contexto_sazonal = obter_contexto_sazonal(mes_ref)
-
-    # Constrói prompt otimizado
-    prompt = construir_prompt_analise(
-        id_loja, mes_ref, nome_mes, lista_itens, contexto_sazonal, total_mensal
-    )
+    # Valida estrutura da resposta
+    if not isinstance(resultado, list):
+        logger.warning(f"Resposta não é lista: {type(resultado)}")
+        return []
 
-    tentativas_rate_limit = 0  # Contador separado para rate limit
-    tentativa = 0
-
-    while tentativa < tentativas_max or tentativas_rate_limit < MAX_TENTATIVAS_RATE_LIMIT:
-        tentativa += 1
-        try:
-            # Pausa entre chamadas para evitar rate limit
-            time.sleep(DELAY_ENTRE_CHAMADAS)
-
-            resposta = modelo.generate_content(prompt)
-
-            if not resposta or not resposta.text:
-                logger.warning(f"Resposta vazia da IA ({mes_ref})")
-                continue
-
-            resultado = json.loads(resposta.text)
-
-            # Valida estrutura da resposta
-            if not isinstance(resultado, list):
-                logger.warning(f"Resposta não é lista: {type(resultado)}")
-                return []
-
-            # Valida que cada item tem os campos necessários
-            for item in resultado:
-                if not isinstance(item, dict):
-                    continue
-                # Garante campos mínimos
-                item.setdefault('diagnostico', 'Análise indisponível')
-                item.setdefault('acao', '-')
-
-            logger.debug(f"IA retornou {len(resultado)} análises para {mes_ref}")
-            return resultado
-
-        except json.JSONDecodeError as e:
-            logger.warning(f"Erro ao parsear JSON ({mes_ref}): {e}")
-            return []
-
-        except google_exceptions.ResourceExhausted:
-            tentativas_rate_limit += 1
-            # Delay progressivo: 30s, 60s, 90s, 120s... (mais agressivo para rate limit)
-            tempo = DELAY_BASE_RATE_LIMIT * tentativas_rate_limit + random.uniform(0, 5)
-            logger.warning(
-                f"⚠️ Rate limit atingido! Tentativa {tentativas_rate_limit}/{MAX_TENTATIVAS_RATE_LIMIT}. "
-                f"Aguardando {tempo:.0f}s..."
-            )
-            time.sleep(tempo)
-
-            if tentativas_rate_limit >= MAX_TENTATIVAS_RATE_LIMIT:
-                logger.error(f"❌ Rate limit persistente para {mes_ref}. Pulando.")
-                return []
-
-            # Não incrementa tentativa normal para rate limit
-            tentativa -= 1
+    # Valida que cada item tem os campos necessários
+    for item in resultado:
+        if not isinstance(item, dict):
             continue
+        # Garante campos mínimos
+        item.setdefault('diagnostico', 'Análise indisponível')
+        item.setdefault('acao', '-')
 
-        except (google_exceptions.ServiceUnavailable,
-                google_exceptions.DeadlineExceeded,
-                ConnectionError) as e:
-            tempo = (2 ** tentativa) + random.uniform(0, 1)
-            logger.warning(f"Erro de conexão ({mes_ref}), tentativa {tentativa}/{tentativas_max}: {e}")
-            if tentativa < tentativas_max:
-                time.sleep(tempo)
-            else:
-                logger.error(f"Falha definitiva após {tentativas_max} tentativas para {mes_ref}")
-                return []
-
-        except Exception as e:
-            logger.error(f"Erro inesperado ({mes_ref}): {type(e).__name__}: {e}")
-            return []
-
-    return []
-
-# ==========================================
-# 4. CARREGAMENTO E PREPARAÇÃO DOS DADOS
-# ==========================================
+    logger.debug(f"IA retornou {len(resultado)} análises para {mes_ref}")
+    return resultado
 
-def carregar_dados(caminho: str) -> Optional[pd.DataFrame]:
-    """Carrega arquivo de dados (CSV ou XLSX) com tratamento automático de formato."""
-    if not os.path.exists(caminho):
-        logger.error(f"Arquivo não encontrado: {caminho}")
-        return None
 
-    # Detecta formato pela extensão
-    extensao = caminho.lower().split('.')[-1]
-
-    # Arquivos Excel (.xlsx)
-    if extensao in ['xlsx', 'xls']:
-        try:
-            df = pd.read_excel(
-                caminho,
-                engine='openpyxl',
-                dtype={COL_LOJA: str}
-            )
-            logger.info(f"Arquivo Excel carregado - {len(df)} registros")
-            return df
-        except Exception as e:
-            logger.error(f"Erro ao carregar Excel: {e}")
-            return None
-
-    # Arquivos CSV
-    encodings = ['latin1', 'utf-8', 'cp1252']
-
-    for encoding in encodings:
-        try:
-            df = pd.read_csv(
-                caminho,
-                sep=';',
-                encoding=encoding,
-                on_bad_lines='skip',
-                dtype={COL_LOJA: str}
-            )
-            logger.info(f"CSV carregado (encoding: {encoding}) - {len(df)} registros")
-            return df
-        except UnicodeDecodeError:
-            continue
-        except Exception as e:
-            logger.error(f"Erro ao carregar CSV: {e}")
-            return None
+def analisar_meses_com_ia(
+    modelo: genai.GenerativeModel,
+    id_loja: Any,
+    pedidos: list[tuple[str, list[dict], float]]
+) -> list[list[dict]]:
+    """
+    Analisa o desempenho mensal de produtos de vários meses em paralelo.
 
-    logger.error("Não foi possível carregar o arquivo")
-    return None
+    As chamadas seguem a cota do modelo (token bucket de RPM/TPM e
+    concorrência limitada, ver `vendas_core.cliente_ia`), com retentativa
+    para rate limit e erros de conexão.
 
+    Args:
+        modelo: Modelo Gemini configurado
+        id_loja: Identificador da loja
+        pedidos: Tuplas (mês '2024-01', itens do mês, total mensal)
 
-def preparar_dados(df: pd.DataFrame) -> Optional[pd.DataFrame]:
-    """Limpa e prepara dados para análise temporal."""
-    # Valida colunas necessárias
-    colunas_necessarias = [COL_LOJA, COL_PRODUTO, COL_VALOR, COL_DATA]
-    faltantes = [c for c in colunas_necessarias if c not in df.columns]
-    if faltantes:
-        logger.error(f"Colunas faltantes: {faltantes}")
-        return None
+    Returns:
+        Uma lista de análises por produto para cada pedido, na mesma ordem
+    """
+    if not modelo or not pedidos:
+        return [[] for _ in pedidos]
+
+    # Constrói prompts otimizados
+    prompts = [
+        construir_prompt_analise(
+            id_loja, mes_ref, extrair_nome_mes(mes_ref), lista_itens,
+            obter_contexto_sazonal(mes_ref), total_mensal
+        )
+        for mes_ref, lista_itens, total_mensal in pedidos
+    ]
+    meses = [mes_ref for mes_ref, _, _ in pedidos]
+
+    # Meses com as mesmas entradas reaproveitam a resposta anterior (ver vendas_core.cache_ia)
+    chaves = [
+        chave_resposta(ASSINATURA_IA, {
+            "loja": str(id_loja), "mes": mes_ref, "itens": lista_itens, "total": round(total_mensal, 2)
+        })
+        for mes_ref, lista_itens, total_mensal in pedidos
+    ]
 
-    df = df.copy()
+    respostas = gerar_respostas(
+        modelo, prompts, CONFIG_CLIENTE_IA, rotulos=meses, chaves_cache=chaves,
+        produtos=[[item['produto'] for item in lista_itens] for _, lista_itens, _ in pedidos]
+    )
+    return [validar_resposta_mes(resposta, mes_ref) for resposta, mes_ref in zip(respostas, meses)]
 
-    # Limpa valores monetários
-    df['valor_limpo'] = df[COL_VALOR].apply(limpar_valor_monetario)
-    df = df[df['valor_limpo'] > 0]
+# ==========================================
+# 4. CARREGAMENTO E PREPARAÇÃO DOS DADOS
+# ==========================================
 
-    # Processa datas
-    df['data_obj'] = pd.to_datetime(df[COL_DATA], dayfirst=True, errors='coerce')
-    df['mes_ano'] = df['data_obj'].dt.to_period('M').astype(str)
-    df = df.dropna(subset=['mes_ano'])
+def carregar_vendas_mensais(caminho: str) -> Optional[pd.DataFrame]:
+    """
+    Abre o cubo diário de vendas e agrega por loja, mês e produto.
 
-    # Padroniza produtos
-    df['produto'] = (
-        df[COL_PRODUTO]
-        .astype(str)
-        .str.strip()
-        .str.upper()
-        .str.replace(r'\s+', ' ', regex=True)
-    )
-    df['loja_id'] = df[COL_LOJA].astype(str)
+    Args:
+        caminho: Caminho para o arquivo de dados (CSV ou XLSX)
 
-    # Agrupamento mensal
-    df_agrupado = (
-        df.groupby(['loja_id', 'mes_ano', 'produto'])['valor_limpo']
-        .sum()
-        .reset_index()
-    )
+    Returns:
+        DataFrame com (loja_id, mes_ano, produto, valor_limpo) ou None
+    """
+    cubo = obter_cubo(caminho)
+    if cubo is None:
+        return None
 
-    logger.info(f"Dados preparados: {len(df_agrupado)} registros agregados")
-    return df_agrupado
+    df = agregar_cubo(cubo, 'mes').rename(columns={'periodo': 'mes_ano'})
+    logger.info(f"Dados preparados: {len(df)} registros agregados")
+    return df
 
 
 # ==========================================
 # 5. PROCESSAMENTO DE RANKING MENSAL
 # ==========================================
 
-def selecionar_top_bottom(df_mes: pd.DataFrame) -> pd.DataFrame:
-    """Seleciona TOP N e BOTTOM N do mês."""
-    df_mes = df_mes.sort_values(by='valor_limpo', ascending=False)
-    total = len(df_mes)
-
-    if total == 0:
-        return pd.DataFrame()
-
-    if total <= (TOP_N + BOTTOM_N):
-        df_mes = df_mes.copy()
-        df_mes['tipo_ranking'] = 'GERAL'
-        return df_mes
+def selecionar_top_bottom(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Seleciona TOP N e BOTTOM N de cada (loja, mês) em uma única ordenação.
 
-    top = df_mes.head(TOP_N).copy()
-    top['tipo_ranking'] = f'TOP {TOP_N}'
+    Meses com até TOP_N + BOTTOM_N produtos saem inteiros como 'GERAL'.
 
-    bottom = df_mes.tail(BOTTOM_N).copy()
-    bottom['tipo_ranking'] = f'BOTTOM {BOTTOM_N}'
+    Args:
+        df: Vendas mensais (loja_id, mes_ano, produto, valor_limpo)
 
-    return pd.concat([top, bottom], ignore_index=True)
+    Returns:
+        Seleção ordenada por loja e mês, com tipo_ranking e total_grupo
+        (total mensal de todos os produtos)
+    """
+    return ranquear_top_bottom(
+        df, ['loja_id', 'mes_ano'], TOP_N, BOTTOM_N,
+        rotulo_top=f'TOP {TOP_N}',
+        rotulo_bottom=f'BOTTOM {BOTTOM_N}',
+        rotulo_geral='GERAL',
+        coluna_tipo='tipo_ranking',
+    )
 
 
-def processar_mes(
-    df_loja: pd.DataFrame,
-    mes_atual: str
-) -> tuple[list[dict], float]:
+def processar_mes(df_mes: pd.DataFrame) -> tuple[list[dict], float]:
     """
     Processa dados de um mês específico, gerando ranking TOP/BOTTOM.
 
@@ -529,31 +411,24 @@ def processar_mes(
     Retorna também o total mensal de vendas (todos os produtos).
 
     Args:
-        df_loja: DataFrame com dados da loja
-        mes_atual: Período atual no formato '2024-01'
+        df_mes: Fatia do ranking com o mês da loja (ver `selecionar_top_bottom`)
 
     Returns:
         Tupla com (lista de dicionários com dados de cada produto, total mensal)
     """
-    df_mes = df_loja[df_loja['mes_ano'] == mes_atual].copy()
+    if df_mes.empty:
+        return [], 0.0
 
-    # Calcula o TOTAL MENSAL de todas as vendas (não apenas TOP/BOTTOM)
-    total_mensal = df_mes['valor_limpo'].sum()
-
-    selecao = selecionar_top_bottom(df_mes)
-
-    if selecao.empty:
-        return [], total_mensal
+    # TOTAL MENSAL de todas as vendas (não apenas TOP/BOTTOM)
+    total_mensal = df_mes['total_grupo'].iat[0]
 
     # Converte para lista de dicionários (sem comparações)
-    itens = selecao.apply(
-        lambda row: {
-            "produto": row['produto'],
-            "tipo": row['tipo_ranking'],
-            "venda_este_mes": round(row['valor_limpo'], 2)
-        },
-        axis=1
-    ).tolist()
+    itens = [
+        {"produto": produto, "tipo": tipo, "venda_este_mes": round(valor, 2)}
+        for produto, tipo, valor in zip(
+            df_mes['produto'], df_mes['tipo_ranking'], df_mes['valor_limpo'].to_numpy()
+        )
+    ]
 
     return itens, total_mensal
 
@@ -561,66 +436,78 @@ def processar_mes(
 def aplicar_analise_ia(
     modelo: Optional[genai.GenerativeModel],
     id_loja: str,
-    mes: str,
-    itens: list[dict],
-    total_mensal: float
-) -> list[dict]:
-    """Aplica análise IA aos itens do mês."""
+    pedidos: list[tuple[str, list[dict], float]]
+) -> None:
+    """Aplica análise IA aos itens de cada (mês, itens, total_mensal), em paralelo."""
     if not modelo:
         # Adiciona campo vazio se não houver IA
-        for item in itens:
-            item['analise_ia'] = {"diagnostico": "IA não disponível", "acao": "-"}
-        return itens
-
-    resultado_ia = analisar_mes_com_ia(modelo, id_loja, mes, itens, total_mensal)
-
-    # Mapeia resultados por produto
-    dict_analises = {}
-    for item in resultado_ia:
-        if isinstance(item, dict) and 'produto' in item:
-            dict_analises[item['produto']] = item
-
-    # Aplica análises aos itens
-    for item in itens:
-        analise = dict_analises.get(item['produto'], {})
-        item['analise_ia'] = {
-            "diagnostico": analise.get('diagnostico', 'Análise indisponível'),
-            "acao": analise.get('acao', '-')
-        }
+        for _, itens, _ in pedidos:
+            for item in itens:
+                item['analise_ia'] = {"diagnostico": "IA não disponível", "acao": "-"}
+        return
+
+    resultados_ia = analisar_meses_com_ia(modelo, id_loja, pedidos)
+
+    for (_, itens, _), resultado_ia in zip(pedidos, resultados_ia):
+        # Mapeia resultados por produto
+        dict_analises = {}
+        for item in resultado_ia:
+            if isinstance(item, dict) and 'produto' in item:
+                dict_analises[item['produto']] = item
 
-    return itens
+        # Aplica análises aos itens
+        for item in itens:
+            analise = dict_analises.get(item['produto'], {})
+            item['analise_ia'] = {
+                "diagnostico": analise.get('diagnostico', 'Análise indisponível'),
+                "acao": analise.get('acao', '-')
+            }
 
 
 def processar_loja(
     df_loja: pd.DataFrame,
     id_loja: str,
-    modelo: Optional[genai.GenerativeModel]
+    modelo: Optional[genai.GenerativeModel],
+    congelados: Optional[dict[str, dict]] = None
 ) -> dict:
-    """Processa todos os meses de uma loja."""
-    meses = sorted(df_loja['mes_ano'].unique())
+    """
+    Processa todos os meses de uma loja (df_loja: fatia do ranking).
+
+    Os meses abertos são enviados à IA juntos (ver `aplicar_analise_ia`).
+    Meses em `congelados` (fechados na execução anterior, ver
+    `vendas_core.fechados`) são copiados sem recalcular nem chamar a IA.
+    """
+    congelados = congelados or {}
+
+    if congelados:
+        logger.info(f"  🧊 {len(congelados)} meses fechados reaproveitados")
+
+    # Fatias contíguas por mês (o ranking já vem ordenado por loja e mês)
     analises_mensais = {}
+    pedidos = []
+
+    for mes_atual, df_mes in iterar_particoes(df_loja, 'mes_ano'):
+        if mes_atual in congelados:
+            analises_mensais[mes_atual] = congelados[mes_atual]
+            continue
 
-    for i, mes_atual in enumerate(meses):
         # Processa ranking do mês e calcula total mensal
-        itens, total_mensal = processar_mes(df_loja, mes_atual)
+        itens, total_mensal = processar_mes(df_mes)
 
         if not itens:
             continue
 
         logger.info(f"  📅 {extrair_nome_mes(mes_atual)}: {len(itens)} itens | Total: R$ {total_mensal:,.2f}")
 
-        # Aplica análise IA
-        itens = aplicar_analise_ia(modelo, id_loja, mes_atual, itens, total_mensal)
-
-        # Adiciona total mensal ao resultado
+        # Adiciona total mensal ao resultado (itens recebem a análise IA abaixo)
         analises_mensais[mes_atual] = {
             "total_mensal": round(total_mensal, 2),
             "itens": itens
         }
+        pedidos.append((mes_atual, itens, total_mensal))
 
-        # Pausa entre requisições
-        if modelo and i < len(meses) - 1:
-            time.sleep(PAUSA_ENTRE_REQUISICOES)
+    # Aplica análise IA a todos os meses abertos de uma vez
+    aplicar_analise_ia(modelo, id_loja, pedidos)
 
     # Converte ID para int se possível
     try:
@@ -701,16 +588,19 @@ def gerar_estatisticas_execucao(resultado: list[dict]) -> dict[str, Any]:
 # 6. FUNÇÃO PRINCIPAL
 # ==========================================
 
-def main() -> None:
+def main() -> int:
     """
     Executa análise temporal completa de vendas por loja.
 
     Fluxo:
-    1. Carrega e valida dados do CSV
-    2. Prepara dados (limpeza, agregação mensal)
+    1. Abre o cubo diário de vendas (construído uma vez por extrato)
+    2. Agrega vendas por loja e mês
     3. Configura modelo de IA
     4. Para cada loja: processa rankings mensais com análise IA
     5. Salva resultado em JSON
+
+    Returns:
+        Código de saída (0 = sucesso, 1 = falha ao carregar os dados ou salvar o resultado)
     """
     logger.info("=" * 60)
     logger.info("ANÁLISE TEMPORAL MENSAL - TOP/BOTTOM 10 COM IA")
@@ -718,18 +608,10 @@ def main() -> None:
 
     inicio = time.time()
 
-    # 1. Carrega dados
-    df_raw = carregar_dados(NOME_ARQUIVO)
-    if df_raw is None:
-        return
-
-    # 2. Prepara dados
-    df = preparar_dados(df_raw)
+    # 1-2. Abre o cubo diário e agrega por mês
+    df = carregar_vendas_mensais(NOME_ARQUIVO)
     if df is None:
-        return
-
-    # Libera memória do DataFrame original
-    del df_raw
+        return 1
 
     # 3. Configura IA
     modelo = configurar_ia()
@@ -740,7 +622,10 @@ def main() -> None:
         logger.warning("Análise sem IA - apenas rankings serão gerados")
 
     # 4. Processa cada loja
-    lojas = sorted(df['loja_id'].unique())
+    # Ranking TOP/BOTTOM de todos os meses de todas as lojas de uma vez,
+    # com índice de fatias por loja
+    ranking = selecionar_top_bottom(df)
+    lojas = indexar_particoes(ranking['loja_id'])
     total_lojas = len(lojas)
 
     # Estatísticas de meses disponíveis
@@ -748,16 +633,34 @@ def main() -> None:
     logger.info(f"Período de análise: {meses_disponiveis[0]} a {meses_disponiveis[-1]}")
     logger.info(f"Processando {total_lojas} lojas...")
 
+    # Meses fechados da execução anterior (só o mês aberto é recalculado)
+    mes_aberto = str(meses_disponiveis[-1])
+    config = {
+        "top_n": TOP_N,
+        "bottom_n": BOTTOM_N,
+        "modelo": MODELO_IA if modelo else None,
+        "versao_prompt": VERSAO_PROMPT_IA,
+    }
+    impressoes = impressoes_periodos(df, 'mes_ano', ['produto', 'valor_limpo'])
+    fechados = carregar_fechados(ARQUIVO_SAIDA, config, 'analises_mensais', impressoes)
+    alterados = periodos_alterados(NOME_ARQUIVO, 'mes')
+
     resultado = []
-    for idx, id_loja in enumerate(lojas, 1):
+    for idx, (id_loja, fatia) in enumerate(lojas.items(), 1):
         logger.info(f"🏢 Loja {id_loja} ({idx}/{total_lojas})")
 
-        df_loja = df[df['loja_id'] == id_loja]
-        resultado_loja = processar_loja(df_loja, id_loja, modelo)
+        df_loja = ranking.iloc[fatia]
+        congelados = congelados_da_loja(fechados, alterados, id_loja, mes_aberto)
+        resultado_loja = processar_loja(df_loja, id_loja, modelo, congelados)
         resultado.append(resultado_loja)
 
+    if modelo:
+        abrir_cache_respostas().registrar_estatisticas("respostas da IA")
+
     # 5. Salva resultado
     if salvar_resultado(resultado, ARQUIVO_SAIDA):
+        salvar_fechados(ARQUIVO_SAIDA, config, resultado, 'analises_mensais', mes_aberto, impressoes)
+
         # Estatísticas finais
         stats = gerar_estatisticas_execucao(resultado)
         tempo_total = time.time() - inicio
@@ -774,9 +677,11 @@ def main() -> None:
         logger.info("-" * 60)
         logger.info("Estrutura: {id_loja, analises_mensais: {mes: {total_mensal, itens}}}")
         logger.info("=" * 60)
-    else:
-        logger.error("❌ Falha ao salvar resultado final")
+        return 0
+
+    logger.error("❌ Falha ao salvar resultado final")
+    return 1
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
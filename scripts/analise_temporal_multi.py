@@ -5,11 +5,16 @@ Gera rankings e análises com IA para diferentes períodos temporais.
 
 Uso:
     python analise_temporal_multi.py [arquivo_dados] [--diario] [--semanal] [--mensal]
+                                     [--trimestral] [--anual] [--all]
+
+Sem opções (ou com --all) gera diário, semanal e mensal; trimestral e anual
+só são gerados quando pedidos explicitamente.
 
 Saída: JSONs separados em mp-main/data/
     - vendas_diario.json
     - vendas_semanal.json
     - vendas_mensal.json
+    - vendas_trimestral.json / vendas_anual.json (opcionais)
     - consolidado.json (índice de todos os arquivos)
 """
 
@@ -22,12 +27,19 @@ from datetime import datetime, timedelta
 from typing import Optional, Any
 import pandas as pd
 
-# Tenta importar o Gemini
-try:
-    import google.generativeai as genai
-    GEMINI_DISPONIVEL = True
-except ImportError:
-    GEMINI_DISPONIVEL = False
+from vendas_core.cache_ia import abrir_cache_respostas, assinatura_prompt, chave_resposta
+from vendas_core.cliente_ia import ConfigClienteIA, gerar_respostas
+from vendas_core.cubo import agregar_hierarquia, intervalo_datas, obter_cubo
+from vendas_core.fechados import (
+    bloco_completo, carregar_fechados, chave_loja, congelados_da_loja, impressoes_periodos, periodos_alterados,
+    salvar_fechados
+)
+from vendas_core.ia import config_geracao, configurar_ia as configurar_modelo
+from vendas_core.impressoes import (
+    carregar_secoes_anteriores, impressoes_por_loja, reaproveitar_secao, salvar_impressoes
+)
+from vendas_core.particoes import indexar_particoes, iterar_particoes
+from vendas_core.ranking import ranquear_top_bottom
 
 # Configuração de logging
 logging.basicConfig(
@@ -43,157 +55,65 @@ logger = logging.getLogger(__name__)
 NOME_ARQUIVO = sys.argv[1] if len(sys.argv) > 1 else "dados_vendas.csv"
 PASTA_SAIDA = "docs/data"
 
-# Colunas do CSV/XLSX
-COL_LOJA = 'FtoResumoVendaGeralItem[loja_id]'
-COL_PRODUTO = 'FtoResumoVendaGeralItem[material_descr]'
-COL_VALOR = 'FtoResumoVendaGeralItem[vl_total]'
-COL_DATA = 'FtoResumoVendaGeralItem[dt_contabil]'
-
 # Parâmetros
 TOP_N = 10
 BOTTOM_N = 10
-PAUSA_ENTRE_REQUISICOES = 2.0
 MAX_TENTATIVAS_API = 5
-DELAY_ENTRE_CHAMADAS = 12.0  # segundos entre chamadas (reduzido para plano pago)
+# Cota do modelo, compartilhada entre processos (sobrescrita por GEMINI_RPM / GEMINI_TPM /
+# GEMINI_RPD / GEMINI_CONCORRENCIA)
+LIMITE_RPM_IA = 15           # requisições por minuto
+LIMITE_TPM_IA = 1_000_000    # tokens por minuto
+LIMITE_RPD_IA = 0            # requisições por dia (0 = sem limite)
+CONCORRENCIA_IA = 4          # requisições simultâneas
+
+MODELO_IA = "gemini-2.0-flash"
+TEMPERATURA_IA = 0.25
+CONFIG_CLIENTE_IA = ConfigClienteIA(
+    rpm=LIMITE_RPM_IA,
+    tpm=LIMITE_TPM_IA,
+    rpd=LIMITE_RPD_IA,
+    concorrencia=CONCORRENCIA_IA,
+    tentativas_api=MAX_TENTATIVAS_API,
+)
+VERSAO_PROMPT_IA = 1  # incrementar ao alterar o prompt (invalida seções e respostas em cache)
+ASSINATURA_IA = assinatura_prompt(
+    'analise_temporal_multi', VERSAO_PROMPT_IA, MODELO_IA, config_geracao(TEMPERATURA_IA)
+)
 
-API_KEY = os.environ.get('GEMINI_API_KEY', '')
+# Colunas que definem a entrada de cada loja (ver vendas_core.impressoes)
+COLUNAS_IMPRESSAO = ['periodo', 'produto', 'valor_limpo']
 
 # ==========================================
 # FUNÇÕES AUXILIARES
 # ==========================================
 
-def limpar_valor_monetario(valor: Any) -> float:
-    """Converte valor monetário para float."""
-    if pd.isna(valor):
-        return 0.0
-    if isinstance(valor, (int, float)):
-        return float(valor)
-    texto = str(valor).strip()
-    texto = texto.replace('R$', '').replace(' ', '')
-    texto = texto.replace('.', '').replace(',', '.')
-    try:
-        return float(texto)
-    except ValueError:
-        return 0.0
-
-
-def carregar_dados(caminho: str) -> Optional[pd.DataFrame]:
-    """Carrega arquivo de dados (CSV ou XLSX)."""
-    if not os.path.exists(caminho):
-        logger.error(f"Arquivo não encontrado: {caminho}")
-        return None
-
-    extensao = caminho.lower().split('.')[-1]
-
-    if extensao in ['xlsx', 'xls']:
-        try:
-            df = pd.read_excel(caminho, engine='openpyxl', dtype={COL_LOJA: str})
-            logger.info(f"Excel carregado - {len(df)} registros")
-            return df
-        except Exception as e:
-            logger.error(f"Erro ao carregar Excel: {e}")
-            return None
-    else:
-        try:
-            for encoding in ['utf-8', 'latin1', 'cp1252']:
-                try:
-                    df = pd.read_csv(caminho, sep=';', encoding=encoding, dtype={COL_LOJA: str})
-                    logger.info(f"CSV carregado ({encoding}) - {len(df)} registros")
-                    return df
-                except UnicodeDecodeError:
-                    continue
-            return None
-        except Exception as e:
-            logger.error(f"Erro ao carregar CSV: {e}")
-            return None
-
-
-def preparar_dados(df: pd.DataFrame) -> pd.DataFrame:
-    """Prepara dados com colunas temporais."""
-    df = df.copy()
-
-    # Limpa valores
-    df['valor_limpo'] = df[COL_VALOR].apply(limpar_valor_monetario)
-    df = df[df['valor_limpo'] > 0]
-
-    # Processa datas
-    df['data_obj'] = pd.to_datetime(df[COL_DATA], dayfirst=True, errors='coerce')
-    df = df.dropna(subset=['data_obj'])
-
-    # Cria colunas temporais
-    df['dia'] = df['data_obj'].dt.strftime('%Y-%m-%d')
-    df['semana'] = df['data_obj'].dt.strftime('%Y-W%W')
-    df['mes'] = df['data_obj'].dt.to_period('M').astype(str)
-
-    # Padroniza
-    df['produto'] = df[COL_PRODUTO].astype(str).str.strip().str.upper()
-    df['loja_id'] = df[COL_LOJA].astype(str)
-
-    logger.info(f"Dados preparados: {len(df)} registros válidos")
-    return df
-
-
 def configurar_ia() -> Optional[Any]:
     """Configura modelo Gemini."""
-    if not GEMINI_DISPONIVEL or not API_KEY:
-        logger.warning("API Gemini não disponível")
-        return None
-    try:
-        genai.configure(api_key=API_KEY)
-        modelo = genai.GenerativeModel(
-            model_name="gemini-2.0-flash",
-            generation_config={"temperature": 0.25, "response_mime_type": "application/json"}
-        )
-        logger.info("Gemini configurado")
-        return modelo
-    except Exception as e:
-        logger.error(f"Erro ao configurar Gemini: {e}")
-        return None
+    return configurar_modelo(MODELO_IA, TEMPERATURA_IA)
 
 
 # ==========================================
 # ANÁLISE POR GRANULARIDADE
 # ==========================================
 
-def agregar_por_periodo(df: pd.DataFrame, coluna_periodo: str) -> pd.DataFrame:
-    """Agrega dados por período (dia, semana ou mês)."""
-    return (
-        df.groupby(['loja_id', coluna_periodo, 'produto'])['valor_limpo']
-        .sum()
-        .reset_index()
-        .rename(columns={coluna_periodo: 'periodo'})
-    )
-
-
-def selecionar_top_bottom(df_periodo: pd.DataFrame, top_n: int = TOP_N, bottom_n: int = BOTTOM_N) -> pd.DataFrame:
-    """Seleciona TOP e BOTTOM produtos de um período."""
-    df_sorted = df_periodo.sort_values('valor_limpo', ascending=False)
-
-    # TOP N
-    top = df_sorted.head(top_n).copy()
-    top['tipo'] = 'TOP'
-
-    # BOTTOM N (com vendas > 0)
-    bottom = df_sorted[df_sorted['valor_limpo'] > 0].tail(bottom_n).copy()
-    bottom['tipo'] = 'BOTTOM'
-
-    return pd.concat([top, bottom], ignore_index=True)
 
+def selecionar_top_bottom(df_agregado: pd.DataFrame, top_n: int = TOP_N, bottom_n: int = BOTTOM_N) -> pd.DataFrame:
+    """Seleciona TOP e BOTTOM (com vendas > 0) de cada (loja, período) em uma única ordenação."""
+    return ranquear_top_bottom(
+        df_agregado, ['loja_id', 'periodo'], top_n, bottom_n,
+        bottom_apenas_positivos=True,
+    )
 
-def analisar_com_ia(modelo: Any, id_loja: str, periodo: str, itens: list, total: float, granularidade: str) -> list:
-    """Analisa produtos com IA."""
-    if not modelo or not itens:
-        for item in itens:
-            item['analise_ia'] = {"diagnostico": "IA não disponível", "acao": "-"}
-        return itens
 
+def construir_prompt(id_loja: str, periodo: str, itens: list, total: float, granularidade: str) -> str:
+    """Monta o prompt de análise de um período da loja."""
     # Prepara dados para o prompt
     dados_texto = "\n".join([
         f"- {i['produto']}: R$ {i['valor']:.2f} ({i['tipo']})"
         for i in itens
     ])
 
-    prompt = f"""Analise o desempenho de vendas da Loja {id_loja} no período {periodo} ({granularidade}).
+    return f"""Analise o desempenho de vendas da Loja {id_loja} no período {periodo} ({granularidade}).
 
 DADOS DE VENDAS:
 {dados_texto}
@@ -207,13 +127,48 @@ Para CADA produto, forneça:
 Retorne JSON array:
 [{{"produto": "NOME", "diagnostico": "...", "acao": "..."}}]"""
 
-    try:
-        time.sleep(DELAY_ENTRE_CHAMADAS)
-        resposta = modelo.generate_content(prompt)
-        resultado = json.loads(resposta.text)
+
+def analisar_com_ia(modelo: Any, id_loja: str, pedidos: list[tuple[str, list, float]], granularidade: str) -> None:
+    """
+    Analisa produtos com IA: um prompt por (período, itens, total), enviados em
+    paralelo no ritmo da cota do modelo (ver `vendas_core.cliente_ia`).
+    """
+    if not modelo:
+        for _, itens, _ in pedidos:
+            for item in itens:
+                item['analise_ia'] = {"diagnostico": "IA não disponível", "acao": "-"}
+        return
+
+    pedidos = [(periodo, itens, total) for periodo, itens, total in pedidos if itens]
+    # Períodos com as mesmas entradas reaproveitam a resposta anterior (ver vendas_core.cache_ia)
+    chaves = [
+        chave_resposta(ASSINATURA_IA, {
+            "loja": str(id_loja), "periodo": periodo, "granularidade": granularidade,
+            "itens": itens, "total": round(total, 2),
+        })
+        for periodo, itens, total in pedidos
+    ]
+    respostas = gerar_respostas(
+        modelo,
+        [construir_prompt(id_loja, periodo, itens, total, granularidade) for periodo, itens, total in pedidos],
+        CONFIG_CLIENTE_IA,
+        rotulos=[periodo for periodo, _, _ in pedidos],
+        chaves_cache=chaves,
+        produtos=[[item['produto'] for item in itens] for _, itens, _ in pedidos],
+    )
+
+    for (periodo, itens, _), resultado in zip(pedidos, respostas):
+        if resultado is None:
+            logger.warning(f"Erro IA para {periodo}")
+            for item in itens:
+                item['analise_ia'] = {"diagnostico": "Erro na análise", "acao": "-"}
+            continue
 
         # Mapeia resultados
-        dict_analises = {r['produto']: r for r in resultado if isinstance(r, dict)}
+        dict_analises = {
+            r['produto']: r for r in (resultado if isinstance(resultado, list) else [])
+            if isinstance(r, dict) and 'produto' in r
+        }
 
         for item in itens:
             analise = dict_analises.get(item['produto'], {})
@@ -222,54 +177,82 @@ Retorne JSON array:
                 "acao": analise.get('acao', '-')
             }
 
-        return itens
-    except Exception as e:
-        logger.warning(f"Erro IA para {periodo}: {e}")
-        for item in itens:
-            item['analise_ia'] = {"diagnostico": "Erro na análise", "acao": "-"}
-        return itens
-
 
-def processar_granularidade(df: pd.DataFrame, coluna_periodo: str, granularidade: str, modelo: Any) -> dict:
-    """Processa análise para uma granularidade específica."""
+def periodo_aberto(df_agregado: pd.DataFrame) -> str:
+    """Último período com vendas (o único que ainda pode mudar)."""
+    return str(df_agregado['periodo'].cat.categories[-1])
+
+
+def processar_granularidade(
+    df_agregado: pd.DataFrame,
+    granularidade: str,
+    modelo: Any,
+    fechados: Optional[dict] = None,
+    alterados: Optional[dict] = None,
+    impressoes: Optional[dict] = None,
+    anteriores: Optional[dict] = None
+) -> dict:
+    """
+    Processa análise para uma granularidade (df_agregado: ver `agregar_hierarquia`).
+
+    Lojas cuja impressão digital (`impressoes`) é a mesma da execução anterior
+    reaproveitam a seção inteira (`anteriores`, ver `vendas_core.impressoes`).
+    Nas demais, períodos fechados (`fechados`, ver `vendas_core.fechados`)
+    são copiados sem recalcular nem chamar a IA, exceto os marcados em
+    `alterados` pela ingestão incremental.
+    """
     logger.info(f"\n{'='*50}")
     logger.info(f"📊 Processando análise {granularidade.upper()}")
     logger.info(f"{'='*50}")
 
-    df_agregado = agregar_por_periodo(df, coluna_periodo)
-    lojas = sorted(df_agregado['loja_id'].unique())
+    ranking = selecionar_top_bottom(df_agregado)
+    aberto = periodo_aberto(df_agregado)
 
     resultado = {"granularidade": granularidade, "gerado_em": datetime.now().isoformat(), "dados_lojas": []}
 
-    for id_loja in lojas:
-        df_loja = df_agregado[df_agregado['loja_id'] == id_loja]
-        periodos = sorted(df_loja['periodo'].unique())
+    # Fatias contíguas: o ranking já vem ordenado por (loja, período)
+    for id_loja, df_loja in iterar_particoes(ranking, 'loja_id'):
+        secao = reaproveitar_secao(anteriores or {}, id_loja, (impressoes or {}).get(id_loja))
+        if secao is not None:
+            logger.info(f"🏢 Loja {id_loja}: entrada inalterada - seção anterior reaproveitada")
+            resultado["dados_lojas"].append(secao)
+            continue
 
-        logger.info(f"🏢 Loja {id_loja}: {len(periodos)} períodos")
+        particoes_periodo = indexar_particoes(df_loja['periodo'])
+        periodos = list(particoes_periodo)
 
-        analises = {}
-        for periodo in periodos:
-            df_periodo = df_loja[df_loja['periodo'] == periodo]
-            total = df_periodo['valor_limpo'].sum()
+        congelados = congelados_da_loja(fechados or {}, alterados or {}, id_loja, aberto)
+        logger.info(f"🏢 Loja {id_loja}: {len(periodos)} períodos ({len(congelados)} fechados reaproveitados)")
 
-            selecao = selecionar_top_bottom(df_periodo)
-            if selecao.empty:
+        analises = {}
+        pedidos = []
+        for periodo, fatia in particoes_periodo.items():
+            if periodo in congelados:
+                analises[periodo] = congelados[periodo]
                 continue
 
+            selecao = df_loja.iloc[fatia]
+            total = selecao['total_grupo'].iat[0]
+
             itens = [
-                {"produto": row['produto'], "valor": round(row['valor_limpo'], 2), "tipo": row['tipo']}
-                for _, row in selecao.iterrows()
+                {"produto": produto, "valor": round(valor, 2), "tipo": tipo}
+                for produto, valor, tipo in zip(
+                    selecao['produto'], selecao['valor_limpo'].to_numpy(), selecao['tipo']
+                )
             ]
 
             # Análise IA (apenas para os últimos 7 períodos para economizar rate limit)
             if periodo in periodos[-7:]:
-                itens = analisar_com_ia(modelo, id_loja, periodo, itens, total, granularidade)
+                pedidos.append((periodo, itens, total))
             else:
                 for item in itens:
                     item['analise_ia'] = {"diagnostico": "Período histórico", "acao": "-"}
 
             analises[periodo] = {"total": round(total, 2), "itens": itens}
 
+        # Períodos recentes da loja vão à IA juntos
+        analisar_com_ia(modelo, id_loja, pedidos, granularidade)
+
         try:
             id_loja_final = int(id_loja)
         except:
@@ -299,8 +282,8 @@ def salvar_json(dados: dict, nome_arquivo: str) -> bool:
         return False
 
 
-def main():
-    """Executa análise temporal multi-granularidade."""
+def main() -> int:
+    """Executa análise temporal multi-granularidade e retorna o código de saída (0 = sucesso)."""
     inicio = time.time()
 
     logger.info("="*60)
@@ -312,52 +295,98 @@ def main():
     fazer_diario = '--diario' in args or '--all' in args or len([a for a in args if a.startswith('--')]) == 0
     fazer_semanal = '--semanal' in args or '--all' in args or len([a for a in args if a.startswith('--')]) == 0
     fazer_mensal = '--mensal' in args or '--all' in args or len([a for a in args if a.startswith('--')]) == 0
+    fazer_trimestral = '--trimestral' in args
+    fazer_anual = '--anual' in args
 
-    logger.info(f"Granularidades: Diário={fazer_diario}, Semanal={fazer_semanal}, Mensal={fazer_mensal}")
+    logger.info(
+        f"Granularidades: Diário={fazer_diario}, Semanal={fazer_semanal}, Mensal={fazer_mensal}, "
+        f"Trimestral={fazer_trimestral}, Anual={fazer_anual}"
+    )
 
-    # Carrega dados
-    df = carregar_dados(NOME_ARQUIVO)
-    if df is None:
+    # Abre o cubo diário (compartilhado no processo)
+    cubo = obter_cubo(NOME_ARQUIVO)
+    if cubo is None:
         logger.error("Falha ao carregar dados")
         return 1
 
-    df = preparar_dados(df)
-    if df.empty:
+    if len(cubo.valor) == 0:
         logger.error("Nenhum dado válido após preparação")
         return 1
 
+    # Rollup hierárquico: todas as granularidades pedidas a partir do cubo diário
+    pedidas = [
+        (fazer_mensal, 'mes', 'mensal'),
+        (fazer_semanal, 'semana', 'semanal'),
+        (fazer_diario, 'dia', 'diario'),
+        (fazer_trimestral, 'trimestre', 'trimestral'),
+        (fazer_anual, 'ano', 'anual'),
+    ]
+    agregados = agregar_hierarquia(cubo, [chave for fazer, chave, _ in pedidas if fazer])
+
     # Configura IA
     modelo = configurar_ia()
 
     # Processa cada granularidade
     arquivos_gerados = []
+    falhas_gravacao = []
+
+    # Seções e períodos fechados só são recalculados se a configuração mudar
+    config = {
+        "top_n": TOP_N,
+        "bottom_n": BOTTOM_N,
+        "modelo": MODELO_IA if modelo else None,
+        "versao_prompt": VERSAO_PROMPT_IA,
+    }
 
-    if fazer_mensal:
-        resultado_mensal = processar_granularidade(df, 'mes', 'mensal', modelo)
-        if salvar_json(resultado_mensal, 'vendas_mensal.json'):
-            arquivos_gerados.append('vendas_mensal.json')
+    for fazer, chave, granularidade in pedidas:
+        if not fazer:
+            continue
+        arquivo = f'vendas_{granularidade}.json'
+        caminho = os.path.join(PASTA_SAIDA, arquivo)
+
+        impressoes_periodo = impressoes_periodos(agregados[chave], 'periodo', ['produto', 'valor_limpo'])
+        fechados = carregar_fechados(caminho, config, 'analises', impressoes_periodo)
+        alterados = periodos_alterados(NOME_ARQUIVO, chave)
+        impressoes = impressoes_por_loja(agregados[chave], COLUNAS_IMPRESSAO)
+        anteriores = carregar_secoes_anteriores(caminho, config)
+        resultado = processar_granularidade(
+            agregados[chave], granularidade, modelo, fechados, alterados, impressoes, anteriores
+        )
 
-    if fazer_semanal:
-        resultado_semanal = processar_granularidade(df, 'semana', 'semanal', modelo)
-        if salvar_json(resultado_semanal, 'vendas_semanal.json'):
-            arquivos_gerados.append('vendas_semanal.json')
+        if salvar_json(resultado, arquivo):
+            arquivos_gerados.append(arquivo)
+            salvar_fechados(
+                caminho, config, resultado['dados_lojas'], 'analises',
+                periodo_aberto(agregados[chave]), impressoes_periodo
+            )
+            # Só seções completas (sem falha de IA) podem ser reaproveitadas
+            completas = {
+                chave_loja(loja['id_loja']) for loja in resultado['dados_lojas']
+                if modelo is None or all(bloco_completo(bloco) for bloco in loja['analises'].values())
+            }
+            salvar_impressoes(caminho, config, {
+                id_loja: impressao for id_loja, impressao in impressoes.items()
+                if chave_loja(id_loja) in completas
+            })
+        else:
+            falhas_gravacao.append(arquivo)
 
-    if fazer_diario:
-        resultado_diario = processar_granularidade(df, 'dia', 'diario', modelo)
-        if salvar_json(resultado_diario, 'vendas_diario.json'):
-            arquivos_gerados.append('vendas_diario.json')
+    if modelo:
+        abrir_cache_respostas().registrar_estatisticas("respostas da IA")
 
     # Gera arquivo consolidado (índice)
+    data_inicio, data_fim = intervalo_datas(cubo)
     consolidado = {
         "gerado_em": datetime.now().isoformat(),
         "arquivos": arquivos_gerados,
-        "lojas": sorted(df['loja_id'].unique().tolist()),
+        "lojas": sorted(cubo.lojas),
         "periodo_dados": {
-            "inicio": df['data_obj'].min().strftime('%Y-%m-%d'),
-            "fim": df['data_obj'].max().strftime('%Y-%m-%d')
+            "inicio": data_inicio,
+            "fim": data_fim
         }
     }
-    salvar_json(consolidado, 'consolidado.json')
+    if not salvar_json(consolidado, 'consolidado.json'):
+        falhas_gravacao.append('consolidado.json')
 
     # Estatísticas finais
     tempo_total = time.time() - inicio
@@ -370,6 +399,9 @@ def main():
         logger.info(f"   - {PASTA_SAIDA}/{arq}")
     logger.info("="*60)
 
+    if falhas_gravacao:
+        logger.error(f"❌ Falha ao salvar: {', '.join(falhas_gravacao)}")
+        return 1
     return 0
 
 
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+BENCHMARK: LEITURA DO EXTRATO CSV (LAÇO DE ENCODINGS x LEITURA ÚNICA)
+Gera um CSV sintético no formato do extrato (com colunas extras e acentos em
+UTF-8) e compara o carregador antigo com `ler_csv_vendas` nos engines c e pyarrow.
+
+Uso:
+    python benchmark_csv.py [linhas]   (padrão: 2.000.000)
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import time
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+from vendas_core.colunas import COL_DATA, COL_LOJA, COL_PRODUTO, COL_VALOR
+from vendas_core.leitura_csv import ler_csv_vendas
+from vendas_core.staging import PYARROW_DISPONIVEL
+
+LINHAS_PADRAO = 2_000_000
+
+
+def gerar_csv_sintetico(caminho: str, linhas: int) -> None:
+    """Gera um extrato sintético com 4 colunas úteis e 6 colunas extras."""
+    rng = np.random.default_rng(42)
+    produtos = np.array([f"PRODUTO {i:04d} AÇAÍ" for i in range(2000)])
+    datas = pd.date_range('2022-12-13', '2025-12-30', freq='D').strftime('%d/%m/%Y').to_numpy()
+    valores = rng.gamma(2.0, 40.0, linhas)
+
+    df = pd.DataFrame({
+        COL_LOJA: rng.choice(['1', '2', '3', '12', '14', '15', '20'], linhas),
+        COL_PRODUTO: rng.choice(produtos, linhas),
+        COL_VALOR: pd.Series(valores).map('{:.2f}'.format).str.replace('.', ',', regex=False),
+        COL_DATA: rng.choice(datas, linhas),
+    })
+    for i in range(6):
+        df[f'FtoResumoVendaGeralItem[extra_{i}]'] = rng.integers(0, 10_000, linhas)
+
+    df.to_csv(caminho, sep=';', index=False, encoding='utf-8')
+
+
+def carregador_antigo(caminho: str) -> Optional[pd.DataFrame]:
+    """Reprodução do laço de encodings usado antes de `ler_csv_vendas`."""
+    for encoding in ['latin1', 'utf-8', 'cp1252']:
+        try:
+            return pd.read_csv(caminho, sep=';', encoding=encoding, on_bad_lines='skip', dtype={COL_LOJA: str})
+        except UnicodeDecodeError:
+            continue
+    return None
+
+
+def medir(nome: str, funcao: Callable[[], Optional[pd.DataFrame]]) -> float:
+    """Executa o carregador e imprime tempo, memória e se os acentos sobreviveram."""
+    inicio = time.perf_counter()
+    df = funcao()
+    tempo = time.perf_counter() - inicio
+
+    memoria_mb = df.memory_usage(deep=True).sum() / 1024 ** 2
+    acentos_ok = df[COL_PRODUTO].iloc[0].endswith('AÇAÍ')
+    print(f"{nome:<28} {tempo:>8.2f}s {memoria_mb:>10.1f} MB   colunas={df.shape[1]:<3} acentos_ok={acentos_ok}")
+    return tempo
+
+
+def main() -> None:
+    linhas = int(sys.argv[1]) if len(sys.argv) > 1 else LINHAS_PADRAO
+
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = os.path.join(pasta, 'extrato.csv')
+        print(f"Gerando CSV sintético com {linhas:,} linhas...")
+        gerar_csv_sintetico(caminho, linhas)
+        print(f"Tamanho: {os.path.getsize(caminho) / 1024 ** 2:.1f} MB\n")
+
+        print(f"{'carregador':<28} {'tempo':>9} {'memória':>13}")
+        base = medir('antigo (laço de encodings)', lambda: carregador_antigo(caminho))
+        tempo_c = medir('ler_csv_vendas (c)', lambda: ler_csv_vendas(caminho, engine='c'))
+        print(f"{'':<28} speedup {base / tempo_c:.1f}x")
+
+        if PYARROW_DISPONIVEL:
+            tempo_pa = medir('ler_csv_vendas (pyarrow)', lambda: ler_csv_vendas(caminho, engine='pyarrow'))
+            print(f"{'':<28} speedup {base / tempo_pa:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
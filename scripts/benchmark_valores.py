@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+BENCHMARK: CONVERSÃO DE VALORES MONETÁRIOS (APPLY POR LINHA x VETORIZADA)
+Gera uma coluna sintética de valores no formato do extrato (R$ 1.234,56, com
+uma fração de valores inválidos) e compara o `.apply(limpar_valor_monetario)`
+antigo com `converter_valores_monetarios`.
+
+`limpar_valor_monetario` é a função antiga copiada sem alterações, inclusive
+o aviso por linha que falha (escrito em os.devnull, para medir o custo do log
+sem poluir a saída). A função antiga não removia 'R$', então essas linhas
+viravam 0; as diferenças são contadas e exibidas, não escondidas.
+
+Uso:
+    python benchmark_valores.py [linhas]   (padrão: 1.000.000)
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import sys
+import time
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+
+from vendas_core.limpeza import converter_valores_monetarios
+
+LINHAS_PADRAO = 1_000_000
+FRACAO_INVALIDOS = 0.001
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+
+# Logger da função antiga: mesmo nível e formato, saída descartada
+logger = logging.getLogger('benchmark_valores.antigo')
+logger.propagate = False
+_saida_log = logging.StreamHandler(open(os.devnull, 'w'))
+_saida_log.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+logger.addHandler(_saida_log)
+
+
+def gerar_valores(linhas: int) -> pd.Series:
+    """Gera valores em texto no formato brasileiro, com alguns inválidos."""
+    rng = np.random.default_rng(42)
+    valores = pd.Series(rng.gamma(2.0, 400.0, linhas)).map('{:,.2f}'.format)
+    texto = valores.str.replace(',', '_').str.replace('.', ',').str.replace('_', '.')
+
+    prefixo = rng.random(linhas) < 0.3
+    texto[prefixo] = 'R$ ' + texto[prefixo]
+    texto[rng.random(linhas) < FRACAO_INVALIDOS] = 'N/D'
+    return texto.astype(object)
+
+
+def limpar_valor_monetario(valor: Any) -> float:
+    """
+    Converte valor monetário brasileiro (1.234,56) para float.
+
+    Args:
+        valor: Valor a ser convertido (string ou numérico)
+
+    Returns:
+        Valor como float, ou 0.0 em caso de erro
+    """
+    if pd.isna(valor):
+        return 0.0
+
+    if isinstance(valor, (int, float)):
+        return float(valor)
+
+    if isinstance(valor, str):
+        try:
+            # Remove pontos de milhar e troca vírgula por ponto
+            valor_limpo = valor.strip().replace('.', '').replace(',', '.')
+            return float(valor_limpo)
+        except ValueError:
+            logger.warning(f"Não foi possível converter valor: '{valor}'")
+            return 0.0
+
+    return 0.0
+
+
+def comparar(texto: pd.Series, antigo: pd.Series, novo: pd.Series) -> None:
+    """Imprime quantas linhas diferem entre as conversões e por quê."""
+    diferentes = ~np.isclose(antigo.to_numpy(), novo.to_numpy())
+    com_rs = texto.str.contains('R$', regex=False).fillna(False).to_numpy(dtype=bool)
+    print(f"{'':<34} linhas diferentes: {int(diferentes.sum()):,}")
+    print(f"{'':<34}   com 'R$' (antigo = 0, novo = valor): {int((diferentes & com_rs).sum()):,}")
+    print(f"{'':<34}   outras: {int((diferentes & ~com_rs).sum()):,}")
+
+
+def medir(nome: str, funcao: Callable[[], pd.Series]) -> tuple[float, pd.Series]:
+    """Executa a conversão e imprime o tempo."""
+    inicio = time.perf_counter()
+    resultado = funcao()
+    tempo = time.perf_counter() - inicio
+    print(f"{nome:<34} {tempo:>8.3f}s")
+    return tempo, resultado
+
+
+def main() -> None:
+    linhas = int(sys.argv[1]) if len(sys.argv) > 1 else LINHAS_PADRAO
+
+    print(f"Gerando {linhas:,} valores sintéticos...")
+    texto = gerar_valores(linhas)
+    numerico = pd.Series(np.random.default_rng(7).gamma(2.0, 400.0, linhas))
+    print()
+
+    print(f"{'conversão':<34} {'tempo':>9}")
+    base, antigo = medir('apply(limpar_valor_monetario)', lambda: texto.apply(limpar_valor_monetario))
+    tempo, novo = medir('converter_valores_monetarios (texto)', lambda: converter_valores_monetarios(texto))
+    print(f"{'':<34} speedup {base / tempo:.1f}x")
+    comparar(texto, antigo, novo)
+
+    base, _ = medir('apply(...) (float64)', lambda: numerico.apply(limpar_valor_monetario))
+    tempo, _ = medir('converter_valores_monetarios (float64)', lambda: converter_valores_monetarios(numerico))
+    print(f"{'':<34} speedup {base / tempo:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
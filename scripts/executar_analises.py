@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+EXECUÇÃO DAS ANÁLISES EM UM ÚNICO PROCESSO
+Roda a Curva ABC (relatorio_teste.py) e a análise temporal multi-granularidade
+(analise_temporal_multi.py) compartilhando a mesma base preparada: o extrato é
+lido e limpo uma única vez por execução do workflow.
+
+Uso:
+    python executar_analises.py [arquivo_dados] [--diario] [--semanal] [--mensal] [--all]
+
+Uma falha em uma análise não impede a execução da outra. Cada `main()`
+retorna um código de saída; qualquer valor diferente de 0 (inclusive None)
+conta como falha.
+"""
+
+import logging
+import sys
+import time
+
+import analise_temporal_multi
+import relatorio_teste
+
+logger = logging.getLogger(__name__)
+
+
+def main() -> int:
+    """Executa as análises em sequência e retorna o código de saída."""
+    inicio = time.time()
+    falhas = []
+
+    analises = [
+        ("Curva ABC", relatorio_teste.main),
+        ("Temporal multi-granularidade", analise_temporal_multi.main),
+    ]
+
+    for nome, executar in analises:
+        logger.info(f"▶️  Análise: {nome}")
+        try:
+            codigo = executar()
+        except Exception as e:
+            logger.error(f"❌ Falha na análise {nome}: {e}")
+            falhas.append(nome)
+            continue
+        if codigo != 0:
+            logger.error(f"❌ Análise {nome} terminou com código {codigo}")
+            falhas.append(nome)
+
+    logger.info(f"⏱️  Análises concluídas em {time.time() - inicio:.1f}s")
+    if falhas:
+        logger.error(f"Análises com falha: {', '.join(falhas)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
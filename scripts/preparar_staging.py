@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+PREPARAÇÃO DO STAGING: CONVERTE O EXTRATO DE VENDAS PARA PARQUET
+Executado uma vez por workflow, antes das análises. Os scripts seguintes
+encontram o Parquet pelo hash do arquivo e pulam a leitura do Excel.
+
+Em seguida grava o cubo diário (loja × produto × dia) em arrays .npy, que
+as análises abrem via memory-map (ver vendas_core/cubo.py).
+
+Uso:
+    python preparar_staging.py [arquivo_dados] [--streaming] [--incremental]
+
+Com --streaming, o extrato é lido em lotes (XLSX em modo read-only, CSV em
+chunks) e gravado já agregado por (loja, produto, dia), com memória limitada
+ao número de chaves.
+
+Com --incremental, o Parquet não é gerado: o cubo da execução anterior é
+atualizado só com os dias a partir da marca d'água de dt_contabil, e as
+(loja, período) alteradas vão para .staging/<arquivo>.alteracoes.json
+(ver vendas_core/incremental.py).
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import sys
+import time
+
+import pandas as pd
+
+from vendas_core.colunas import COL_LOJA
+from vendas_core.cubo import caminho_cubo, obter_cubo
+from vendas_core.incremental import atualizar_incremental
+from vendas_core.leitura_csv import agregar_csv_em_blocos, ler_csv_vendas
+from vendas_core.staging import PYARROW_DISPONIVEL, caminho_staging, salvar_staging
+from vendas_core.streaming import agregar_xlsx_streaming
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+logger = logging.getLogger(__name__)
+
+ARGUMENTOS = [a for a in sys.argv[1:] if not a.startswith('--')]
+NOME_ARQUIVO = ARGUMENTOS[0] if ARGUMENTOS else "dados_vendas.xlsx"
+MODO_STREAMING = '--streaming' in sys.argv
+MODO_INCREMENTAL = '--incremental' in sys.argv
+
+
+def gerar_staging() -> bool:
+    """Lê o arquivo de dados e grava o staging Parquet."""
+    inicio = time.time()
+    extensao = NOME_ARQUIVO.lower().split('.')[-1]
+
+    if extensao == 'xlsx' and MODO_STREAMING:
+        df = agregar_xlsx_streaming(NOME_ARQUIVO)
+    elif extensao in ['xlsx', 'xls']:
+        df = pd.read_excel(NOME_ARQUIVO, engine='openpyxl', dtype={COL_LOJA: str})
+    elif MODO_STREAMING:
+        df = agregar_csv_em_blocos(NOME_ARQUIVO)
+    else:
+        df = ler_csv_vendas(NOME_ARQUIVO)
+
+    if df is None:
+        return False
+
+    logger.info(f"Arquivo lido em {time.time() - inicio:.1f}s - {len(df)} registros")
+    salvar_staging(NOME_ARQUIVO, df)
+
+    return caminho_staging(NOME_ARQUIVO).exists()
+
+
+def main() -> int:
+    """Gera o staging Parquet e o cubo diário do arquivo de dados, se ainda não existirem."""
+    if not os.path.exists(NOME_ARQUIVO):
+        logger.error(f"Arquivo não encontrado: {NOME_ARQUIVO}")
+        return 1
+
+    if not PYARROW_DISPONIVEL:
+        logger.error("pyarrow não instalado - instale as dependências do requirements.txt")
+        return 1
+
+    if MODO_INCREMENTAL:
+        return 0 if atualizar_incremental(NOME_ARQUIVO) is not None else 1
+
+    destino = caminho_staging(NOME_ARQUIVO)
+    if destino.exists():
+        logger.info(f"Staging já atualizado: {destino}")
+    elif not gerar_staging():
+        return 1
+
+    # Cubo diário (.npy) derivado do staging, aberto pelas análises via mmap
+    if caminho_cubo(NOME_ARQUIVO).exists():
+        logger.info(f"Cubo já atualizado: {caminho_cubo(NOME_ARQUIVO)}")
+        return 0
+
+    return 0 if obter_cubo(NOME_ARQUIVO) is not None else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,16 +10,27 @@ import logging
 import os
 import sys
 import json
-import time
-import random
 from typing import Any, Optional
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 import google.generativeai as genai
-from google.api_core import exceptions as google_exceptions
 from dotenv import load_dotenv
 
+from vendas_core.cache_ia import CacheIA, abrir_cache, assinatura_prompt, chave_resposta
+from vendas_core.cliente_ia import ConfigClienteIA, gerar_respostas
+from vendas_core.cubo import agregar_cubo, obter_cubo
+from vendas_core.fechados import chave_loja
+from vendas_core.ia import config_geracao, configurar_ia as configurar_modelo
+from vendas_core.impressoes import (
+    carregar_secoes_anteriores, impressoes_por_loja, reaproveitar_secao, salvar_impressoes
+)
+from vendas_core.lotes_ia import (
+    OrcamentoLote, estimar_tokens_item, estimar_tokens_texto, planejar_lotes, recuperar_array_json
+)
+from vendas_core.particoes import indexar_particoes
+
 # Carrega variáveis do arquivo .env
 load_dotenv()
 
@@ -40,195 +51,145 @@ logger = logging.getLogger(__name__)
 NOME_ARQUIVO = sys.argv[1] if len(sys.argv) > 1 else "dados_vendas.xlsx"
 PASTA_SAIDA = "docs/data"
 ARQUIVO_SAIDA = os.path.join(PASTA_SAIDA, "analise_abc_final.json")
-ARQUIVO_CACHE = os.path.join(PASTA_SAIDA, "cache_analises_ia.json")
-
-# Colunas esperadas do CSV
-COL_LOJA = 'FtoResumoVendaGeralItem[loja_id]'
-COL_PRODUTO = 'FtoResumoVendaGeralItem[material_descr]'
-COL_VALOR = 'FtoResumoVendaGeralItem[vl_total]'
-COL_DATA = 'FtoResumoVendaGeralItem[dt_contabil]'
+# Cache de análises por produto (SQLite fora do git). É só uma otimização: no CI ele
+# depende do actions/cache e pode sumir; sem ele as análises são pedidas de novo à IA
+ARQUIVO_CACHE = os.path.join(".staging", "cache_analises_ia.sqlite")
+TTL_CACHE_DIAS = 90          # análises mais antigas são refeitas
+MAX_ENTRADAS_CACHE = 50_000  # acima disso, remove as menos usadas (LRU)
 
 # Parâmetros da Curva ABC
 LIMITE_CLASSE_A = 80  # Percentual acumulado para classe A
 LIMITE_CLASSE_B = 95  # Percentual acumulado para classe B
+CLASSES_ABC = np.array(['A', 'B', 'C'], dtype=object)
+# Curvas ABC adicionais: últimos N meses (classe_3m, ...) e cada ano civil (classe_2024, ...)
+JANELAS_ABC_MESES = [3, 6, 12]
+VERSAO_SAIDA_ABC = 2  # incrementar quando o cálculo dos itens mudar (invalida seções reaproveitadas)
+
+# Indicadores enviados à IA no lugar do histórico mensal (ver calcular_indicadores_ia)
+MESES_RECENTES_IA = 3
+COLUNAS_INDICADORES_IA = ['participacao_pct', 'posicao', 'razao_recente', 'meses_ativos']
 
 # Parâmetros de processamento IA
-TAMANHO_LOTE_IA = 15
-PAUSA_ENTRE_LOTES = 2.0  # segundos entre lotes
+# Lotes empacotados por orçamento de tokens (ver vendas_core.lotes_ia)
+ORCAMENTO_LOTE_IA = OrcamentoLote(
+    tokens_prompt=6000,      # dados dos produtos por requisição
+    tokens_resposta=3000,    # margem abaixo do limite de saída do modelo (8192)
+    max_itens=60,            # mantém o array de resposta curto o bastante para não truncar
+)
+# Tokens da resposta por produto: a linha {"produto": ..., "analise": ...} sem o nome
+TOKENS_RESPOSTA_POR_ITEM = 30
+# Rodadas extras só com os produtos que ficaram sem análise válida (lotes com metade do tamanho)
+RODADAS_COMPLEMENTO_IA = 2
 MAX_TENTATIVAS_API = 5   # tentativas para erros gerais
 MAX_TENTATIVAS_RATE_LIMIT = 8  # tentativas extras para rate limit
 DELAY_BASE_RATE_LIMIT = 15  # segundos base para rate limit (reduzido para plano pago)
-DELAY_ENTRE_CHAMADAS = 12.0  # segundos entre cada chamada à API (plano pago tem rate limit maior)
+# Cota do modelo, compartilhada entre processos (sobrescrita por GEMINI_RPM / GEMINI_TPM /
+# GEMINI_RPD / GEMINI_CONCORRENCIA)
+LIMITE_RPM_IA = 30           # requisições por minuto
+LIMITE_TPM_IA = 1_000_000    # tokens por minuto
+LIMITE_RPD_IA = 0            # requisições por dia (0 = sem limite)
+CONCORRENCIA_IA = 4          # requisições simultâneas
+
+# Modelo Gemini (API Key lida de GEMINI_API_KEY - NUNCA commitar chaves no código!)
+MODELO_IA = "gemini-2.0-flash-lite"  # Modelo com rate limits mais altos
+TEMPERATURA_IA = 0.2
+CONFIG_CLIENTE_IA = ConfigClienteIA(
+    rpm=LIMITE_RPM_IA,
+    tpm=LIMITE_TPM_IA,
+    rpd=LIMITE_RPD_IA,
+    concorrencia=CONCORRENCIA_IA,
+    tentativas_api=MAX_TENTATIVAS_API,
+    tentativas_rate_limit=MAX_TENTATIVAS_RATE_LIMIT,
+    delay_base_rate_limit=DELAY_BASE_RATE_LIMIT,
+)
+VERSAO_PROMPT_IA = 2  # incrementar ao alterar o prompt (invalida seções e análises em cache)
+ASSINATURA_IA = assinatura_prompt('curva_abc', VERSAO_PROMPT_IA, MODELO_IA, config_geracao(TEMPERATURA_IA))
 
-# API Key - carrega de variável de ambiente (NUNCA commitar chaves no código!)
-API_KEY = os.environ.get('GEMINI_API_KEY', '')
+# Colunas que definem a entrada de cada loja (ver vendas_core.impressoes)
+COLUNAS_IMPRESSAO = ['mes_ano', 'produto', 'valor_limpo']
 
 # ==========================================
 # 2. FUNÇÕES AUXILIARES
 # ==========================================
 
-def limpar_valor_monetario(valor: Any) -> float:
-    """
-    Converte valor monetário brasileiro (1.234,56) para float.
-
-    Args:
-        valor: Valor a ser convertido (string ou numérico)
-
-    Returns:
-        Valor como float, ou 0.0 em caso de erro
+def classificar_abc(valor_acumulado: np.ndarray) -> np.ndarray:
     """
-    if pd.isna(valor):
-        return 0.0
-
-    if isinstance(valor, (int, float)):
-        return float(valor)
-
-    if isinstance(valor, str):
-        try:
-            # Remove pontos de milhar e troca vírgula por ponto
-            valor_limpo = valor.strip().replace('.', '').replace(',', '.')
-            return float(valor_limpo)
-        except ValueError:
-            logger.warning(f"Não foi possível converter valor: '{valor}'")
-            return 0.0
+    Classifica itens na curva ABC baseado no percentual acumulado.
 
-    return 0.0
-
-
-def classificar_abc(valor_acumulado: float) -> str:
-    """
-    Classifica item na curva ABC baseado no percentual acumulado.
+    Até LIMITE_CLASSE_A (inclusive) é 'A', até LIMITE_CLASSE_B é 'B', acima
+    disso 'C'; um único `searchsorted` nos limites classifica todos os itens.
 
     Args:
-        valor_acumulado: Percentual acumulado de vendas
+        valor_acumulado: Percentuais acumulados de vendas
 
     Returns:
-        Classe 'A', 'B' ou 'C'
+        Array com as classes 'A', 'B' ou 'C'
     """
-    if valor_acumulado <= LIMITE_CLASSE_A:
-        return 'A'
-    elif valor_acumulado <= LIMITE_CLASSE_B:
-        return 'B'
-    return 'C'
-
-
-def validar_colunas_csv(df: pd.DataFrame) -> bool:
-    """
-    Valida se o DataFrame contém todas as colunas necessárias.
-
-    Args:
-        df: DataFrame a ser validado
-
-    Returns:
-        True se válido, False caso contrário
-    """
-    colunas_requeridas = [COL_LOJA, COL_PRODUTO, COL_VALOR, COL_DATA]
-    colunas_faltantes = [col for col in colunas_requeridas if col not in df.columns]
-
-    if colunas_faltantes:
-        logger.error(f"Colunas faltantes no CSV: {colunas_faltantes}")
-        logger.info(f"Colunas disponíveis: {list(df.columns)}")
-        return False
-
-    return True
+    limites = np.array([LIMITE_CLASSE_A, LIMITE_CLASSE_B], dtype=float)
+    return CLASSES_ABC[np.searchsorted(limites, valor_acumulado, side='left')]
 
 
 # ==========================================
 # 2.5. FUNÇÕES DE CACHE
 # ==========================================
 
-def carregar_cache() -> dict:
+def carregar_cache() -> CacheIA:
     """
-    Carrega o cache de análises anteriores do arquivo JSON.
+    Abre o cache SQLite de análises (vazio se o arquivo não existir).
 
     Returns:
-        Dicionário com análises em cache: {loja_id: {produto: analise}}
+        Cache de análises por (loja, produto, classe)
     """
-    if not os.path.exists(ARQUIVO_CACHE):
-        logger.info("Nenhum cache encontrado. Iniciando cache vazio.")
-        return {}
-
-    try:
-        with open(ARQUIVO_CACHE, 'r', encoding='utf-8') as f:
-            cache = json.load(f)
-        logger.info(f"Cache carregado: {sum(len(v) for v in cache.values())} análises de {len(cache)} lojas")
-        return cache
-    except (json.JSONDecodeError, IOError) as e:
-        logger.warning(f"Erro ao carregar cache: {e}. Iniciando cache vazio.")
-        return {}
+    cache = abrir_cache(ARQUIVO_CACHE, TTL_CACHE_DIAS, MAX_ENTRADAS_CACHE)
+    logger.info(f"Cache carregado: {len(cache)} análises")
+    return cache
 
 
-def salvar_cache(cache: dict) -> bool:
+def gerar_chave_produto(id_loja: Any, produto: str, classe: str) -> str:
     """
-    Salva o cache de análises no arquivo JSON.
-
-    Args:
-        cache: Dicionário com análises
-
-    Returns:
-        True se salvou com sucesso
-    """
-    try:
-        Path(ARQUIVO_CACHE).parent.mkdir(parents=True, exist_ok=True)
-        with open(ARQUIVO_CACHE, 'w', encoding='utf-8') as f:
-            json.dump(cache, f, ensure_ascii=False, indent=2)
-        logger.info(f"Cache salvo: {sum(len(v) for v in cache.values())} análises")
-        return True
-    except IOError as e:
-        logger.error(f"Erro ao salvar cache: {e}")
-        return False
-
-
-def gerar_chave_produto(produto: str, classe: str) -> str:
-    """
-    Gera uma chave única para o produto no cache.
-    A chave inclui a classe ABC para re-analisar se a classificação mudar.
+    Gera a chave do produto no cache.
+    A chave inclui a classe ABC para re-analisar se a classificação mudar,
+    e o modelo e a versão do prompt (ver `ASSINATURA_IA`).
 
     Args:
+        id_loja: ID da loja
         produto: Nome do produto
         classe: Classificação ABC (A, B ou C)
 
     Returns:
         Chave única para o cache
     """
-    return f"{produto}|{classe}"
+    return chave_resposta(ASSINATURA_IA, {"loja": str(id_loja), "produto": produto, "classe": classe})
 
 
-def obter_analise_cache(cache: dict, id_loja: str, produto: str, classe: str) -> Optional[str]:
+def obter_analise_cache(cache: CacheIA, id_loja: str, produto: str, classe: str) -> Optional[str]:
     """
     Busca análise no cache.
 
     Args:
-        cache: Dicionário de cache
+        cache: Cache de análises
         id_loja: ID da loja
         produto: Nome do produto
         classe: Classificação ABC
 
     Returns:
-        Análise do cache ou None se não encontrada
+        Análise do cache ou None se não encontrada (ou expirada)
     """
-    loja_cache = cache.get(str(id_loja), {})
-    chave = gerar_chave_produto(produto, classe)
-    return loja_cache.get(chave)
+    return cache.obter(gerar_chave_produto(id_loja, produto, classe))
 
 
-def adicionar_ao_cache(cache: dict, id_loja: str, produto: str, classe: str, analise: str) -> None:
+def adicionar_ao_cache(cache: CacheIA, id_loja: str, produto: str, classe: str, analise: str) -> None:
     """
-    Adiciona uma análise ao cache.
+    Adiciona uma análise ao cache (gravada imediatamente).
 
     Args:
-        cache: Dicionário de cache
+        cache: Cache de análises
         id_loja: ID da loja
         produto: Nome do produto
         classe: Classificação ABC
         analise: Texto da análise
     """
-    id_loja_str = str(id_loja)
-    if id_loja_str not in cache:
-        cache[id_loja_str] = {}
-
-    chave = gerar_chave_produto(produto, classe)
-    cache[id_loja_str][chave] = analise
+    cache.gravar(gerar_chave_produto(id_loja, produto, classe), analise)
 
 
 # ==========================================
@@ -242,55 +203,20 @@ def configurar_ia() -> Optional[genai.GenerativeModel]:
     Returns:
         Modelo configurado ou None se não disponível
     """
-    if not API_KEY:
-        logger.warning("API Key não configurada. Análise IA será pulada.")
-        return None
-
-    try:
-        genai.configure(api_key=API_KEY)
-        modelo = genai.GenerativeModel(
-            model_name="gemini-2.0-flash-lite",  # Modelo com rate limits mais altos
-            generation_config={
-                "temperature": 0.2,
-                "response_mime_type": "application/json"
-            }
-        )
-        logger.info("Modelo Gemini 2.0 Flash Lite configurado com sucesso")
-        return modelo
-    except Exception as e:
-        logger.error(f"Erro ao configurar modelo Gemini: {e}")
-        return None
+    return configurar_modelo(MODELO_IA, TEMPERATURA_IA)
 
 
-def analisar_lote_ia_robusto(
-    modelo: genai.GenerativeModel,
-    id_loja: Any,
-    lote_itens: list[dict],
-    tentativas_max: int = MAX_TENTATIVAS_API
-) -> list[dict]:
+def construir_prompt_lote(id_loja: Any, lote_itens: list[dict]) -> str:
     """
-    Envia lote de itens para análise IA com sistema de retentativa robusto.
-
-    Implementa exponential backoff para lidar com erros temporários
-    como RemoteDisconnected, Timeout, rate limiting, etc.
-
-    Para rate limit (429), usa delays maiores e mais tentativas.
+    Monta o prompt de análise de um lote de produtos da loja.
 
     Args:
-        modelo: Modelo Gemini configurado
         id_loja: Identificador da loja
-        lote_itens: Lista de itens para análise
-        tentativas_max: Número máximo de tentativas
+        lote_itens: Itens do lote (produto, classe e indicadores)
 
     Returns:
-        Lista de análises ou lista vazia em caso de falha
+        Prompt pronto para o Gemini
     """
-    if not modelo:
-        return []
-
-    if not lote_itens:
-        return []
-
     prompt = f"""# ANÁLISE DE PRODUTOS - CURVA ABC
 
 Analise cada produto da Loja {id_loja} individualmente.
@@ -304,6 +230,12 @@ Analise cada produto da Loja {id_loja} individualmente.
 ## DADOS:
 {json.dumps(lote_itens, ensure_ascii=False)}
 
+Campos de cada produto:
+- participacao_pct: % do faturamento da loja
+- posicao: posição no ranking de vendas da loja (1 = mais vendido)
+- razao_recente: média mensal dos últimos {MESES_RECENTES_IA} meses ÷ média mensal desde a primeira venda
+- meses_ativos: meses com vendas
+
 ## FORMATO DE RESPOSTA (JSON):
 Retorne EXATAMENTE um array JSON:
 [
@@ -315,284 +247,283 @@ Retorne EXATAMENTE um array JSON:
 {{"produto": "SOPA", "analise": "Baixa procura - promover ou reduzir preparo"}}
 """
 
-    tentativas_rate_limit = 0  # Contador separado para rate limit
-    tentativa = 0
+    return prompt
 
-    while tentativa < tentativas_max or tentativas_rate_limit < MAX_TENTATIVAS_RATE_LIMIT:
-        tentativa += 1
-        try:
-            # Pausa entre chamadas para evitar rate limit
-            time.sleep(DELAY_ENTRE_CHAMADAS)
 
-            resposta = modelo.generate_content(prompt)
+def analisar_lotes_ia(
+    modelo: genai.GenerativeModel,
+    id_loja: Any,
+    lotes: list[list[dict]]
+) -> list[list[dict]]:
+    """
+    Envia todos os lotes de uma loja para análise IA em paralelo.
 
-            # Valida se há resposta
-            if not resposta or not resposta.text:
-                logger.warning(f"Resposta vazia da IA na tentativa {tentativa}")
-                continue
+    O ritmo das chamadas é dado pela cota do modelo (token bucket de RPM/TPM
+    e concorrência limitada, ver `vendas_core.cliente_ia`), com retentativa
+    para rate limit e erros de conexão. De uma resposta truncada ou com
+    elementos malformados, os objetos completos são aproveitados.
 
-            # Parse e validação do JSON
-            resultado = json.loads(resposta.text)
+    Args:
+        modelo: Modelo Gemini configurado
+        id_loja: Identificador da loja
+        lotes: Lotes de itens para análise
+
+    Returns:
+        Uma lista de análises por lote (vazia em caso de falha)
+    """
+    if not modelo or not lotes:
+        return [[] for _ in lotes]
 
-            # Valida estrutura da resposta
-            if not isinstance(resultado, list):
-                logger.warning(f"Resposta IA não é lista: {type(resultado)}")
-                return []
+    respostas = gerar_respostas(
+        modelo,
+        [construir_prompt_lote(id_loja, lote) for lote in lotes],
+        CONFIG_CLIENTE_IA,
+        rotulos=[f"loja {id_loja}, lote {i}/{len(lotes)}" for i in range(1, len(lotes) + 1)],
+        interpretar=recuperar_array_json,
+    )
 
-            return resultado
+    resultados = []
+    for resposta in respostas:
+        # Valida estrutura da resposta
+        if resposta is not None and not isinstance(resposta, list):
+            logger.warning(f"Resposta IA não é lista: {type(resposta)}")
+        resultados.append(resposta if isinstance(resposta, list) else [])
+    return resultados
 
-        except json.JSONDecodeError as e:
-            logger.warning(f"Erro ao parsear JSON da IA: {e}")
-            return []
 
-        except google_exceptions.ResourceExhausted as e:
-            tentativas_rate_limit += 1
-            # Delay progressivo: 30s, 60s, 90s, 120s... (mais agressivo para rate limit)
-            tempo_espera = DELAY_BASE_RATE_LIMIT * tentativas_rate_limit + random.uniform(0, 5)
-            logger.warning(
-                f"⚠️ Rate limit atingido! Tentativa {tentativas_rate_limit}/{MAX_TENTATIVAS_RATE_LIMIT}. "
-                f"Aguardando {tempo_espera:.0f}s..."
-            )
-            time.sleep(tempo_espera)
+# ==========================================
+# 4. FUNÇÕES DE PROCESSAMENTO DE DADOS
+# ==========================================
 
-            if tentativas_rate_limit >= MAX_TENTATIVAS_RATE_LIMIT:
-                logger.error("❌ Rate limit persistente. Pulando este lote.")
-                return []
+def gerar_historico_vendas(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Monta a matriz (loja, produto) × mês e os totais de vendas por produto/loja.
 
-            # Não incrementa tentativa normal para rate limit
-            tentativa -= 1
-            continue
+    O histórico é um único pivot; o total de cada produto é a soma da sua
+    linha na matriz. Os dicionários de histórico só são montados ao
+    serializar cada loja (ver `serializar_historicos`).
 
-        except (google_exceptions.ServiceUnavailable,
-                google_exceptions.DeadlineExceeded,
-                ConnectionError) as e:
-            tempo_espera = (2 ** tentativa) + random.uniform(0, 1)
-            logger.warning(f"Erro de conexão na tentativa {tentativa}/{tentativas_max}: {e}")
+    Args:
+        df: Vendas mensais (loja_id, mes_ano, produto, valor_limpo)
 
-            if tentativa < tentativas_max:
-                logger.info(f"Tentando novamente em {tempo_espera:.1f}s...")
-                time.sleep(tempo_espera)
-            else:
-                logger.error("Falha definitiva neste lote após todas as tentativas.")
-                return []
+    Returns:
+        Tupla (totais, matriz): totais com loja_id, produto e total_vendas;
+        matriz com um mês por coluna (NaN = sem vendas), linha i ↔ totais.iloc[i]
+    """
+    logger.info("Gerando histórico de vendas...")
 
-        except Exception as e:
-            logger.error(f"Erro inesperado na análise IA: {type(e).__name__}: {e}")
-            return []
+    matriz = df.pivot(index=['loja_id', 'produto'], columns='mes_ano', values='valor_limpo')
 
-    return []
+    df_final = matriz.index.to_frame(index=False)
+    df_final['total_vendas'] = matriz.sum(axis=1).to_numpy()
+
+    logger.info(f"Histórico gerado: {len(df_final)} produtos únicos")
+    return df_final, matriz.reset_index(drop=True)
 
-# ==========================================
-# 4. FUNÇÕES DE PROCESSAMENTO DE DADOS
-# ==========================================
 
-def carregar_dados(caminho: str) -> Optional[pd.DataFrame]:
+def serializar_historicos(linhas: np.ndarray, meses: list[str]) -> list[dict]:
     """
-    Carrega arquivo de dados (CSV ou XLSX) com tratamento automático de formato.
+    Converte linhas da matriz de histórico em dicionários {mes: valor}.
 
     Args:
-        caminho: Caminho para o arquivo de dados (CSV ou XLSX)
+        linhas: Linhas da matriz (produtos × meses), NaN = sem vendas
+        meses: Rótulos das colunas da matriz
 
     Returns:
-        DataFrame carregado ou None em caso de erro
-    """
-    if not os.path.exists(caminho):
-        logger.error(f"Arquivo não encontrado: {caminho}")
-        return None
-
-    # Detecta formato pelo extensão
-    extensao = caminho.lower().split('.')[-1]
-
-    # Arquivos Excel (.xlsx)
-    if extensao in ['xlsx', 'xls']:
-        try:
-            df = pd.read_excel(
-                caminho,
-                engine='openpyxl',
-                dtype={COL_LOJA: str}  # Preserva ID como string
-            )
-            logger.info(f"Arquivo Excel carregado com sucesso")
-            logger.info(f"Total de registros: {len(df)}")
-            return df
-        except Exception as e:
-            logger.error(f"Erro ao carregar Excel: {e}")
-            return None
-
-    # Arquivos CSV
-    encodings = ['latin1', 'utf-8', 'cp1252', 'iso-8859-1']
-
-    for encoding in encodings:
-        try:
-            df = pd.read_csv(
-                caminho,
-                sep=';',
-                encoding=encoding,
-                on_bad_lines='skip',
-                dtype={COL_LOJA: str}  # Preserva ID como string
-            )
-            logger.info(f"CSV carregado com sucesso (encoding: {encoding})")
-            logger.info(f"Total de registros: {len(df)}")
-            return df
-        except UnicodeDecodeError:
-            continue
-        except Exception as e:
-            logger.error(f"Erro ao carregar CSV com {encoding}: {e}")
-            continue
-
-    logger.error("Não foi possível carregar o arquivo com nenhum formato suportado")
-    return None
+        Um dicionário por linha, apenas com os meses com vendas
+    """
+    arredondadas = np.round(linhas, 2)
+    com_vendas = ~np.isnan(linhas)
+    return [
+        {mes: valor for mes, valor, ok in zip(meses, linha, mascara) if ok}
+        for linha, mascara in zip(arredondadas, com_vendas)
+    ]
 
 
-def preparar_dados(df: pd.DataFrame) -> Optional[pd.DataFrame]:
+def calcular_curva_abc(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Limpa e prepara os dados para análise ABC.
+    Calcula a curva ABC de todas as lojas em uma única passada vetorizada.
+
+    Ordena por (loja, vendas desc), calcula a participação acumulada de cada
+    produto dentro da sua loja e classifica contra os limites A/B. O custo é
+    O(N log N) independente do número de lojas.
 
     Args:
-        df: DataFrame bruto do CSV
+        df: Totais por produto/loja (loja_id, produto, total_vendas)
 
     Returns:
-        DataFrame preparado ou None em caso de erro
+        DataFrame ordenado com percentual, acumulado e classe
+        (o índice original é preservado)
     """
-    # Validação de colunas
-    if not validar_colunas_csv(df):
-        return None
+    df = df.sort_values(['loja_id', 'total_vendas'], ascending=[True, False], kind='stable')
 
-    # Cria cópia para não modificar original
-    df = df.copy()
+    total_loja = df.groupby('loja_id', observed=True)['total_vendas'].transform('sum')
+    percentual = df['total_vendas'] / total_loja * 100
 
-    # Converte valores monetários
-    df['valor_limpo'] = df[COL_VALOR].apply(limpar_valor_monetario)
+    df = df.assign(percentual=percentual)
+    df['acumulado'] = df.groupby('loja_id', observed=True)['percentual'].cumsum()
+    df['classe'] = classificar_abc(df['acumulado'].to_numpy())
 
-    # Remove registros com valor zero ou negativo
-    registros_antes = len(df)
-    df = df[df['valor_limpo'] > 0]
-    registros_removidos = registros_antes - len(df)
+    return df
 
-    if registros_removidos > 0:
-        logger.info(f"Removidos {registros_removidos} registros com valor <= 0")
 
-    # Tratamento de data
-    df['data_obj'] = pd.to_datetime(
-        df[COL_DATA],
-        dayfirst=True,
-        errors='coerce'
-    )
+def calcular_totais_janelas(matriz: pd.DataFrame) -> dict[str, np.ndarray]:
+    """
+    Calcula o total de cada produto nas janelas móveis e em cada ano civil.
 
-    # Verifica datas inválidas
-    datas_invalidas = df['data_obj'].isna().sum()
-    if datas_invalidas > 0:
-        logger.warning(f"Encontradas {datas_invalidas} datas inválidas")
-
-    # Cria período mês/ano
-    df['mes_ano'] = df['data_obj'].dt.to_period('M').astype(str)
-    df = df.dropna(subset=['mes_ano'])
-
-    # Padroniza nomes de produtos
-    df[COL_PRODUTO] = (
-        df[COL_PRODUTO]
-        .astype(str)
-        .str.strip()
-        .str.upper()
-        .str.replace(r'\s+', ' ', regex=True)  # Remove espaços múltiplos
-    )
+    Uma soma prefixada sobre os meses da matriz é calculada uma única vez; o
+    total de qualquer janela é a diferença entre duas colunas dela. As janelas
+    são em meses de calendário, terminando no último mês com vendas.
 
-    # Remove produtos vazios ou inválidos
-    df = df[df[COL_PRODUTO].notna() & (df[COL_PRODUTO] != '') & (df[COL_PRODUTO] != 'NAN')]
+    Args:
+        matriz: Matriz (loja, produto) × mês de `gerar_historico_vendas`
 
-    logger.info(f"Dados preparados: {len(df)} registros válidos")
-    return df
+    Returns:
+        Dicionário {sufixo: totais}, ex.: {'3m': ..., '12m': ..., '2024': ...},
+        um valor por linha da matriz
+    """
+    meses = pd.PeriodIndex([str(mes) for mes in matriz.columns], freq='M')
+    ordinais = (meses.year * 12 + meses.month - 1).to_numpy()
+    ordem = np.argsort(ordinais, kind='stable')
+    ordinais = ordinais[ordem]
+
+    valores = np.nan_to_num(matriz.to_numpy(dtype=np.float64)[:, ordem])
+    prefixo = np.zeros((len(valores), len(ordinais) + 1))
+    np.cumsum(valores, axis=1, out=prefixo[:, 1:])
+
+    def total_entre(inicio: int, fim: int) -> np.ndarray:
+        """Soma dos meses com ordinal em [inicio, fim)."""
+        a, b = np.searchsorted(ordinais, [inicio, fim], side='left')
+        return prefixo[:, b] - prefixo[:, a]
 
+    ultimo = int(ordinais[-1])
+    totais = {f"{n}m": total_entre(ultimo - n + 1, ultimo + 1) for n in JANELAS_ABC_MESES}
+    for ano in sorted(set(meses.year)):
+        totais[str(ano)] = total_entre(ano * 12, (ano + 1) * 12)
+    return totais
 
-def gerar_historico_vendas(df: pd.DataFrame) -> pd.DataFrame:
+
+def calcular_classes_janelas(df_totais: pd.DataFrame, matriz: pd.DataFrame) -> pd.DataFrame:
     """
-    Gera histórico de vendas mensais agrupado por loja e produto.
+    Classifica cada produto na curva ABC de cada janela (ver `calcular_totais_janelas`).
+
+    Produtos sem vendas na janela ficam sem classe (None), em vez de 'C'
+    (o que também cobre lojas inteiras sem vendas na janela).
 
     Args:
-        df: DataFrame preparado
+        df_totais: Totais de `gerar_historico_vendas` (linha i ↔ linha i da matriz)
+        matriz: Matriz (loja, produto) × mês
 
     Returns:
-        DataFrame com totais e histórico por produto/loja
+        DataFrame com uma coluna classe_<janela> por janela, mesmo índice de df_totais
     """
-    logger.info("Gerando histórico de vendas...")
+    classes = {}
+    for sufixo, totais in calcular_totais_janelas(matriz).items():
+        curva = calcular_curva_abc(df_totais.assign(total_vendas=totais))
+        # object: em colunas de texto o None viraria NaN (inválido no JSON)
+        classes[f"classe_{sufixo}"] = curva['classe'].astype(object).mask(curva['total_vendas'] <= 0, None)
 
-    # Agrupa vendas por mês
-    historico_mensal = (
-        df.groupby([COL_LOJA, COL_PRODUTO, 'mes_ano'])['valor_limpo']
-        .sum()
-        .reset_index()
-    )
+    return pd.DataFrame(classes).reindex(df_totais.index)
 
-    # Cria dicionário de histórico para cada produto
-    def criar_dict_historico(grupo: pd.DataFrame) -> dict:
-        return dict(zip(grupo['mes_ano'], grupo['valor_limpo'].round(2)))
 
-    df_historico = (
-        historico_mensal
-        .groupby([COL_LOJA, COL_PRODUTO], group_keys=False)
-        .apply(criar_dict_historico, include_groups=False)
-        .reset_index(name='historico_vendas')
-    )
+def calcular_indicadores_ia(df_curva: pd.DataFrame, matriz: pd.DataFrame) -> pd.DataFrame:
+    """
+    Resume o histórico de cada produto em poucos indicadores para o prompt da IA.
 
-    # Calcula total de vendas por produto
-    df_total = (
-        df.groupby([COL_LOJA, COL_PRODUTO])['valor_limpo']
-        .sum()
-        .reset_index(name='total_vendas')
-    )
+    Calculado de uma vez sobre a matriz inteira. A média recente usa os
+    últimos MESES_RECENTES_IA meses do extrato, e a média geral usa os meses
+    desde a primeira venda do produto. Assim, produtos novos não parecem em
+    queda.
 
-    # Merge histórico com totais
-    df_final = pd.merge(df_total, df_historico, on=[COL_LOJA, COL_PRODUTO])
+    Args:
+        df_curva: Curva ABC de `calcular_curva_abc` (ordenada por loja e vendas,
+            índice = linha na matriz)
+        matriz: Matriz (loja, produto) × mês de `gerar_historico_vendas`
 
-    logger.info(f"Histórico gerado: {len(df_final)} produtos únicos")
-    return df_final
+    Returns:
+        DataFrame com COLUNAS_INDICADORES_IA, mesmo índice de df_curva
+        (razao_recente NaN se o produto não tem vendas positivas)
+    """
+    meses = pd.PeriodIndex([str(mes) for mes in matriz.columns], freq='M')
+    ordinais = (meses.year * 12 + meses.month - 1).to_numpy()
+    ordem = np.argsort(ordinais, kind='stable')
+    ordinais = ordinais[ordem]
+    ultimo = int(ordinais[-1])
+
+    valores = matriz.to_numpy(dtype=np.float64)[df_curva.index.to_numpy()][:, ordem]
+    com_vendas = ~np.isnan(valores)
+    valores = np.nan_to_num(valores)
+
+    # Meses de calendário desde a primeira venda até o último mês do extrato
+    primeiro = ordinais[com_vendas.argmax(axis=1)]
+    vida = np.where(com_vendas.any(axis=1), ultimo - primeiro + 1, 0)
+
+    recentes = ordinais > ultimo - MESES_RECENTES_IA
+    total = valores.sum(axis=1)
+    total_recente = valores[:, recentes].sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        media_geral = total / vida
+        media_recente = total_recente / np.minimum(vida, MESES_RECENTES_IA)
+        razao = np.where(media_geral > 0, media_recente / media_geral, np.nan)
+
+    return pd.DataFrame({
+        'participacao_pct': df_curva['percentual'].round(2),
+        'posicao': df_curva.groupby('loja_id', observed=True).cumcount() + 1,
+        'razao_recente': np.round(razao, 2),
+        'meses_ativos': com_vendas.sum(axis=1),
+    }, index=df_curva.index)
 
 
 def processar_loja(
     df_loja: pd.DataFrame,
     id_loja: str,
     modelo: Optional[genai.GenerativeModel],
-    cache: dict
+    cache: CacheIA,
+    matriz: pd.DataFrame
 ) -> dict:
     """
-    Processa dados de uma loja individual: curva ABC e análise IA.
+    Processa dados de uma loja individual: itens da curva ABC e análise IA.
 
     Args:
-        df_loja: DataFrame com dados da loja
+        df_loja: Curva ABC da loja, já ordenada (índice = linha na matriz de histórico),
+            com as colunas classe_<janela> e COLUNAS_INDICADORES_IA
         id_loja: Identificador da loja
         modelo: Modelo Gemini ou None
-        cache: Dicionário de cache com análises anteriores
+        cache: Cache de análises anteriores
+        matriz: Matriz (loja, produto) × mês de `gerar_historico_vendas`
 
     Returns:
         Dicionário com dados processados da loja
     """
-    # Ordena por vendas (maior para menor)
-    df_loja = df_loja.sort_values(by='total_vendas', ascending=False).copy()
-
-    # Calcula curva ABC
-    total_vendas = df_loja['total_vendas'].sum()
-
-    if total_vendas == 0:
+    if df_loja['total_vendas'].sum() == 0:
         logger.warning(f"Loja {id_loja} sem vendas válidas")
         return {"id_loja": id_loja, "itens": []}
 
-    df_loja['percentual'] = (df_loja['total_vendas'] / total_vendas * 100)
-    df_loja['acumulado'] = df_loja['percentual'].cumsum()
-    df_loja['classe'] = df_loja['acumulado'].apply(classificar_abc)
-
-    # Monta lista de itens (usando to_dict para melhor performance)
-    itens_loja = df_loja.apply(
-        lambda row: {
-            "produto": row[COL_PRODUTO],
-            "valor_total": round(row['total_vendas'], 2),
-            "classe": row['classe'],
-            "historico": row['historico_vendas']
-        },
-        axis=1
-    ).tolist()
-
-    # Análise IA com lotes (usando cache)
+    # Monta lista de itens; o histórico sai das linhas da matriz só aqui
+    historicos = serializar_historicos(
+        matriz.to_numpy()[df_loja.index.to_numpy()],
+        [str(mes) for mes in matriz.columns]
+    )
+    colunas_janelas = [coluna for coluna in df_loja.columns if coluna.startswith('classe_')]
+    itens_loja = [
+        {
+            "produto": produto,
+            "valor_total": round(total, 2),
+            "classe": classe,
+            **classes_janelas,
+            "historico": historico
+        }
+        for produto, total, classe, classes_janelas, historico in zip(
+            df_loja['produto'], df_loja['total_vendas'], df_loja['classe'],
+            df_loja[colunas_janelas].to_dict('records'), historicos
+        )
+    ]
+
+    # Análise IA com lotes (usando cache), a partir dos indicadores e não do histórico
     if modelo:
-        itens_loja = processar_analise_ia(modelo, id_loja, itens_loja, cache)
+        indicadores = df_loja[COLUNAS_INDICADORES_IA]
+        indicadores = indicadores.astype(object).where(indicadores.notna(), None).to_dict('records')
+        itens_loja = processar_analise_ia(modelo, id_loja, itens_loja, indicadores, cache)
 
     # Converte ID para int se possível, senão mantém string
     try:
@@ -603,21 +534,47 @@ def processar_loja(
     return {"id_loja": id_loja_final, "itens": itens_loja}
 
 
+def validar_analises_lote(lote: list[dict], resposta: list) -> dict[str, str]:
+    """
+    Análises válidas da resposta de um lote.
+
+    Args:
+        lote: Itens enviados (com 'produto')
+        resposta: Objetos devolvidos pela IA
+
+    Returns:
+        {produto: análise}, só de produtos do lote e com texto não vazio
+    """
+    pedidos = {item['produto'] for item in lote}
+    return {
+        objeto['produto']: objeto['analise'].strip()
+        for objeto in resposta
+        if isinstance(objeto, dict)
+        and objeto.get('produto') in pedidos
+        and isinstance(objeto.get('analise'), str)
+        and objeto['analise'].strip()
+    }
+
+
 def processar_analise_ia(
     modelo: genai.GenerativeModel,
     id_loja: str,
     itens: list[dict],
-    cache: dict
+    indicadores: list[dict],
+    cache: CacheIA
 ) -> list[dict]:
     """
     Processa análise IA em lotes para todos os itens de uma loja.
-    Usa cache para evitar chamadas duplicadas à API Gemini.
+    Usa cache para evitar chamadas duplicadas à API Gemini. Produtos ausentes
+    ou inválidos na resposta do lote são pedidos de novo, só eles, em até
+    RODADAS_COMPLEMENTO_IA rodadas com lotes menores.
 
     Args:
         modelo: Modelo Gemini configurado
         id_loja: Identificador da loja
         itens: Lista de itens para análise
-        cache: Dicionário de cache com análises anteriores
+        indicadores: Indicadores de cada item (ver `calcular_indicadores_ia`), mesma ordem
+        cache: Cache de análises anteriores
 
     Returns:
         Lista de itens com análise IA adicionada
@@ -625,15 +582,17 @@ def processar_analise_ia(
     analises_finais = []
     itens_novos = []  # Itens que precisam de análise IA
     itens_cache = []  # Itens que já têm análise em cache
+    dados_ia = []     # Dados mínimos para IA de cada item novo
 
     # Separa itens em cache e novos
-    for item in itens:
+    for item, indicadores_item in zip(itens, indicadores):
         analise_cache = obter_analise_cache(cache, id_loja, item['produto'], item['classe'])
         if analise_cache:
             item['analise_ia'] = analise_cache
             itens_cache.append(item)
         else:
             itens_novos.append(item)
+            dados_ia.append({'produto': item['produto'], 'classe': item['classe'], **indicadores_item})
 
     logger.info(f"  📦 Cache: {len(itens_cache)} produtos | 🆕 Novos: {len(itens_novos)} produtos")
 
@@ -645,48 +604,51 @@ def processar_analise_ia(
         logger.info(f"  ✅ Todos os produtos já estavam em cache!")
         return analises_finais
 
-    # Processa apenas os itens novos em lotes
-    total_lotes = (len(itens_novos) + TAMANHO_LOTE_IA - 1) // TAMANHO_LOTE_IA
-
-    for i, k in enumerate(range(0, len(itens_novos), TAMANHO_LOTE_IA)):
-        lote = itens_novos[k:k + TAMANHO_LOTE_IA]
-
-        logger.info(f"  Processando lote {i + 1}/{total_lotes} ({len(lote)} itens novos)")
+    # Processa apenas os itens novos, empacotados no menor número de lotes que
+    # cabem no orçamento de tokens, com todos os lotes da loja enviados em paralelo
+    custos_prompt = [estimar_tokens_item(dados) for dados in dados_ia]
+    custos_resposta = [estimar_tokens_texto(item['produto']) + TOKENS_RESPOSTA_POR_ITEM for item in itens_novos]
+    analises: dict[str, str] = {}
+    pendentes = list(range(len(itens_novos)))
+
+    for rodada in range(RODADAS_COMPLEMENTO_IA + 1):
+        orcamento = ORCAMENTO_LOTE_IA._replace(max_itens=max(1, ORCAMENTO_LOTE_IA.max_itens >> rodada))
+        lotes = planejar_lotes(
+            pendentes,
+            [custos_prompt[i] for i in pendentes],
+            [custos_resposta[i] for i in pendentes],
+            orcamento,
+        )
+        if rodada == 0:
+            logger.info(
+                f"  Processando {len(lotes)} lotes ({len(itens_novos)} itens novos, "
+                f"{min(map(len, lotes))}-{max(map(len, lotes))} por lote)"
+            )
+        else:
+            logger.info(f"  🔁 Reenviando {len(pendentes)} produtos sem análise válida em {len(lotes)} lotes")
 
-        # Prepara dados mínimos para IA
-        lote_ia = [
-            {
-                'produto': item['produto'],
-                'classe': item['classe'],
-                'historico': item['historico']
-            }
-            for item in lote
-        ]
+        # Chamadas à IA no ritmo da cota, com retentativa
+        lotes_ia = [[dados_ia[i] for i in lote] for lote in lotes]
+        for lote_ia, resultado_ia in zip(lotes_ia, analisar_lotes_ia(modelo, id_loja, lotes_ia)):
+            analises.update(validar_analises_lote(lote_ia, resultado_ia))
 
-        # Chamada à IA com retentativa
-        resultado_ia = analisar_lote_ia_robusto(modelo, id_loja, lote_ia)
+        pendentes = [i for i in pendentes if itens_novos[i]['produto'] not in analises]
+        if not pendentes:
+            break
 
-        # Mapeia resultados
-        dict_analises = {
-            item.get('produto', ''): item.get('analise', '')
-            for item in resultado_ia
-            if isinstance(item, dict)
-        }
+    if pendentes:
+        logger.warning(f"  ⚠️ {len(pendentes)} produtos ficaram sem análise após {RODADAS_COMPLEMENTO_IA} reenvios")
 
-        # Adiciona análise a cada item e atualiza cache
-        for item in lote:
-            analise = dict_analises.get(item['produto'], "Análise indisponível")
-            item['analise_ia'] = analise
+    # Adiciona análise a cada item (na ordem original) e atualiza cache
+    for item in itens_novos:
+        analise = analises.get(item['produto'], "Análise indisponível")
+        item['analise_ia'] = analise
 
-            # Adiciona ao cache (exceto análises indisponíveis)
-            if analise != "Análise indisponível":
-                adicionar_ao_cache(cache, id_loja, item['produto'], item['classe'], analise)
+        # Adiciona ao cache (exceto análises indisponíveis)
+        if analise != "Análise indisponível":
+            adicionar_ao_cache(cache, id_loja, item['produto'], item['classe'], analise)
 
-            analises_finais.append(item)
-
-        # Pausa entre lotes para evitar rate limiting
-        if k + TAMANHO_LOTE_IA < len(itens_novos):
-            time.sleep(PAUSA_ENTRE_LOTES)
+        analises_finais.append(item)
 
     return analises_finais
 
@@ -727,26 +689,32 @@ def salvar_resultado(resultado: list[dict], caminho: str) -> bool:
 # 5. FUNÇÃO PRINCIPAL
 # ==========================================
 
-def main() -> None:
+def main() -> int:
     """
     Função principal: orquestra o processamento completo.
+
+    Returns:
+        Código de saída (0 = sucesso, 1 = falha ao carregar os dados ou salvar o resultado)
     """
     logger.info("=" * 50)
     logger.info("INICIANDO ANÁLISE CURVA ABC COM IA")
     logger.info("=" * 50)
 
-    # 1. Carregar dados
-    df = carregar_dados(NOME_ARQUIVO)
-    if df is None:
-        return
-
-    # 2. Preparar dados
-    df = preparar_dados(df)
-    if df is None:
-        return
+    # 1-2. Abrir o cubo diário e agregar por mês
+    cubo = obter_cubo(NOME_ARQUIVO)
+    if cubo is None:
+        return 1
+    df = agregar_cubo(cubo, 'mes').rename(columns={'periodo': 'mes_ano'})
 
     # 3. Gerar histórico
-    df_processado = gerar_historico_vendas(df)
+    df_totais, matriz_historico = gerar_historico_vendas(df)
+
+    # 3.5. Curva ABC de todas as lojas de uma vez, mais as janelas (3/6/12 meses e anos)
+    # e os indicadores usados no prompt da IA
+    df_processado = calcular_curva_abc(df_totais)
+    df_processado = df_processado.join(calcular_classes_janelas(df_totais, matriz_historico)).join(
+        calcular_indicadores_ia(df_processado, matriz_historico)
+    )
 
     # 4. Configurar IA
     modelo = configurar_ia()
@@ -754,35 +722,69 @@ def main() -> None:
     # 4.5. Carregar cache de análises anteriores
     cache = carregar_cache()
 
+    # 4.6. Impressões digitais: lojas com a mesma entrada reaproveitam a seção anterior.
+    # As janelas ABC terminam no último mês do extrato, então os meses entram na configuração.
+    config = {
+        "limite_a": LIMITE_CLASSE_A,
+        "limite_b": LIMITE_CLASSE_B,
+        "janelas_meses": JANELAS_ABC_MESES,
+        "meses": [str(mes) for mes in matriz_historico.columns],
+        "modelo": MODELO_IA if modelo else None,
+        "versao_prompt": VERSAO_PROMPT_IA,
+        "versao_saida": VERSAO_SAIDA_ABC,
+    }
+    impressoes = impressoes_por_loja(df, COLUNAS_IMPRESSAO)
+    anteriores = carregar_secoes_anteriores(ARQUIVO_SAIDA, config)
+
     # 5. Processar lojas
-    lista_lojas = df_processado[COL_LOJA].unique()
+    # Fatias contíguas por loja (a curva já vem ordenada por loja)
+    lista_lojas = indexar_particoes(df_processado['loja_id'])
     total_lojas = len(lista_lojas)
 
     logger.info(f"Iniciando processamento de {total_lojas} lojas...")
 
     resultado_final = []
+    reaproveitadas = 0
 
-    for idx, id_loja in enumerate(lista_lojas, 1):
+    for idx, (id_loja, fatia) in enumerate(lista_lojas.items(), 1):
         logger.info(f"Processando Loja {id_loja} ({idx}/{total_lojas})")
 
-        df_loja = df_processado[df_processado[COL_LOJA] == id_loja]
-        resultado_loja = processar_loja(df_loja, id_loja, modelo, cache)
+        resultado_loja = reaproveitar_secao(anteriores, id_loja, impressoes.get(id_loja))
+        if resultado_loja is not None:
+            logger.info("  ♻️ Entrada inalterada - seção anterior reaproveitada")
+            reaproveitadas += 1
+        else:
+            df_loja = df_processado.iloc[fatia]
+            resultado_loja = processar_loja(df_loja, id_loja, modelo, cache, matriz_historico)
         resultado_final.append(resultado_loja)
 
-    # 6. Salvar cache atualizado
-    salvar_cache(cache)
-    logger.info("Cache de análises atualizado")
+    logger.info(f"Lojas reaproveitadas sem recálculo: {reaproveitadas}/{total_lojas}")
+
+    # 6. Estatísticas do cache (cada análise nova já foi gravada ao chegar)
+    cache.registrar_estatisticas("análises ABC")
 
     # 7. Salvar resultado
     if salvar_resultado(resultado_final, ARQUIVO_SAIDA):
+        # Só seções completas (sem falha de IA) podem ser reaproveitadas
+        completas = {
+            chave_loja(loja['id_loja']) for loja in resultado_final
+            if all(item.get('analise_ia') != "Análise indisponível" for item in loja['itens'])
+        }
+        salvar_impressoes(ARQUIVO_SAIDA, config, {
+            id_loja: impressao for id_loja, impressao in impressoes.items()
+            if chave_loja(id_loja) in completas
+        })
+
         logger.info("=" * 50)
         logger.info("PROCESSAMENTO CONCLUÍDO COM SUCESSO!")
         logger.info(f"Total de lojas processadas: {total_lojas}")
         logger.info(f"Arquivo gerado: {ARQUIVO_SAIDA}")
         logger.info("=" * 50)
-    else:
-        logger.error("Falha ao salvar resultado final")
+        return 0
+
+    logger.error("Falha ao salvar resultado final")
+    return 1
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
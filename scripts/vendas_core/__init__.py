@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+"""
+VENDAS_CORE: FUNÇÕES COMPARTILHADAS PELOS SCRIPTS DE ANÁLISE
+Carregamento e preparação do extrato de vendas usados por todos os relatórios.
+"""
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+AGREGADO DIÁRIO PARCIAL E COMBINÁVEL
+Reduz lotes de linhas brutas a somas por (loja, produto, dia) e combina
+agregados parciais entre si.
+
+A combinação é associativa e comutativa (é uma soma por chave), então lotes
+podem ser reduzidos em qualquer ordem, em sequência com memória constante ou
+em paralelo, e o resultado final é sempre o mesmo.
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import Callable, Iterable, Optional
+
+import pandas as pd
+
+from vendas_core.colunas import COL_DATA, COL_LOJA, COL_PRODUTO, COL_VALOR, COLUNAS_EXTRATO
+from vendas_core.staging import tipar_colunas
+
+logger = logging.getLogger(__name__)
+
+CHAVES_AGREGADO = [COL_LOJA, COL_PRODUTO, COL_DATA]
+
+
+def agregado_vazio() -> pd.DataFrame:
+    """Retorna um agregado sem linhas (elemento neutro da combinação)."""
+    return pd.DataFrame({
+        COL_LOJA: pd.Series(dtype=object),
+        COL_PRODUTO: pd.Series(dtype=object),
+        COL_VALOR: pd.Series(dtype='float64'),
+        COL_DATA: pd.Series(dtype='datetime64[ns]'),
+    })[COLUNAS_EXTRATO]
+
+
+def agregar_lote(df_lote: pd.DataFrame) -> pd.DataFrame:
+    """
+    Limpa um lote bruto e reduz a somas por (loja, produto, dia).
+
+    Aplica os mesmos filtros de `preparar_dados`: descarta valores <= 0 e
+    datas inválidas antes de somar.
+
+    Args:
+        df_lote: Lote bruto com as colunas do staging
+
+    Returns:
+        Agregado parcial com as colunas do staging
+    """
+    df = tipar_colunas(df_lote)
+    df = df[(df[COL_VALOR] > 0) & df[COL_DATA].notna()].copy()
+    df[COL_DATA] = df[COL_DATA].dt.normalize()
+
+    return (
+        df.groupby(CHAVES_AGREGADO, sort=False)[COL_VALOR]
+        .sum()
+        .reset_index()
+    )[COLUNAS_EXTRATO]
+
+
+def combinar_agregados(parciais: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Combina agregados parciais somando os valores de chaves repetidas.
+
+    Args:
+        parciais: Agregados produzidos por `agregar_lote` ou por esta função
+
+    Returns:
+        Agregado único com uma linha por (loja, produto, dia)
+    """
+    parciais = [p for p in parciais if not p.empty]
+    if not parciais:
+        return agregado_vazio()
+    if len(parciais) == 1:
+        return parciais[0]
+
+    return (
+        pd.concat(parciais, ignore_index=True)
+        .groupby(CHAVES_AGREGADO, sort=False)[COL_VALOR]
+        .sum()
+        .reset_index()
+    )[COLUNAS_EXTRATO]
+
+
+def dobrar_lotes(
+    lotes: Iterable[pd.DataFrame],
+    filtro: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None
+) -> tuple[pd.DataFrame, int]:
+    """
+    Reduz uma sequência de lotes brutos a um único agregado.
+
+    Cada lote é agregado e imediatamente combinado ao acumulado, de modo que
+    só o acumulado e um lote existem na memória ao mesmo tempo.
+
+    Args:
+        lotes: Iterável de lotes brutos (chunks de CSV, linhas do Excel...)
+        filtro: Função aplicada a cada lote bruto antes da agregação
+            (ex.: manter só as datas a partir de um corte)
+
+    Returns:
+        Tupla (agregado final, total de linhas brutas lidas)
+    """
+    acumulado = agregado_vazio()
+    total_linhas = 0
+
+    for df_lote in lotes:
+        total_linhas += len(df_lote)
+        if filtro is not None:
+            df_lote = filtro(df_lote)
+        acumulado = combinar_agregados([acumulado, agregar_lote(df_lote)])
+        logger.info(f"  {total_linhas} linhas lidas | {len(acumulado)} chaves (loja, produto, dia)")
+
+    return acumulado, total_linhas
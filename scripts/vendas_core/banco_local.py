@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+BANCOS SQLITE LOCAIS (COTA DA IA E CACHE DE RESPOSTAS)
+Abre um SQLite em `.staging/` em modo WAL, criando o esquema se necessário.
+Se o arquivo não puder ser usado (disco somente leitura, permissão), cai
+para um banco em memória: o processo continua, só sem compartilhar estado.
+"""
+
+from __future__ import annotations
+
+import logging
+import sqlite3
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT_BLOQUEIO = 30.0  # segundos esperando o lock de outro processo
+
+
+def abrir_banco(caminho: str, esquema: str) -> sqlite3.Connection:
+    """
+    Abre (ou cria) um banco SQLite local em modo autocommit.
+
+    A conexão pode ser usada por threads de trabalho (`asyncio.to_thread`);
+    quem a compartilha entre threads serializa o acesso com um lock.
+
+    Args:
+        caminho: Arquivo do banco
+        esquema: Script SQL idempotente (CREATE TABLE IF NOT EXISTS ...)
+
+    Returns:
+        Conexão pronta; transações explícitas com BEGIN/COMMIT
+    """
+    try:
+        Path(caminho).parent.mkdir(parents=True, exist_ok=True)
+        conexao = sqlite3.connect(
+            caminho, timeout=TIMEOUT_BLOQUEIO, isolation_level=None, check_same_thread=False
+        )
+        conexao.execute("PRAGMA journal_mode=WAL")
+        conexao.executescript(esquema)
+    except (OSError, sqlite3.Error) as e:
+        logger.warning(f"Banco {caminho} indisponível ({e}) - usando só memória neste processo")
+        conexao = sqlite3.connect(':memory:', isolation_level=None, check_same_thread=False)
+        conexao.executescript(esquema)
+    return conexao
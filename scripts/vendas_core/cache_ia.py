@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+CACHE DA IA ENDEREÇADO POR CONTEÚDO (CHAVE-VALOR EM SQLITE)
+A chave de cada entrada é o SHA-256 das entradas normalizadas do prompt
+(loja, período, itens, total...), do modelo, da `generation_config` e do nome
+e versão do template. Entradas que não mudaram reaproveitam o valor gravado:
+nenhuma chamada à API e nenhuma espera de cota.
+
+Dois caches usam este módulo:
+- respostas das análises temporais: `.staging/respostas_ia.sqlite`
+  (ou GEMINI_CACHE_DB), ver `abrir_cache_respostas`;
+- análises por produto da Curva ABC (relatorio_teste.py).
+
+Cada gravação é uma linha (atômica); entradas expiram após um TTL e, acima
+de um número máximo, as menos acessadas recentemente são removidas (LRU).
+Acertos, faltas, gravações e remoções são contados para o log da execução.
+Mudar o prompt exige incrementar a versão do template no script
+(VERSAO_PROMPT_IA).
+
+Os arquivos ficam em .staging/, fora do git; no CI sobrevivem entre execuções
+só pelo actions/cache (por branch, descartado após 7 dias sem uso). O cache é
+uma otimização: se sumir, as respostas são pedidas de novo à IA.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Optional
+
+from vendas_core.banco_local import abrir_banco
+
+logger = logging.getLogger(__name__)
+
+ARQUIVO_CACHE_RESPOSTAS = os.path.join('.staging', 'respostas_ia.sqlite')
+TTL_RESPOSTAS_DIAS = 180
+MAX_RESPOSTAS = 100_000
+
+EXPURGO_A_CADA = 500  # gravações entre verificações de tamanho
+
+ESQUEMA_CACHE = """
+    CREATE TABLE IF NOT EXISTS entradas (
+        chave TEXT PRIMARY KEY,
+        valor TEXT NOT NULL,
+        criado REAL NOT NULL,
+        acessado REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_entradas_acessado ON entradas (acessado);
+"""
+
+
+def assinatura_prompt(nome_prompt: str, versao_prompt: int, nome_modelo: str, config_geracao: dict) -> dict:
+    """
+    Identifica o que, além das entradas, determina a resposta.
+
+    Args:
+        nome_prompt: Template usado (ex.: 'analise_temporal')
+        versao_prompt: Versão do template (incrementar ao alterar o texto)
+        nome_modelo: Modelo Gemini (ex.: 'gemini-2.0-flash')
+        config_geracao: `generation_config` do modelo (ver `vendas_core.ia.config_geracao`)
+
+    Returns:
+        Dicionário combinado às entradas em `chave_resposta`
+    """
+    return {
+        'prompt': nome_prompt,
+        'versao_prompt': versao_prompt,
+        'modelo': nome_modelo,
+        'geracao': config_geracao,
+    }
+
+
+def chave_resposta(assinatura: dict, entradas: Any) -> str:
+    """
+    Chave de cache de um prompt: hash das entradas normalizadas e da assinatura.
+
+    A normalização é um JSON com chaves ordenadas e sem espaços, então a
+    ordem de montagem dos dicionários não altera a chave.
+
+    Args:
+        assinatura: Saída de `assinatura_prompt`
+        entradas: Dados que preenchem o template (serializáveis em JSON)
+
+    Returns:
+        SHA-256 hexadecimal
+    """
+    normalizado = json.dumps(
+        {'assinatura': assinatura, 'entradas': entradas},
+        sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str,
+    )
+    return hashlib.sha256(normalizado.encode('utf-8')).hexdigest()
+
+
+class CacheIA:
+    """
+    Cache chave-valor (texto) em SQLite, com TTL, limite de tamanho (LRU)
+    e contadores da execução.
+    """
+
+    def __init__(self, caminho: str, ttl_dias: Optional[float] = None, max_entradas: Optional[int] = None):
+        self.caminho = caminho
+        self.ttl = ttl_dias * 86400 if ttl_dias else None
+        self.max_entradas = max_entradas
+        self.contadores = {'acertos': 0, 'faltas': 0, 'gravacoes': 0, 'expurgos': 0}
+        self._banco = abrir_banco(caminho, ESQUEMA_CACHE)
+        self.expurgar()
+
+    def __len__(self) -> int:
+        return self._banco.execute("SELECT COUNT(*) FROM entradas").fetchone()[0]
+
+    def obter(self, chave: str) -> Optional[str]:
+        """Valor gravado para a chave (e marca o acesso), ou None se ausente/expirado."""
+        agora = time.time()
+        linha = self._banco.execute("SELECT valor, criado FROM entradas WHERE chave = ?", (chave,)).fetchone()
+
+        if linha is not None and self.ttl and linha[1] < agora - self.ttl:
+            self._banco.execute("DELETE FROM entradas WHERE chave = ?", (chave,))
+            self.contadores['expurgos'] += 1
+            linha = None
+
+        if linha is None:
+            self.contadores['faltas'] += 1
+            return None
+
+        self._banco.execute("UPDATE entradas SET acessado = ? WHERE chave = ?", (agora, chave))
+        self.contadores['acertos'] += 1
+        return linha[0]
+
+    def gravar(self, chave: str, valor: str) -> None:
+        """Grava (ou substitui) uma entrada; cada gravação é atômica."""
+        agora = time.time()
+        self._banco.execute(
+            "INSERT OR REPLACE INTO entradas (chave, valor, criado, acessado) VALUES (?, ?, ?, ?)",
+            (chave, valor, agora, agora),
+        )
+        self.contadores['gravacoes'] += 1
+        if self.contadores['gravacoes'] % EXPURGO_A_CADA == 0:
+            self.expurgar()
+
+    def expurgar(self) -> int:
+        """
+        Remove as entradas expiradas e, acima de `max_entradas`, as acessadas
+        há mais tempo.
+
+        Returns:
+            Quantidade de entradas removidas
+        """
+        removidas = 0
+        if self.ttl:
+            removidas += self._banco.execute(
+                "DELETE FROM entradas WHERE criado < ?", (time.time() - self.ttl,)
+            ).rowcount
+        if self.max_entradas:
+            excedente = len(self) - self.max_entradas
+            if excedente > 0:
+                removidas += self._banco.execute(
+                    "DELETE FROM entradas WHERE chave IN "
+                    "(SELECT chave FROM entradas ORDER BY acessado LIMIT ?)",
+                    (excedente,),
+                ).rowcount
+        self.contadores['expurgos'] += removidas
+        return removidas
+
+    def registrar_estatisticas(self, nome: str) -> None:
+        """Escreve no log os contadores desta execução."""
+        c = self.contadores
+        consultas = c['acertos'] + c['faltas']
+        taxa = c['acertos'] / consultas * 100 if consultas else 0.0
+        logger.info(
+            f"💾 Cache de {nome}: {c['acertos']} acertos, {c['faltas']} faltas ({taxa:.0f}% de acerto), "
+            f"{c['gravacoes']} gravações, {c['expurgos']} removidas (TTL/LRU), {len(self)} entradas"
+        )
+
+
+# Um cache por (arquivo, TTL, limite) no processo (a conexão é reaproveitada)
+_CACHES: dict[tuple[str, Optional[float], Optional[int]], CacheIA] = {}
+
+
+def abrir_cache(caminho: str, ttl_dias: Optional[float] = None, max_entradas: Optional[int] = None) -> CacheIA:
+    """
+    Cache do arquivo neste processo (aberto na primeira chamada).
+
+    Chamadas com outro TTL ou limite recebem uma instância própria sobre o
+    mesmo arquivo, em vez de herdar os limites de quem abriu primeiro.
+    """
+    chave = (caminho, ttl_dias, max_entradas)
+    if chave not in _CACHES:
+        _CACHES[chave] = CacheIA(caminho, ttl_dias, max_entradas)
+    return _CACHES[chave]
+
+
+def abrir_cache_respostas() -> CacheIA:
+    """Cache de respostas das análises temporais (GEMINI_CACHE_DB ou .staging/respostas_ia.sqlite)."""
+    caminho = os.environ.get('GEMINI_CACHE_DB', ARQUIVO_CACHE_RESPOSTAS)
+    return abrir_cache(caminho, TTL_RESPOSTAS_DIAS, MAX_RESPOSTAS)
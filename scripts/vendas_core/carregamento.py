@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+CARREGAMENTO DO EXTRATO DE VENDAS
+Ponto único de leitura do extrato (staging Parquet, XLSX ou CSV) e da base
+preparada compartilhada pelas análises.
+
+`obter_base_preparada` memoriza a base por hash do arquivo: quando várias
+análises rodam no mesmo processo (executar_analises.py), o extrato é lido e
+limpo uma única vez.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from typing import Optional
+
+import pandas as pd
+
+from vendas_core.colunas import COL_LOJA
+from vendas_core.leitura_csv import ler_csv_vendas
+from vendas_core.limpeza import preparar_base
+from vendas_core.staging import calcular_hash_arquivo, carregar_staging, salvar_staging
+
+logger = logging.getLogger(__name__)
+
+# Bases já preparadas neste processo, por hash do arquivo de origem
+_bases_preparadas: dict[str, pd.DataFrame] = {}
+
+
+def carregar_dados(caminho: str) -> Optional[pd.DataFrame]:
+    """
+    Carrega arquivo de dados (CSV ou XLSX) com tratamento automático de formato.
+
+    Args:
+        caminho: Caminho para o arquivo de dados (CSV ou XLSX)
+
+    Returns:
+        DataFrame carregado ou None em caso de erro
+    """
+    if not os.path.exists(caminho):
+        logger.error(f"Arquivo não encontrado: {caminho}")
+        return None
+
+    # Reaproveita o staging Parquet se o extrato não mudou desde a última conversão
+    df = carregar_staging(caminho)
+    if df is not None:
+        return df
+
+    # Detecta formato pela extensão
+    extensao = caminho.lower().split('.')[-1]
+
+    # Arquivos Excel (.xlsx)
+    if extensao in ['xlsx', 'xls']:
+        try:
+            df = pd.read_excel(
+                caminho,
+                engine='openpyxl',
+                dtype={COL_LOJA: str}  # Preserva ID como string
+            )
+            logger.info(f"Arquivo Excel carregado - {len(df)} registros")
+            return salvar_staging(caminho, df)
+        except Exception as e:
+            logger.error(f"Erro ao carregar Excel: {e}")
+            return None
+
+    # Arquivos CSV: encoding detectado por amostra de bytes, leitura única
+    df = ler_csv_vendas(caminho)
+    if df is None:
+        return None
+    return salvar_staging(caminho, df)
+
+
+def obter_base_preparada(caminho: str) -> Optional[pd.DataFrame]:
+    """
+    Carrega e prepara o extrato uma única vez por processo.
+
+    A base devolvida é compartilhada entre as análises: quem precisar de
+    colunas extras deve trabalhar sobre uma cópia (ex.: `df.assign(...)`).
+
+    Args:
+        caminho: Caminho para o arquivo de dados (CSV ou XLSX)
+
+    Returns:
+        Base preparada (ver `preparar_base`) ou None em caso de erro
+    """
+    if not os.path.exists(caminho):
+        logger.error(f"Arquivo não encontrado: {caminho}")
+        return None
+
+    chave = calcular_hash_arquivo(caminho)
+    if chave in _bases_preparadas:
+        logger.info(f"Base preparada reaproveitada neste processo - {len(_bases_preparadas[chave])} registros")
+        return _bases_preparadas[chave]
+
+    df = carregar_dados(caminho)
+    if df is None:
+        return None
+
+    base = preparar_base(df)
+    if base is None:
+        return None
+
+    _bases_preparadas[chave] = base
+    return base
@@ -0,0 +1,448 @@
+# -*- coding: utf-8 -*-
+"""
+CLIENTE ASSÍNCRONO DO GEMINI COM LIMITE DE TAXA (TOKEN BUCKET)
+Em vez de dormir um intervalo fixo antes de cada chamada (calibrado para o
+pior caso), os prompts são enviados juntos com `generate_content_async` e
+limitados por:
+- um token bucket de requisições por minuto (RPM) e tokens por minuto (TPM)
+  por modelo, compartilhado entre processos;
+- um limite opcional de requisições por dia (RPD), com o uso persistido
+  entre execuções;
+- um semáforo com o número máximo de requisições em voo no processo.
+
+O estado da cota fica em um SQLite local (`.staging/cota_gemini.sqlite`, ou
+GEMINI_COTA_DB): cada reserva é uma transação `BEGIN IMMEDIATE`, então
+relatorio_teste.py, analise_temporal_multi.py e vários analise_loja_N.py
+podem rodar em paralelo dentro do mesmo orçamento, e um 429 em um processo
+pausa todos. Se o arquivo não puder ser aberto, o estado fica só em memória.
+As transações rodam em threads de trabalho (`asyncio.to_thread`): esperar o
+lock de outro processo não trava o loop nem as demais requisições em voo.
+
+Os limites de cada script podem ser sobrescritos pelas variáveis de ambiente
+GEMINI_RPM, GEMINI_TPM, GEMINI_RPD e GEMINI_CONCORRENCIA, conforme o plano
+da conta.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterator, NamedTuple, Optional
+
+# Exceções da API (instaladas junto com google-generativeai)
+try:
+    from google.api_core import exceptions as google_exceptions
+    ERROS_RATE_LIMIT: tuple = (google_exceptions.ResourceExhausted,)
+    ERROS_CONEXAO: tuple = (
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.DeadlineExceeded,
+        ConnectionError,
+        asyncio.TimeoutError,
+    )
+except ImportError:
+    ERROS_RATE_LIMIT = ()
+    ERROS_CONEXAO = (ConnectionError, asyncio.TimeoutError)
+
+from vendas_core.banco_local import abrir_banco
+from vendas_core.cache_ia import abrir_cache_respostas
+
+logger = logging.getLogger(__name__)
+
+CARACTERES_POR_TOKEN = 4      # estimativa para texto em português
+TOKENS_RESPOSTA_ESTIMADOS = 1024  # reservados para a resposta; ajustados pelo uso real
+
+ARQUIVO_COTA = os.path.join('.staging', 'cota_gemini.sqlite')
+# A cota diária do Gemini reinicia à meia-noite do horário do Pacífico
+try:
+    from zoneinfo import ZoneInfo
+    FUSO_COTA_DIARIA = ZoneInfo('America/Los_Angeles')
+except Exception:
+    FUSO_COTA_DIARIA = timezone.utc
+
+
+class CotaDiariaEsgotada(Exception):
+    """O limite de requisições por dia do modelo foi atingido."""
+
+
+class ConfigClienteIA(NamedTuple):
+    """Limites de taxa e política de retentativa de um script."""
+    rpm: int                        # requisições por minuto do modelo
+    tpm: int                        # tokens por minuto do modelo
+    rpd: int = 0                    # requisições por dia do modelo (0 = sem limite)
+    concorrencia: int = 4           # requisições em voo ao mesmo tempo (por processo)
+    tentativas_api: int = 5         # erros de conexão / respostas vazias
+    tentativas_rate_limit: int = 8  # respostas 429 (ResourceExhausted)
+    delay_base_rate_limit: float = 15.0  # pausa progressiva após 429 (s)
+    tentativas_json: int = 1        # respostas com JSON inválido
+
+
+# ==========================================
+# TOKEN BUCKET COMPARTILHADO (SQLITE)
+# ==========================================
+
+def caminho_cota() -> str:
+    """Banco da cota compartilhada (GEMINI_COTA_DB ou .staging/cota_gemini.sqlite)."""
+    return os.environ.get('GEMINI_COTA_DB', ARQUIVO_COTA)
+
+
+ESQUEMA_COTA = """
+    CREATE TABLE IF NOT EXISTS balde (
+        modelo TEXT PRIMARY KEY,
+        requisicoes REAL NOT NULL,
+        tokens REAL NOT NULL,
+        atualizado REAL NOT NULL,
+        pausa_ate REAL NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS uso_diario (
+        modelo TEXT NOT NULL,
+        dia TEXT NOT NULL,
+        requisicoes INTEGER NOT NULL DEFAULT 0,
+        tokens INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (modelo, dia)
+    );
+"""
+
+
+def dia_cota() -> str:
+    """Dia corrente da cota diária ('YYYY-MM-DD', horário do Pacífico)."""
+    return datetime.now(FUSO_COTA_DIARIA).date().isoformat()
+
+
+class LimiteTaxa:
+    """
+    Token bucket duplo de um modelo: uma requisição consome 1 de RPM e os
+    tokens estimados do prompt de TPM; os saldos recarregam continuamente.
+    O estado vive no SQLite e é lido/gravado em uma transação por operação.
+    Os métodos são síncronos (podem esperar o lock do SQLite); no loop
+    assíncrono, use `adquirir` e `asyncio.to_thread`.
+    """
+
+    def __init__(self, nome_modelo: str, rpm: int, tpm: int, rpd: int = 0, caminho: Optional[str] = None):
+        self.modelo = nome_modelo
+        self.rpm = rpm
+        self.tpm = tpm
+        self.rpd = rpd
+        self._banco = abrir_banco(caminho or caminho_cota(), ESQUEMA_COTA)
+        self._lock = threading.RLock()  # uma transação por vez na conexão compartilhada
+
+    @contextmanager
+    def _transacao(self) -> Iterator[sqlite3.Connection]:
+        """Transação com lock de escrita (exclusiva entre processos e entre threads)."""
+        with self._lock:
+            self._banco.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._banco
+            except BaseException:
+                self._banco.execute("ROLLBACK")
+                raise
+            self._banco.execute("COMMIT")
+
+    def _registrar_uso(self, banco: sqlite3.Connection, requisicoes: int, tokens: int) -> None:
+        banco.execute(
+            """INSERT INTO uso_diario (modelo, dia, requisicoes, tokens) VALUES (?, ?, ?, ?)
+               ON CONFLICT (modelo, dia) DO UPDATE SET
+                   requisicoes = requisicoes + excluded.requisicoes,
+                   tokens = tokens + excluded.tokens""",
+            (self.modelo, dia_cota(), requisicoes, tokens),
+        )
+
+    def uso_do_dia(self) -> tuple[int, int]:
+        """(requisições, tokens) do modelo no dia corrente, somando todos os processos."""
+        with self._lock:
+            linha = self._banco.execute(
+                "SELECT requisicoes, tokens FROM uso_diario WHERE modelo = ? AND dia = ?",
+                (self.modelo, dia_cota()),
+            ).fetchone()
+        return linha or (0, 0)
+
+    def reservar(self, tokens: int) -> float:
+        """
+        Consome uma requisição e `tokens`, se houver saldo.
+
+        Returns:
+            0 se a reserva foi feita; senão, segundos até haver saldo
+
+        Raises:
+            CotaDiariaEsgotada: Se o limite diário (rpd) já foi atingido
+        """
+        tokens = min(tokens, self.tpm)  # um prompt maior que o TPM nunca teria saldo
+
+        with self._transacao() as banco:
+            agora = time.time()
+            linha = banco.execute(
+                "SELECT requisicoes, tokens, atualizado, pausa_ate FROM balde WHERE modelo = ?",
+                (self.modelo,),
+            ).fetchone()
+            requisicoes, saldo_tokens, atualizado, pausa_ate = linha or (self.rpm, self.tpm, agora, 0.0)
+
+            decorrido = max(0.0, agora - atualizado)
+            requisicoes = min(self.rpm, requisicoes + decorrido * self.rpm / 60)
+            saldo_tokens = min(self.tpm, saldo_tokens + decorrido * self.tpm / 60)
+
+            if self.rpd and self.uso_do_dia()[0] >= self.rpd:
+                raise CotaDiariaEsgotada(f"{self.rpd} requisições/dia de {self.modelo}")
+
+            if agora < pausa_ate:
+                espera = pausa_ate - agora
+            else:
+                espera = max(
+                    (1 - requisicoes) * 60 / self.rpm,
+                    (tokens - saldo_tokens) * 60 / self.tpm,
+                )
+            if espera <= 0:
+                requisicoes -= 1
+                saldo_tokens -= tokens
+                self._registrar_uso(banco, 1, tokens)
+
+            banco.execute(
+                "INSERT OR REPLACE INTO balde (modelo, requisicoes, tokens, atualizado, pausa_ate) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (self.modelo, requisicoes, saldo_tokens, agora, pausa_ate),
+            )
+        return max(espera, 0.0)
+
+    async def adquirir(self, tokens: int) -> None:
+        """Aguarda (sem bloquear o loop) até conseguir reservar."""
+        while (espera := await asyncio.to_thread(self.reservar, tokens)) > 0:
+            await asyncio.sleep(espera)
+
+    def ajustar(self, diferenca: int) -> None:
+        """Corrige o saldo e o uso diário de tokens com o uso real informado pela API."""
+        with self._transacao() as banco:
+            banco.execute("UPDATE balde SET tokens = tokens - ? WHERE modelo = ?", (diferenca, self.modelo))
+            self._registrar_uso(banco, 0, diferenca)
+
+    def pausar(self, segundos: float) -> None:
+        """Suspende as reservas do modelo em todos os processos por `segundos` (após um 429)."""
+        with self._transacao() as banco:
+            banco.execute(
+                "UPDATE balde SET pausa_ate = MAX(pausa_ate, ?) WHERE modelo = ?",
+                (time.time() + segundos, self.modelo),
+            )
+
+
+# Um bucket por modelo: a cota do Gemini é por modelo, não por script
+_LIMITES: dict[str, LimiteTaxa] = {}
+
+
+def obter_limite(nome_modelo: str, config: ConfigClienteIA) -> LimiteTaxa:
+    """Bucket do modelo neste processo (a conexão com o banco é reaproveitada)."""
+    limite = _LIMITES.get(nome_modelo)
+    if limite is None or (limite.rpm, limite.tpm, limite.rpd) != (config.rpm, config.tpm, config.rpd):
+        limite = _LIMITES[nome_modelo] = LimiteTaxa(nome_modelo, config.rpm, config.tpm, config.rpd)
+    return limite
+
+
+def aplicar_ambiente(config: ConfigClienteIA) -> ConfigClienteIA:
+    """Sobrescreve os limites por GEMINI_RPM/GEMINI_TPM/GEMINI_RPD/GEMINI_CONCORRENCIA."""
+    return config._replace(
+        rpm=int(os.environ.get('GEMINI_RPM', config.rpm)),
+        tpm=int(os.environ.get('GEMINI_TPM', config.tpm)),
+        rpd=int(os.environ.get('GEMINI_RPD', config.rpd)),
+        concorrencia=int(os.environ.get('GEMINI_CONCORRENCIA', config.concorrencia)),
+    )
+
+
+def estimar_tokens(prompt: str) -> int:
+    """Estimativa de tokens de uma chamada (prompt + resposta)."""
+    return len(prompt) // CARACTERES_POR_TOKEN + TOKENS_RESPOSTA_ESTIMADOS
+
+
+# ==========================================
+# CHAMADAS ASSÍNCRONAS
+# ==========================================
+
+async def _gerar(
+    modelo: Any,
+    prompt: str,
+    rotulo: str,
+    config: ConfigClienteIA,
+    limite: LimiteTaxa,
+    semaforo: asyncio.Semaphore,
+    interpretar: Callable[[str], Any]
+) -> Optional[tuple[Any, str]]:
+    """Uma chamada com retentativas: (resposta interpretada, texto) ou None se falhar."""
+    tokens = estimar_tokens(prompt)
+    tentativa = tentativas_rate_limit = tentativas_json = 0
+
+    while True:
+        try:
+            async with semaforo:
+                await limite.adquirir(tokens)
+                resposta = await modelo.generate_content_async(prompt)
+
+            uso = getattr(resposta, 'usage_metadata', None)
+            if uso is not None and getattr(uso, 'total_token_count', 0):
+                await asyncio.to_thread(limite.ajustar, uso.total_token_count - tokens)
+
+            if not resposta or not resposta.text:
+                tentativa += 1
+                logger.warning(f"Resposta vazia da IA ({rotulo}), tentativa {tentativa}/{config.tentativas_api}")
+                if tentativa >= config.tentativas_api:
+                    return None
+                continue
+
+            return interpretar(resposta.text), resposta.text
+
+        except CotaDiariaEsgotada as e:
+            logger.error(f"❌ Cota diária esgotada ({e}). Pulando {rotulo}.")
+            return None
+
+        except json.JSONDecodeError as e:
+            tentativas_json += 1
+            logger.warning(
+                f"Erro ao parsear JSON ({rotulo}), tentativa {tentativas_json}/{config.tentativas_json}: {e}"
+            )
+            if tentativas_json >= config.tentativas_json:
+                return None
+
+        except ERROS_RATE_LIMIT:
+            tentativas_rate_limit += 1
+            if tentativas_rate_limit >= config.tentativas_rate_limit:
+                logger.error(f"❌ Rate limit persistente para {rotulo}. Pulando.")
+                return None
+            # Pausa progressiva para todas as chamadas do modelo, não só esta
+            tempo = config.delay_base_rate_limit * tentativas_rate_limit + random.uniform(0, 5)
+            logger.warning(
+                f"⚠️ Rate limit atingido! Tentativa {tentativas_rate_limit}/{config.tentativas_rate_limit}. "
+                f"Aguardando {tempo:.0f}s..."
+            )
+            await asyncio.to_thread(limite.pausar, tempo)
+
+        except ERROS_CONEXAO as e:
+            tentativa += 1
+            logger.warning(f"Erro de conexão ({rotulo}), tentativa {tentativa}/{config.tentativas_api}: {e}")
+            if tentativa >= config.tentativas_api:
+                logger.error(f"Falha definitiva após {config.tentativas_api} tentativas para {rotulo}")
+                return None
+            await asyncio.sleep(2 ** tentativa + random.uniform(0, 1))
+
+        except Exception as e:
+            logger.error(f"Erro inesperado ({rotulo}): {type(e).__name__}: {e}")
+            return None
+
+
+async def _gerar_todas(
+    modelo: Any,
+    prompts: list[str],
+    rotulos: list[str],
+    config: ConfigClienteIA,
+    interpretar: Callable[[str], Any]
+) -> list[Optional[tuple[Any, str]]]:
+    limite = obter_limite(getattr(modelo, 'model_name', ''), config)
+    semaforo = asyncio.Semaphore(config.concorrencia)
+    respostas = await asyncio.gather(*(
+        _gerar(modelo, prompt, rotulo, config, limite, semaforo, interpretar)
+        for prompt, rotulo in zip(prompts, rotulos)
+    ))
+
+    if config.rpd:
+        logger.info(f"Cota diária de {limite.modelo}: {limite.uso_do_dia()[0]}/{config.rpd} requisições")
+    return respostas
+
+
+def analise_completa(resposta: Any, produtos: list[str]) -> bool:
+    """
+    True se a resposta é uma lista com diagnóstico para cada produto pedido.
+
+    Args:
+        resposta: Resposta interpretada da IA
+        produtos: Nomes dos produtos enviados no prompt
+
+    Returns:
+        False para respostas que não são lista, que pulam algum produto ou
+        cujo diagnóstico está ausente ou vazio
+    """
+    if not isinstance(resposta, list):
+        return False
+    analisados = {
+        item['produto'] for item in resposta
+        if isinstance(item, dict)
+        and isinstance(item.get('diagnostico'), str) and item['diagnostico'].strip()
+        and isinstance(item.get('produto'), str)
+    }
+    return analisados.issuperset(produtos)
+
+
+def gerar_respostas(
+    modelo: Any,
+    prompts: list[str],
+    config: ConfigClienteIA,
+    rotulos: Optional[list[str]] = None,
+    interpretar: Callable[[str], Any] = json.loads,
+    chaves_cache: Optional[list[str]] = None,
+    produtos: Optional[list[list[str]]] = None
+) -> list[Optional[Any]]:
+    """
+    Envia vários prompts ao Gemini em paralelo, no ritmo da cota.
+
+    Com `chaves_cache` (ver `vendas_core.cache_ia.chave_resposta`), prompts
+    com resposta gravada não são enviados nem consomem cota, e as respostas
+    novas são gravadas assim que o lote termina. Com `produtos`, só respostas
+    que analisam todos os produtos do prompt (`analise_completa`) são
+    gravadas ou reaproveitadas; as incompletas são usadas nesta execução e
+    pedidas de novo na próxima.
+
+    Args:
+        modelo: Modelo Gemini configurado (ver `vendas_core.ia.configurar_ia`)
+        prompts: Prompts a enviar
+        config: Limites e retentativas (ver `ConfigClienteIA`)
+        rotulos: Identificação de cada prompt nos logs (ex.: o período)
+        interpretar: Converte o texto da resposta (padrão: json.loads);
+            JSONDecodeError conta como resposta inválida
+        chaves_cache: Chave de conteúdo de cada prompt (None = sem cache)
+        produtos: Produtos pedidos em cada prompt (None = qualquer resposta
+            não vazia vai para o cache)
+
+    Returns:
+        Uma resposta interpretada por prompt, na mesma ordem (None = falha)
+    """
+    if not prompts:
+        return []
+
+    config = aplicar_ambiente(config)
+    rotulos = rotulos or [str(i + 1) for i in range(len(prompts))]
+    resultados: list[Optional[Any]] = [None] * len(prompts)
+    pendentes = list(range(len(prompts)))
+
+    def completa(i: int) -> bool:
+        if produtos is None:
+            return bool(resultados[i])
+        return analise_completa(resultados[i], produtos[i])
+
+    cache = abrir_cache_respostas() if chaves_cache else None
+    if cache is not None:
+        pendentes = []
+        for i, chave in enumerate(chaves_cache):
+            texto = cache.obter(chave)
+            try:
+                resultados[i] = interpretar(texto) if texto is not None else None
+            except json.JSONDecodeError:
+                texto = None
+            if texto is None or not completa(i):
+                resultados[i] = None
+                pendentes.append(i)
+        logger.info(f"  💾 Cache de respostas: {len(prompts) - len(pendentes)}/{len(prompts)} reaproveitadas")
+
+    if not pendentes:
+        return resultados
+
+    respostas = asyncio.run(_gerar_todas(
+        modelo, [prompts[i] for i in pendentes], [rotulos[i] for i in pendentes], config, interpretar
+    ))
+    for i, resposta in zip(pendentes, respostas):
+        if resposta is None:
+            continue
+        resultados[i], texto = resposta
+        # Respostas vazias ou incompletas não são gravadas: o prompt é reenviado na próxima execução
+        if cache is not None and completa(i):
+            cache.gravar(chaves_cache[i], texto)
+    return resultados
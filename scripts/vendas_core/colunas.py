@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+"""
+COLUNAS DO EXTRATO DE VENDAS
+Nomes das colunas exportadas pelo Power BI (tabela FtoResumoVendaGeralItem).
+"""
+
+COL_LOJA = 'FtoResumoVendaGeralItem[loja_id]'
+COL_PRODUTO = 'FtoResumoVendaGeralItem[material_descr]'
+COL_VALOR = 'FtoResumoVendaGeralItem[vl_total]'
+COL_DATA = 'FtoResumoVendaGeralItem[dt_contabil]'
+
+# Únicas colunas do extrato usadas pelas análises
+COLUNAS_EXTRATO = [COL_LOJA, COL_PRODUTO, COL_VALOR, COL_DATA]
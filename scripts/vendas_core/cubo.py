@@ -0,0 +1,417 @@
+# -*- coding: utf-8 -*-
+"""
+CUBO DIÁRIO DE VENDAS (LOJA × PRODUTO × DIA)
+Intermediário canônico das análises: a base preparada é reduzida uma única
+vez às somas por (loja, produto, dia) e gravada como arrays NumPy (.npy) ao
+lado do staging, com dicionários de lojas e produtos em JSON.
+
+Os arrays são abertos com `np.load(mmap_mode='r')`: abrir o cubo custa
+milissegundos e não passa pelo pandas. As demais granularidades são obtidas
+por rollup hierárquico com chaves inteiras de período (dia → semana,
+dia → mês → trimestre → ano), sem voltar às linhas do extrato.
+
+Estrutura em disco (<pasta do extrato>/.staging/<arquivo>.cubo.v1.<hash>/):
+    loja.npy      int32   código da loja (índice em lojas)
+    produto.npy   int32   código do produto (índice em produtos)
+    dia.npy       int32   dias desde 1970-01-01
+    valor.npy     float64 soma das vendas
+    dicionarios.json  {"lojas": [...], "produtos": [...]}
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Callable, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from vendas_core.carregamento import obter_base_preparada
+from vendas_core.staging import PASTA_STAGING, calcular_hash_arquivo
+
+logger = logging.getLogger(__name__)
+
+# ==========================================
+# CONFIGURAÇÕES
+# ==========================================
+
+VERSAO_CUBO = 1  # incrementar quando o formato dos arrays mudar
+ARRAYS_CUBO = ['loja', 'produto', 'dia', 'valor']
+ARQUIVO_DICIONARIOS = 'dicionarios.json'
+
+
+class CuboVendas(NamedTuple):
+    """Somas diárias por (loja, produto) e os dicionários de decodificação."""
+    loja: np.ndarray
+    produto: np.ndarray
+    dia: np.ndarray
+    valor: np.ndarray
+    lojas: list[str]
+    produtos: list[str]
+
+
+class NivelAgregado(NamedTuple):
+    """Somas por (loja, período, produto) com o período em código denso."""
+    loja: np.ndarray
+    periodo: np.ndarray
+    produto: np.ndarray
+    valor: np.ndarray
+    chaves: np.ndarray  # chave inteira (ordenada) de cada código de período
+
+
+# Cubos já abertos neste processo, por hash do arquivo de origem
+_cubos_abertos: dict[str, CuboVendas] = {}
+
+
+# ==========================================
+# CONSTRUÇÃO
+# ==========================================
+
+def construir_cubo(base: pd.DataFrame) -> CuboVendas:
+    """
+    Reduz a base preparada às somas por (loja, produto, dia).
+
+    Reaproveita os códigos das colunas categóricas da base (ordem alfabética
+    dos nomes, ver `vendas_core.limpeza.codificar_nomes`).
+
+    Args:
+        base: Base preparada (ver `vendas_core.limpeza.preparar_base`)
+
+    Returns:
+        Cubo ordenado por (loja, produto, dia)
+    """
+    codigos_loja, lojas = base['loja_id'].cat.codes.to_numpy(), base['loja_id'].cat.categories
+    codigos_produto, produtos = base['produto'].cat.codes.to_numpy(), base['produto'].cat.categories
+    dias = base['data_obj'].to_numpy().astype('datetime64[D]').astype(np.int32)
+
+    somas = (
+        pd.DataFrame({
+            'loja': codigos_loja.astype(np.int32),
+            'produto': codigos_produto.astype(np.int32),
+            'dia': dias,
+            'valor': base['valor_limpo'].to_numpy(dtype=np.float64),
+        })
+        .groupby(['loja', 'produto', 'dia'], sort=True)['valor']
+        .sum()
+        .reset_index()
+    )
+
+    logger.info(
+        f"Cubo diário: {len(somas)} células "
+        f"({len(lojas)} lojas × {len(produtos)} produtos)"
+    )
+    return CuboVendas(
+        loja=somas['loja'].to_numpy(dtype=np.int32),
+        produto=somas['produto'].to_numpy(dtype=np.int32),
+        dia=somas['dia'].to_numpy(dtype=np.int32),
+        valor=somas['valor'].to_numpy(dtype=np.float64),
+        lojas=[str(loja) for loja in lojas],
+        produtos=[str(produto) for produto in produtos],
+    )
+
+
+# ==========================================
+# PERSISTÊNCIA
+# ==========================================
+
+def caminho_cubo(caminho: str, hash_arquivo: Optional[str] = None) -> Path:
+    """
+    Retorna a pasta do cubo correspondente ao arquivo de origem.
+
+    Args:
+        caminho: Caminho do arquivo de origem
+        hash_arquivo: Hash já calculado (opcional)
+
+    Returns:
+        Caminho da pasta do cubo (pode ainda não existir)
+    """
+    origem = Path(caminho)
+    hash_arquivo = hash_arquivo or calcular_hash_arquivo(caminho)
+    nome = f"{origem.name}.cubo.v{VERSAO_CUBO}.{hash_arquivo[:16]}"
+    return origem.parent / PASTA_STAGING / nome
+
+
+def gravar_arrays_cubo(pasta: Path, cubo: CuboVendas) -> None:
+    """Grava os arrays e os dicionários do cubo em uma pasta já criada."""
+    for nome in ARRAYS_CUBO:
+        np.save(pasta / f"{nome}.npy", getattr(cubo, nome))
+    with open(pasta / ARQUIVO_DICIONARIOS, 'w', encoding='utf-8') as f:
+        json.dump({'lojas': cubo.lojas, 'produtos': cubo.produtos}, f, ensure_ascii=False)
+
+
+def abrir_arrays_cubo(pasta: Path) -> CuboVendas:
+    """Abre os arrays (memory-mapped, somente leitura) e os dicionários de uma pasta de cubo."""
+    arrays = {nome: np.load(pasta / f"{nome}.npy", mmap_mode='r') for nome in ARRAYS_CUBO}
+    with open(pasta / ARQUIVO_DICIONARIOS, encoding='utf-8') as f:
+        dicionarios = json.load(f)
+    return CuboVendas(lojas=dicionarios['lojas'], produtos=dicionarios['produtos'], **arrays)
+
+
+def salvar_cubo(caminho: str, cubo: CuboVendas) -> bool:
+    """
+    Grava o cubo em disco de forma atômica (pasta temporária + rename).
+
+    Args:
+        caminho: Caminho do arquivo de origem
+        cubo: Cubo a gravar
+
+    Returns:
+        True se o cubo foi gravado
+    """
+    try:
+        destino = caminho_cubo(caminho)
+        destino.parent.mkdir(parents=True, exist_ok=True)
+
+        temporario = destino.with_name(f"{destino.name}.{os.getpid()}.tmp")
+        shutil.rmtree(temporario, ignore_errors=True)
+        temporario.mkdir()
+        gravar_arrays_cubo(temporario, cubo)
+
+        if destino.exists():
+            # Outro processo gravou o mesmo cubo primeiro
+            shutil.rmtree(temporario, ignore_errors=True)
+        else:
+            os.replace(temporario, destino)
+
+        # Remove cubos de versões anteriores do mesmo extrato
+        for antigo in destino.parent.glob(f"{Path(caminho).name}.cubo.v*"):
+            if antigo != destino and not antigo.name.endswith('.tmp'):
+                shutil.rmtree(antigo, ignore_errors=True)
+
+        logger.info(f"Cubo gravado: {destino}")
+        return True
+    except Exception as e:
+        logger.warning(f"Não foi possível gravar o cubo: {e}")
+        return False
+
+
+def carregar_cubo(caminho: str) -> Optional[CuboVendas]:
+    """
+    Abre o cubo do arquivo em modo memory-mapped, se existir.
+
+    Args:
+        caminho: Caminho do arquivo de origem
+
+    Returns:
+        Cubo (arrays somente leitura) ou None se não houver cubo válido
+    """
+    try:
+        pasta = caminho_cubo(caminho)
+        if not pasta.exists():
+            return None
+
+        cubo = abrir_arrays_cubo(pasta)
+        logger.info(f"Cubo reaproveitado ({pasta.name}) - {len(cubo.valor)} células")
+        return cubo
+    except Exception as e:
+        logger.warning(f"Erro ao abrir o cubo, reconstruindo a partir da base: {e}")
+        return None
+
+
+def obter_cubo(caminho: str) -> Optional[CuboVendas]:
+    """
+    Abre o cubo do arquivo, construindo-o a partir da base preparada se preciso.
+
+    Args:
+        caminho: Caminho para o arquivo de dados (CSV ou XLSX)
+
+    Returns:
+        Cubo de vendas ou None em caso de erro
+    """
+    if not os.path.exists(caminho):
+        logger.error(f"Arquivo não encontrado: {caminho}")
+        return None
+
+    chave = calcular_hash_arquivo(caminho)
+    if chave in _cubos_abertos:
+        return _cubos_abertos[chave]
+
+    cubo = carregar_cubo(caminho)
+    if cubo is None:
+        base = obter_base_preparada(caminho)
+        if base is None:
+            return None
+        cubo = construir_cubo(base)
+        salvar_cubo(caminho, cubo)
+
+    _cubos_abertos[chave] = cubo
+    return cubo
+
+
+# ==========================================
+# ROLLUP HIERÁRQUICO
+# ==========================================
+# Chaves inteiras de período: dias e meses desde 1970-01-01, trimestres
+# desde 1970-T1, anos e semanas como AAAA / AAAAWW (semana '%W', início na segunda)
+
+def _semana_do_dia(dias: np.ndarray) -> np.ndarray:
+    """Chave AAAAWW de cada dia (dias desde 1970-01-01)."""
+    datas = pd.DatetimeIndex(dias.astype('datetime64[D]'))
+    return datas.strftime('%Y%W').astype(np.int64).to_numpy()
+
+
+def _mes_do_dia(dias: np.ndarray) -> np.ndarray:
+    """Meses desde 1970-01 de cada dia."""
+    return dias.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+
+
+# granularidade: (nível de origem, chave do período a partir da chave de origem)
+HIERARQUIA: dict[str, tuple[str, Callable[[np.ndarray], np.ndarray]]] = {
+    'semana': ('dia', _semana_do_dia),
+    'mes': ('dia', _mes_do_dia),
+    'trimestre': ('mes', lambda meses: meses // 3),
+    'ano': ('trimestre', lambda trimestres: trimestres // 4),
+}
+
+# Texto de cada chave (mesmo formato usado nos JSONs)
+ROTULOS_PERIODO: dict[str, Callable[[int], str]] = {
+    'dia': lambda dia: str(np.datetime64(dia, 'D')),
+    'semana': lambda chave: f"{chave // 100}-W{chave % 100:02d}",
+    'mes': lambda mes: str(np.datetime64(mes, 'M')),
+    'trimestre': lambda trimestre: f"{1970 + trimestre // 4}-T{trimestre % 4 + 1}",
+    'ano': lambda ano: str(1970 + ano),
+}
+GRANULARIDADES = list(ROTULOS_PERIODO)
+
+
+def rotular_dias(dias: np.ndarray, granularidade: str) -> list[str]:
+    """
+    Retorna o rótulo do período de cada dia na granularidade pedida.
+
+    Args:
+        dias: Dias desde 1970-01-01
+        granularidade: Uma de GRANULARIDADES
+
+    Returns:
+        Rótulos no mesmo formato de `agregar_hierarquia` (ex.: '2024-W05')
+    """
+    funcoes = []
+    nivel = granularidade
+    while nivel != 'dia':
+        nivel, chave_periodo = HIERARQUIA[nivel]
+        funcoes.append(chave_periodo)
+
+    chaves = np.asarray(dias, dtype=np.int64)
+    for chave_periodo in reversed(funcoes):
+        chaves = chave_periodo(chaves)
+    return [ROTULOS_PERIODO[granularidade](int(chave)) for chave in chaves]
+
+
+def _reagregar(
+    loja: np.ndarray,
+    periodo: np.ndarray,
+    produto: np.ndarray,
+    valor: np.ndarray,
+    chaves: np.ndarray,
+) -> NivelAgregado:
+    """Soma por (loja, período, produto) usando uma única chave composta int64."""
+    n_periodos, n_produtos = len(chaves), int(produto.max()) + 1 if len(produto) else 1
+    composta = (loja.astype(np.int64) * n_periodos + periodo) * n_produtos + produto
+
+    somas = pd.Series(np.asarray(valor, dtype=np.float64)).groupby(composta, sort=True).sum()
+    composta = somas.index.to_numpy()
+    loja, resto = np.divmod(composta, n_periodos * n_produtos)
+    periodo, produto = np.divmod(resto, n_produtos)
+
+    return NivelAgregado(
+        loja=loja.astype(np.int32),
+        periodo=periodo.astype(np.int32),
+        produto=produto.astype(np.int32),
+        valor=somas.to_numpy(),
+        chaves=chaves,
+    )
+
+
+def _nivel_diario(cubo: CuboVendas) -> NivelAgregado:
+    """Cubo como nível 'dia' (células já únicas, só reordenadas)."""
+    dias, codigos = np.unique(cubo.dia, return_inverse=True)
+    ordem = np.lexsort((cubo.produto, codigos, cubo.loja))
+    return NivelAgregado(
+        loja=np.asarray(cubo.loja)[ordem],
+        periodo=codigos[ordem].astype(np.int32),
+        produto=np.asarray(cubo.produto)[ordem],
+        valor=np.asarray(cubo.valor)[ordem],
+        chaves=dias.astype(np.int64),
+    )
+
+
+def _rolar(origem: NivelAgregado, chave_periodo: Callable[[np.ndarray], np.ndarray]) -> NivelAgregado:
+    """Re-agrega um nível para o nível acima a partir das chaves de período."""
+    chaves, codigos = np.unique(chave_periodo(origem.chaves), return_inverse=True)
+    return _reagregar(origem.loja, codigos[origem.periodo], origem.produto, origem.valor, chaves)
+
+
+def agregar_hierarquia(cubo: CuboVendas, granularidades: list[str]) -> dict[str, pd.DataFrame]:
+    """
+    Agrega o cubo em várias granularidades, cada uma a partir da anterior.
+
+    Semana e mês saem do nível diário; trimestre sai do mês e ano do
+    trimestre, sempre re-agregando uma tabela já reduzida. Cada nível
+    intermediário é calculado uma única vez por chamada.
+
+    Args:
+        cubo: Cubo de vendas
+        granularidades: Subconjunto de GRANULARIDADES ('dia', 'semana',
+            'mes', 'trimestre', 'ano')
+
+    Returns:
+        Dicionário {granularidade: DataFrame com (loja_id, periodo, produto,
+        valor_limpo), ordenado por loja, período e produto}
+    """
+    niveis: dict[str, NivelAgregado] = {}
+
+    def nivel(granularidade: str) -> NivelAgregado:
+        if granularidade not in niveis:
+            if granularidade == 'dia':
+                niveis['dia'] = _nivel_diario(cubo)
+            else:
+                origem, chave_periodo = HIERARQUIA[granularidade]
+                niveis[granularidade] = _rolar(nivel(origem), chave_periodo)
+        return niveis[granularidade]
+
+    resultado = {}
+    for granularidade in granularidades:
+        agregado = nivel(granularidade)
+        rotulo = ROTULOS_PERIODO[granularidade]
+        resultado[granularidade] = pd.DataFrame({
+            'loja_id': pd.Categorical.from_codes(agregado.loja, categories=cubo.lojas),
+            'periodo': pd.Categorical.from_codes(
+                agregado.periodo, categories=[rotulo(int(chave)) for chave in agregado.chaves]
+            ),
+            'produto': pd.Categorical.from_codes(agregado.produto, categories=cubo.produtos),
+            'valor_limpo': agregado.valor,
+        })
+    return resultado
+
+
+# ==========================================
+# CONSULTAS
+# ==========================================
+
+def agregar_cubo(cubo: CuboVendas, granularidade: str) -> pd.DataFrame:
+    """
+    Soma o cubo por (loja, período, produto) na granularidade pedida.
+
+    Loja, período e produto saem como categorias sobre os códigos inteiros:
+    os nomes só são decodificados ao gravar o JSON.
+
+    Args:
+        cubo: Cubo de vendas
+        granularidade: 'dia', 'semana', 'mes', 'trimestre' ou 'ano'
+
+    Returns:
+        DataFrame com (loja_id, periodo, produto, valor_limpo), ordenado
+        por loja, período e produto
+    """
+    return agregar_hierarquia(cubo, [granularidade])[granularidade]
+
+
+def intervalo_datas(cubo: CuboVendas) -> tuple[str, str]:
+    """Retorna a primeira e a última data do cubo ('YYYY-MM-DD')."""
+    inicio = np.datetime64(int(cubo.dia.min()), 'D')
+    fim = np.datetime64(int(cubo.dia.max()), 'D')
+    return str(inicio), str(fim)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+DATAS DO EXTRATO (dt_contabil)
+O extrato tem centenas de milhares de linhas, mas só cerca de mil datas
+distintas. A conversão e as chaves derivadas (dia, semana, mês, dia da semana)
+são calculadas sobre os valores únicos e mapeadas de volta às linhas pelos
+códigos do `pd.factorize`, em um único passo vetorizado.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+# Formato do dt_contabil exportado (dia primeiro); outros caem no fallback
+FORMATO_DATA = '%d/%m/%Y'
+# ISO antes da inferência por elemento, para '2024-01-05' não virar 1º de maio
+FORMATOS_FALLBACK = ['ISO8601', 'mixed']
+
+# Texto de cada chave derivada (mesmo formato usado nos JSONs)
+FORMATOS_CHAVES = {
+    'dia': '%Y-%m-%d',
+    'semana': '%Y-W%W',
+    'mes_ano': '%Y-%m',
+}
+
+
+def converter_datas(datas: pd.Series) -> pd.Series:
+    """
+    Converte a coluna de datas (dia primeiro) analisando só os valores únicos.
+
+    Cada texto distinto é convertido com o formato explícito `FORMATO_DATA`;
+    os que não casam passam pelos fallbacks (ISO 8601, depois inferência por
+    elemento com `dayfirst=True`). Inválidas viram NaT.
+
+    Args:
+        datas: Coluna de datas (texto ou já datetime)
+
+    Returns:
+        Série datetime64 com o mesmo índice
+    """
+    if pd.api.types.is_datetime64_any_dtype(datas):
+        return datas
+
+    codigos, unicos = pd.factorize(datas)
+    unicos = pd.Series(unicos, dtype=object)
+
+    convertidas = pd.to_datetime(unicos, format=FORMATO_DATA, errors='coerce')
+    for formato in FORMATOS_FALLBACK:
+        falhas = convertidas.isna() & unicos.notna()
+        if not falhas.any():
+            break
+        convertidas[falhas] = pd.to_datetime(
+            unicos[falhas], format=formato, dayfirst=True, errors='coerce'
+        )
+
+    # Código -1 (valor nulo) aponta para o NaT acrescentado no fim
+    valores = np.append(convertidas.to_numpy(dtype='datetime64[ns]'), np.datetime64('NaT', 'ns'))
+    return pd.Series(valores[codigos], index=datas.index)
+
+
+def derivar_chaves_datas(datas: pd.Series) -> pd.DataFrame:
+    """
+    Calcula dia, semana, mês e dia da semana de cada data.
+
+    Os textos são formatados uma vez por data distinta e devolvidos como
+    categorias ordenadas (a ordem dos códigos é a ordem cronológica).
+
+    Args:
+        datas: Série datetime64 (NaT permitido)
+
+    Returns:
+        DataFrame com dia, semana, mes_ano (categóricas) e dia_semana
+        (0 = segunda; -1 para datas nulas), com o mesmo índice
+    """
+    codigos, unicas = pd.factorize(datas, sort=True)
+    unicas = pd.DatetimeIndex(unicas)
+
+    chaves = {}
+    for nome, formato in FORMATOS_CHAVES.items():
+        textos_unicos = unicas.strftime(formato).to_numpy(dtype=object)
+        categorias, codigos_chave = np.unique(textos_unicos, return_inverse=True)
+        codigos_linha = np.append(codigos_chave, -1)[codigos]
+        chaves[nome] = pd.Categorical.from_codes(codigos_linha, categories=categorias)
+
+    chaves['dia_semana'] = np.append(unicas.dayofweek.to_numpy(), -1)[codigos].astype(np.int8)
+
+    return pd.DataFrame(chaves, index=datas.index)
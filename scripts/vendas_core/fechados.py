@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+PERÍODOS FECHADOS: SNAPSHOTS IMUTÁVEIS NOS RELATÓRIOS TEMPORAIS
+Meses, semanas e dias já encerrados não mudam: o bloco de cada período
+fechado (ranking + analise_ia) é copiado tal como está do JSON da execução
+anterior, e só o período aberto (o que contém a última data do extrato) é
+recalculado e reenviado à IA.
+
+Ao lado de cada saída fica um índice `<saida>.fechados.json` com os
+períodos congelados por loja, a impressão digital da entrada de cada um
+(produtos e valores da loja no período) e a configuração que os gerou. Um
+período volta a ser calculado quando:
+- a configuração mudou (TOP_N, BOTTOM_N, modelo de IA);
+- a entrada do período mudou (reclassificação ou estorno em qualquer data);
+- a ingestão incremental marcou a (loja, período) como alterada
+  (ver `vendas_core.incremental`);
+- a análise de IA do bloco falhou (ele nunca é congelado).
+
+A impressão é calculada sobre o agregado lido do cubo. Isso só detecta
+mudanças antigas porque o cubo incremental relê também os dias anteriores à
+janela de revisão cujas somas por (loja, dia) mudaram no extrato, ficando
+igual ao de uma reconstrução completa.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from vendas_core.incremental import carregar_alteracoes
+
+logger = logging.getLogger(__name__)
+
+VERSAO_FECHADOS = 2  # incrementar quando o formato dos blocos ou do índice mudar
+
+# Diagnósticos que indicam análise de IA ausente ou com erro
+DIAGNOSTICOS_FALHA = {'IA não disponível', 'Análise indisponível', 'Erro na análise'}
+
+
+def chave_loja(id_loja: Any) -> str:
+    """Chave da loja no índice: o id como aparece no JSON (inteiro se possível)."""
+    try:
+        return str(int(id_loja))
+    except (ValueError, TypeError):
+        return str(id_loja)
+
+
+def caminho_fechados(caminho_saida: str) -> Path:
+    """Índice de períodos fechados de um arquivo de saída."""
+    saida = Path(caminho_saida)
+    return saida.with_name(f"{saida.stem}.fechados.json")
+
+
+def impressoes_periodos(df: pd.DataFrame, coluna_periodo: str, colunas: list[str]) -> dict[str, dict[str, str]]:
+    """
+    Impressão digital da entrada de cada (loja, período) de um agregado.
+
+    Cada linha vira um hash (valores, não códigos, das colunas categóricas);
+    a impressão do período é a soma dos hashes (módulo 2^64) com a contagem
+    de linhas, então não depende da ordem das linhas e é calculada para
+    todos os períodos em um único groupby.
+
+    Args:
+        df: Agregado com loja_id, a coluna de período e as colunas de entrada
+        coluna_periodo: Coluna do período (ex.: 'periodo' ou 'mes_ano')
+        colunas: Colunas que definem a entrada (ex.: produto e valor)
+
+    Returns:
+        {loja: {periodo: impressão}}
+    """
+    hashes = pd.util.hash_pandas_object(df[colunas], index=False).to_numpy(dtype=np.uint64)
+    grupos = pd.DataFrame({
+        'loja': df['loja_id'].to_numpy(),
+        'periodo': df[coluna_periodo].astype(str).to_numpy(),
+        'hash': hashes,
+    }).groupby(['loja', 'periodo'], sort=False)['hash'].agg(['sum', 'size'])
+
+    impressoes: dict[str, dict[str, str]] = {}
+    for (loja, periodo), soma, linhas in zip(grupos.index, grupos['sum'].to_numpy(), grupos['size'].to_numpy()):
+        impressoes.setdefault(chave_loja(loja), {})[periodo] = f"{int(soma):016x}-{int(linhas)}"
+    return impressoes
+
+
+def bloco_completo(bloco: dict) -> bool:
+    """True se nenhum item do bloco ficou sem análise de IA válida."""
+    return all(
+        item.get('analise_ia', {}).get('diagnostico') not in DIAGNOSTICOS_FALHA
+        for item in bloco.get('itens', [])
+    )
+
+
+def carregar_fechados(
+    caminho_saida: str,
+    config: dict,
+    chave_analises: str,
+    impressoes: dict[str, dict[str, str]]
+) -> dict[str, dict[str, Any]]:
+    """
+    Recupera os blocos dos períodos fechados da execução anterior cuja
+    entrada não mudou.
+
+    Args:
+        caminho_saida: JSON gerado pela execução anterior
+        config: Configuração atual (comparada com a do índice)
+        chave_analises: Campo de cada loja com os blocos por período
+            (ex.: 'analises_mensais' ou 'analises')
+        impressoes: Impressões atuais de cada (loja, período) (ver `impressoes_periodos`)
+
+    Returns:
+        {loja: {periodo: bloco}}; vazio se não houver índice compatível
+    """
+    try:
+        with open(caminho_fechados(caminho_saida), encoding='utf-8') as f:
+            indice = json.load(f)
+        with open(caminho_saida, encoding='utf-8') as f:
+            saida = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    if indice.get('versao') != VERSAO_FECHADOS or indice.get('config') != config:
+        logger.info(f"Configuração mudou desde a última execução - recalculando {caminho_saida} inteiro")
+        return {}
+
+    lojas = saida['dados_lojas'] if isinstance(saida, dict) else saida
+    fechados = {}
+    mudaram = 0
+    for loja in lojas:
+        chave = chave_loja(loja.get('id_loja'))
+        analises = loja.get(chave_analises, {})
+        atuais = impressoes.get(chave, {})
+        fechados[chave] = {}
+        for periodo, impressao in indice.get('fechados', {}).get(chave, {}).items():
+            if periodo not in analises:
+                continue
+            if atuais.get(periodo) != impressao:
+                mudaram += 1
+                continue
+            fechados[chave][periodo] = analises[periodo]
+
+    if mudaram:
+        logger.info(f"{mudaram} períodos fechados com entrada alterada serão recalculados")
+    return fechados
+
+
+def periodos_alterados(caminho_dados: str, granularidade: str) -> dict[str, set[str]]:
+    """
+    Períodos marcados como alterados pela ingestão incremental do extrato atual.
+
+    Args:
+        caminho_dados: Arquivo de dados (extrato)
+        granularidade: 'dia', 'semana', 'mes', 'trimestre' ou 'ano'
+
+    Returns:
+        {loja: {períodos}}; vazio se não houver relatório incremental
+    """
+    alteracoes = carregar_alteracoes(caminho_dados)
+    if not alteracoes or alteracoes.get('completo'):
+        return {}
+    return {
+        chave_loja(loja): set(periodos)
+        for loja, periodos in alteracoes.get('alteracoes', {}).get(granularidade, {}).items()
+    }
+
+
+def congelados_da_loja(
+    fechados: dict[str, dict[str, Any]],
+    alterados: dict[str, set[str]],
+    id_loja: Any,
+    periodo_aberto: str
+) -> dict[str, Any]:
+    """
+    Blocos da loja que podem ser reaproveitados sem recalcular.
+
+    Args:
+        fechados: Saída de `carregar_fechados`
+        alterados: Saída de `periodos_alterados`
+        id_loja: Identificador da loja
+        periodo_aberto: Período que contém a última data do extrato
+
+    Returns:
+        {periodo: bloco} apenas com períodos anteriores ao aberto e não alterados
+    """
+    chave = chave_loja(id_loja)
+    reabertos = alterados.get(chave, set())
+    return {
+        periodo: bloco
+        for periodo, bloco in fechados.get(chave, {}).items()
+        if periodo < periodo_aberto and periodo not in reabertos
+    }
+
+
+def salvar_fechados(
+    caminho_saida: str,
+    config: dict,
+    lojas: list[dict],
+    chave_analises: str,
+    periodo_aberto: str,
+    impressoes: dict[str, dict[str, str]]
+) -> bool:
+    """
+    Grava o índice de períodos fechados da saída recém-gerada.
+
+    Args:
+        caminho_saida: JSON recém-gravado
+        config: Configuração usada nesta execução
+        lojas: Lista de lojas da saída (com id_loja e chave_analises)
+        chave_analises: Campo com os blocos por período
+        periodo_aberto: Período aberto (não congelado)
+        impressoes: Impressões da entrada de cada (loja, período) desta execução
+
+    Returns:
+        True se o índice foi gravado
+    """
+    indice = {
+        'versao': VERSAO_FECHADOS,
+        'config': config,
+        'periodo_aberto': periodo_aberto,
+        'fechados': {
+            chave_loja(loja['id_loja']): {
+                periodo: impressoes[chave_loja(loja['id_loja'])][periodo]
+                for periodo, bloco in loja.get(chave_analises, {}).items()
+                if periodo < periodo_aberto and bloco_completo(bloco)
+                and periodo in impressoes.get(chave_loja(loja['id_loja']), {})
+            }
+            for loja in lojas
+        },
+    }
+
+    destino = caminho_fechados(caminho_saida)
+    try:
+        temporario = destino.with_name(f"{destino.name}.{os.getpid()}.tmp")
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(indice, f, ensure_ascii=False, indent=2)
+        os.replace(temporario, destino)
+        return True
+    except OSError as e:
+        logger.warning(f"Não foi possível gravar {destino}: {e}")
+        return False
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+CONFIGURAÇÃO DO MODELO GEMINI
+Configuração única do cliente Google Generative AI usada pelos scripts.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from typing import Any, Optional
+
+# Tenta importar o Gemini
+try:
+    import google.generativeai as genai
+    GEMINI_DISPONIVEL = True
+except ImportError:
+    GEMINI_DISPONIVEL = False
+
+logger = logging.getLogger(__name__)
+
+
+def config_geracao(temperatura: float) -> dict:
+    """`generation_config` usada pelos scripts (resposta sempre em JSON)."""
+    return {
+        "temperature": temperatura,
+        "response_mime_type": "application/json"
+    }
+
+
+def configurar_ia(nome_modelo: str, temperatura: float) -> Optional[Any]:
+    """
+    Configura e retorna o modelo Gemini com resposta em JSON.
+
+    A API Key é lida de GEMINI_API_KEY (variável de ambiente ou .env já
+    carregado pelo script chamador).
+
+    Args:
+        nome_modelo: Nome do modelo (ex.: 'gemini-2.0-flash')
+        temperatura: Temperatura de geração
+
+    Returns:
+        Modelo configurado ou None se não disponível
+    """
+    api_key = os.environ.get('GEMINI_API_KEY', '')
+
+    if not GEMINI_DISPONIVEL:
+        logger.warning("Biblioteca google-generativeai não instalada. Análise IA será pulada.")
+        return None
+
+    if not api_key:
+        logger.warning("API Key não configurada. Análise IA será pulada.")
+        return None
+
+    try:
+        genai.configure(api_key=api_key)
+        modelo = genai.GenerativeModel(
+            model_name=nome_modelo,
+            generation_config=config_geracao(temperatura)
+        )
+        logger.info(f"Modelo {nome_modelo} configurado com sucesso")
+        return modelo
+    except Exception as e:
+        logger.error(f"Erro ao configurar modelo Gemini: {e}")
+        return None
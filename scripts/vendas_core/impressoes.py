@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+IMPRESSÃO DIGITAL POR LOJA: REAPROVEITA SEÇÕES INTEIRAS DA SAÍDA
+Muitas lojas quase não mudam de um dia para o outro. O recorte agregado de
+cada loja (produto, período, valor) é resumido em um SHA-256; se a impressão
+e a configuração relevante (TOP_N, limites, modelo e versão do prompt)
+forem as mesmas da execução anterior, a seção da loja no JSON anterior é
+reaproveitada como está, sem ranking, curva ABC nem chamadas à IA.
+
+As impressões ficam em `<saida>.impressoes.json`, ao lado de cada saída. Só
+seções completas (sem falhas de IA) são registradas.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Optional
+
+import pandas as pd
+
+from vendas_core.fechados import chave_loja
+from vendas_core.particoes import iterar_particoes
+
+logger = logging.getLogger(__name__)
+
+VERSAO_IMPRESSOES = 1  # incrementar quando o cálculo da impressão mudar
+
+
+def caminho_impressoes(caminho_saida: str) -> Path:
+    """Arquivo de impressões de um arquivo de saída."""
+    saida = Path(caminho_saida)
+    return saida.with_name(f"{saida.stem}.impressoes.json")
+
+
+def calcular_impressao(df_loja: pd.DataFrame, colunas: list[str]) -> str:
+    """
+    Resume o recorte agregado de uma loja em um hash estável.
+
+    O hash usa os valores (não os códigos) das colunas categóricas, então não
+    depende do dicionário de produtos do extrato.
+
+    Args:
+        df_loja: Recorte da loja
+        colunas: Colunas que definem a entrada (ex.: produto, período, valor)
+
+    Returns:
+        SHA-256 hexadecimal
+    """
+    hashes = pd.util.hash_pandas_object(df_loja[colunas], index=False).to_numpy()
+    return hashlib.sha256(hashes.tobytes()).hexdigest()
+
+
+def impressoes_por_loja(df: pd.DataFrame, colunas: list[str]) -> dict[Any, str]:
+    """
+    Calcula a impressão de cada loja de um agregado.
+
+    Args:
+        df: Agregado com loja_id e as colunas de entrada
+        colunas: Colunas que definem a entrada de cada loja
+
+    Returns:
+        {loja: impressão}
+    """
+    return {id_loja: calcular_impressao(df_loja, colunas) for id_loja, df_loja in iterar_particoes(df, 'loja_id')}
+
+
+def carregar_secoes_anteriores(caminho_saida: str, config: dict) -> dict[str, tuple[str, dict]]:
+    """
+    Lê a saída anterior e as impressões registradas para ela.
+
+    Args:
+        caminho_saida: JSON gerado pela execução anterior
+        config: Configuração atual (comparada com a registrada)
+
+    Returns:
+        {loja: (impressão, seção)}; vazio se não houver registro compatível
+    """
+    try:
+        with open(caminho_impressoes(caminho_saida), encoding='utf-8') as f:
+            registro = json.load(f)
+        with open(caminho_saida, encoding='utf-8') as f:
+            saida = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    if registro.get('versao') != VERSAO_IMPRESSOES or registro.get('config') != config:
+        return {}
+
+    impressoes = registro.get('lojas', {})
+    lojas = saida['dados_lojas'] if isinstance(saida, dict) else saida
+    return {
+        chave_loja(secao.get('id_loja')): (impressoes[chave_loja(secao.get('id_loja'))], secao)
+        for secao in lojas
+        if chave_loja(secao.get('id_loja')) in impressoes
+    }
+
+
+def reaproveitar_secao(anteriores: dict[str, tuple[str, dict]], id_loja: Any, impressao: str) -> Optional[dict]:
+    """Seção anterior da loja, se a impressão for a mesma; senão None."""
+    impressao_anterior, secao = anteriores.get(chave_loja(id_loja), (None, None))
+    return secao if impressao_anterior == impressao else None
+
+
+def salvar_impressoes(caminho_saida: str, config: dict, impressoes: dict[str, str]) -> bool:
+    """
+    Registra as impressões das seções gravadas nesta execução.
+
+    Args:
+        caminho_saida: JSON recém-gravado
+        config: Configuração usada nesta execução
+        impressoes: {loja: impressão}, apenas das seções completas
+
+    Returns:
+        True se o registro foi gravado
+    """
+    registro = {
+        'versao': VERSAO_IMPRESSOES,
+        'config': config,
+        'lojas': {chave_loja(loja): impressao for loja, impressao in impressoes.items()},
+    }
+
+    destino = caminho_impressoes(caminho_saida)
+    try:
+        temporario = destino.with_name(f"{destino.name}.{os.getpid()}.tmp")
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(registro, f, ensure_ascii=False, indent=2)
+        os.replace(temporario, destino)
+        return True
+    except OSError as e:
+        logger.warning(f"Não foi possível gravar {destino}: {e}")
+        return False
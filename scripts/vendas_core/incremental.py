@@ -0,0 +1,591 @@
+# -*- coding: utf-8 -*-
+"""
+INGESTÃO INCREMENTAL DO EXTRATO (MARCA D'ÁGUA DE dt_contabil)
+O workflow diário baixa o extrato inteiro, mas quase todas as linhas são as
+mesmas da véspera. No modo incremental, o cubo diário da execução anterior é
+guardado junto com a marca d'água (maior dt_contabil já processada); do
+extrato novo só entram as linhas a partir de `marca - JANELA_REVISAO_DIAS`
+(dias novos e dias recentes que podem ter sido reclassificados ou estornados).
+
+As linhas anteriores ao corte não são agregadas por produto, mas somadas
+por (loja, dia) e conferidas com o cubo guardado. Se algum desses dias mudou
+(reclassificação ou estorno antigo, dia que saiu do extrato), só os dias
+divergentes são relidos em uma segunda passada e também substituídos; assim
+o cubo mesclado é sempre igual ao de uma reconstrução completa.
+
+Os dias relidos substituem os do cubo guardado e o resultado é gravado como
+o cubo do extrato atual (ver `vendas_core.cubo`). As (loja, dia) que de fato
+mudaram são resumidas por granularidade em `<arquivo>.alteracoes.json`, para
+que as etapas seguintes recalculem apenas esses períodos.
+
+Estrutura em disco (<pasta do extrato>/.staging/):
+    <arquivo>.incremental/     cubo da última execução + estado.json
+    <arquivo>.alteracoes.json  (loja, período) alterados na última execução
+
+A primeira execução (sem estado) também lê o extrato em lotes (XLSX em
+modo read-only, CSV em blocos), nunca com um `pd.read_excel` inteiro. O XLSX
+não tem índice por data, então a releitura sempre percorre a planilha; só as
+linhas a partir do corte são tipadas e agregadas.
+
+Para forçar uma reconstrução completa, basta apagar a pasta .incremental.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from vendas_core.carregamento import carregar_dados
+from vendas_core.agregado import combinar_agregados
+from vendas_core.colunas import COL_DATA, COL_LOJA, COL_PRODUTO, COL_VALOR
+from vendas_core.cubo import (
+    GRANULARIDADES,
+    CuboVendas,
+    abrir_arrays_cubo,
+    construir_cubo,
+    gravar_arrays_cubo,
+    carregar_cubo,
+    rotular_dias,
+    salvar_cubo,
+)
+from vendas_core.datas import converter_datas
+from vendas_core.leitura_csv import agregar_csv_em_blocos
+from vendas_core.limpeza import normalizar_produtos, preparar_base
+from vendas_core.staging import PASTA_STAGING, calcular_hash_arquivo, tipar_colunas
+from vendas_core.streaming import agregar_xlsx_streaming
+
+logger = logging.getLogger(__name__)
+
+# ==========================================
+# CONFIGURAÇÕES
+# ==========================================
+
+VERSAO_ESTADO = 1  # incrementar quando o formato do estado mudar
+JANELA_REVISAO_DIAS = 7  # dias antes da marca d'água relidos a cada execução
+ARQUIVO_ESTADO = 'estado.json'
+CASAS_COMPARACAO = 2  # valores comparados em centavos ao detectar alterações
+
+
+# ==========================================
+# LOCALIZAÇÃO E PERSISTÊNCIA DO ESTADO
+# ==========================================
+
+def caminho_estado(caminho: str) -> Path:
+    """Pasta com o cubo e o estado da última execução incremental."""
+    origem = Path(caminho)
+    return origem.parent / PASTA_STAGING / f"{origem.name}.incremental"
+
+
+def caminho_alteracoes(caminho: str) -> Path:
+    """Relatório de (loja, período) alterados na última execução."""
+    origem = Path(caminho)
+    return origem.parent / PASTA_STAGING / f"{origem.name}.alteracoes.json"
+
+
+def carregar_estado(caminho: str) -> Optional[tuple[CuboVendas, dict]]:
+    """
+    Abre o cubo e o estado guardados pela última execução incremental.
+
+    Args:
+        caminho: Caminho do arquivo de origem
+
+    Returns:
+        Tupla (cubo, estado) ou None se não houver estado compatível
+    """
+    pasta = caminho_estado(caminho)
+    try:
+        with open(pasta / ARQUIVO_ESTADO, encoding='utf-8') as f:
+            estado = json.load(f)
+        if estado.get('versao') != VERSAO_ESTADO:
+            logger.info("Estado incremental de outra versão - reconstrução completa")
+            return None
+        return abrir_arrays_cubo(pasta), estado
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Estado incremental ilegível, reconstruindo: {e}")
+        return None
+
+
+def salvar_estado(caminho: str, cubo: CuboVendas) -> bool:
+    """
+    Guarda o cubo e a nova marca d'água de forma atômica.
+
+    Args:
+        caminho: Caminho do arquivo de origem
+        cubo: Cubo resultante desta execução
+
+    Returns:
+        True se o estado foi gravado
+    """
+    try:
+        destino = caminho_estado(caminho)
+        destino.parent.mkdir(parents=True, exist_ok=True)
+
+        temporario = destino.with_name(f"{destino.name}.{os.getpid()}.tmp")
+        shutil.rmtree(temporario, ignore_errors=True)
+        temporario.mkdir()
+        gravar_arrays_cubo(temporario, cubo)
+
+        estado = {
+            'versao': VERSAO_ESTADO,
+            'marca_dagua': str(np.datetime64(int(cubo.dia.max()), 'D')) if len(cubo.dia) else None,
+            'hash_arquivo': calcular_hash_arquivo(caminho),
+            'gerado_em': datetime.now().isoformat(),
+        }
+        with open(temporario / ARQUIVO_ESTADO, 'w', encoding='utf-8') as f:
+            json.dump(estado, f, ensure_ascii=False, indent=2)
+
+        # Troca a pasta inteira: a anterior só é apagada depois do rename
+        antigo = destino.with_name(f"{destino.name}.{os.getpid()}.old")
+        if destino.exists():
+            os.replace(destino, antigo)
+        os.replace(temporario, destino)
+        shutil.rmtree(antigo, ignore_errors=True)
+
+        logger.info(f"Estado incremental gravado (marca d'água {estado['marca_dagua']})")
+        return True
+    except Exception as e:
+        logger.warning(f"Não foi possível gravar o estado incremental: {e}")
+        return False
+
+
+def carregar_alteracoes(caminho: str) -> Optional[dict]:
+    """
+    Lê o relatório de alterações da última execução incremental.
+
+    Args:
+        caminho: Caminho do arquivo de origem
+
+    Returns:
+        Relatório (ver `resumir_alteracoes`) ou None se não existir ou não
+        corresponder ao extrato atual
+    """
+    try:
+        with open(caminho_alteracoes(caminho), encoding='utf-8') as f:
+            alteracoes = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if alteracoes.get('hash_arquivo') != calcular_hash_arquivo(caminho):
+        return None
+    return alteracoes
+
+
+# ==========================================
+# LEITURA DOS DIAS A PARTIR DO CORTE
+# ==========================================
+
+def somar_por_loja_dia(df_lote: pd.DataFrame) -> pd.DataFrame:
+    """
+    Soma um lote bruto por (loja, dia) com os mesmos descartes da base preparada.
+
+    Descarta valores <= 0, datas inválidas e produtos vazios, como
+    `agregar_lote` + `preparar_base`, para que a soma seja comparável à do cubo.
+
+    Returns:
+        DataFrame com loja, dia (dias desde 1970-01-01) e valor
+    """
+    df = tipar_colunas(df_lote)
+    produtos = normalizar_produtos(df[COL_PRODUTO])
+    df = df[
+        (df[COL_VALOR] > 0) & df[COL_DATA].notna()
+        & (produtos != '') & (produtos != 'NAN')
+    ]
+    return (
+        pd.DataFrame({
+            'loja': df[COL_LOJA],
+            'dia': df[COL_DATA].to_numpy().astype('datetime64[D]').astype(np.int32),
+            'valor': df[COL_VALOR].to_numpy(dtype=np.float64),
+        })
+        .groupby(['loja', 'dia'], sort=False)['valor']
+        .sum()
+        .reset_index()
+    )
+
+
+def filtrar_desde(
+    corte: np.datetime64,
+    controle: Optional[list[pd.DataFrame]] = None
+) -> Callable[[pd.DataFrame], pd.DataFrame]:
+    """
+    Cria o filtro de lote que mantém só as linhas com data >= corte.
+
+    As datas convertidas ficam no lote, então a tipagem seguinte não as
+    converte de novo.
+
+    Args:
+        corte: Primeira data mantida
+        controle: Lista que recebe, a cada lote, as somas por (loja, dia) das
+            linhas anteriores ao corte (ver `somar_por_loja_dia`)
+    """
+    def filtro(df_lote: pd.DataFrame) -> pd.DataFrame:
+        datas = converter_datas(df_lote[COL_DATA])
+        df_lote = df_lote.copy()
+        df_lote[COL_DATA] = datas
+        manter = (datas >= corte).to_numpy()
+        if controle is not None:
+            controle.append(somar_por_loja_dia(df_lote[~manter]))
+        return df_lote[manter]
+
+    return filtro
+
+
+def filtrar_dias(dias: Iterable[int]) -> Callable[[pd.DataFrame], pd.DataFrame]:
+    """Cria o filtro de lote que mantém só as linhas dos dias informados."""
+    relidos = np.array(sorted(dias), dtype='int64').astype('datetime64[D]').astype('datetime64[ns]')
+
+    def filtro(df_lote: pd.DataFrame) -> pd.DataFrame:
+        datas = converter_datas(df_lote[COL_DATA])
+        manter = datas.dt.normalize().isin(relidos).to_numpy()
+        df_lote = df_lote[manter].copy()
+        df_lote[COL_DATA] = datas[manter]
+        return df_lote
+
+    return filtro
+
+
+def ler_extrato(
+    caminho: str,
+    filtro: Optional[Callable[[pd.DataFrame], pd.DataFrame]]
+) -> Optional[pd.DataFrame]:
+    """
+    Lê o extrato em lotes e agrega por dia as linhas mantidas pelo filtro.
+
+    Args:
+        caminho: Caminho do arquivo de origem
+        filtro: Filtro de lote (None = extrato inteiro)
+
+    Returns:
+        Agregado diário com as colunas do staging ou None em caso de erro
+    """
+    extensao = caminho.lower().split('.')[-1]
+
+    if extensao == 'xlsx':
+        return agregar_xlsx_streaming(caminho, filtro=filtro)
+    if extensao == 'csv':
+        return agregar_csv_em_blocos(caminho, filtro=filtro)
+
+    df = carregar_dados(caminho)
+    if df is None or filtro is None:
+        return df
+    return filtro(df)
+
+
+def ler_extrato_desde(
+    caminho: str,
+    corte: Optional[np.datetime64],
+    controle: Optional[list[pd.DataFrame]] = None
+) -> Optional[pd.DataFrame]:
+    """
+    Lê o extrato em lotes e agrega por dia apenas as datas a partir do corte.
+
+    Args:
+        caminho: Caminho do arquivo de origem
+        corte: Primeira data relida (None = extrato inteiro)
+        controle: Recebe as somas por (loja, dia) anteriores ao corte
+            (ver `filtrar_desde`)
+
+    Returns:
+        Agregado diário com as colunas do staging ou None em caso de erro
+    """
+    return ler_extrato(caminho, filtrar_desde(corte, controle) if corte is not None else None)
+
+
+def construir_cubo_completo(caminho: str) -> Optional[CuboVendas]:
+    """
+    Cubo do extrato inteiro, lido em lotes (ou o já gravado para este extrato).
+
+    Args:
+        caminho: Caminho do arquivo de origem
+
+    Returns:
+        Cubo gravado em disco ou None em caso de erro
+    """
+    cubo = carregar_cubo(caminho)
+    if cubo is not None:
+        return cubo
+
+    diario = ler_extrato(caminho, None)
+    if diario is None:
+        return None
+    base = preparar_base(diario)
+    if base is None:
+        return None
+
+    cubo = construir_cubo(base)
+    salvar_cubo(caminho, cubo)
+    return cubo
+
+
+# ==========================================
+# MESCLAGEM E DETECÇÃO DE ALTERAÇÕES
+# ==========================================
+
+def _relidos(dias: np.ndarray, corte_dia: int, dias_extra: Iterable[int]) -> np.ndarray:
+    """Máscara dos dias substituídos: a partir do corte ou relidos à parte."""
+    return (dias >= corte_dia) | np.isin(dias, np.fromiter(dias_extra, dtype=np.int64))
+
+
+def _celulas(cubo: CuboVendas, corte_dia: int, dias_extra: Iterable[int] = ()) -> pd.DataFrame:
+    """Células relidas do cubo (ver `_relidos`), com loja e produto por nome."""
+    manter = _relidos(np.asarray(cubo.dia), corte_dia, dias_extra)
+    return pd.DataFrame({
+        'loja': np.asarray(cubo.lojas, dtype=object)[np.asarray(cubo.loja)[manter]],
+        'produto': np.asarray(cubo.produtos, dtype=object)[np.asarray(cubo.produto)[manter]],
+        'dia': np.asarray(cubo.dia)[manter],
+        'valor': np.asarray(cubo.valor)[manter],
+    })
+
+
+def mesclar_cubos(
+    anterior: CuboVendas,
+    novo: CuboVendas,
+    corte_dia: int,
+    dias_extra: Iterable[int] = ()
+) -> CuboVendas:
+    """
+    Substitui os dias relidos (>= corte ou em dias_extra) do cubo anterior
+    pelos do cubo novo.
+
+    Os dicionários são refeitos com os nomes efetivamente usados, em ordem
+    alfabética, como em uma reconstrução completa.
+
+    Args:
+        anterior: Cubo guardado
+        novo: Cubo dos dias relidos (somente esses dias)
+        corte_dia: Primeiro dia relido (dias desde 1970-01-01)
+        dias_extra: Dias anteriores ao corte também relidos
+
+    Returns:
+        Cubo mesclado, ordenado por (loja, produto, dia)
+    """
+    manter = ~_relidos(np.asarray(anterior.dia), corte_dia, dias_extra)
+    nomes_loja = np.concatenate([
+        np.asarray(anterior.lojas, dtype=object)[np.asarray(anterior.loja)[manter]],
+        np.asarray(novo.lojas, dtype=object)[np.asarray(novo.loja)],
+    ])
+    nomes_produto = np.concatenate([
+        np.asarray(anterior.produtos, dtype=object)[np.asarray(anterior.produto)[manter]],
+        np.asarray(novo.produtos, dtype=object)[np.asarray(novo.produto)],
+    ])
+    dias = np.concatenate([np.asarray(anterior.dia)[manter], np.asarray(novo.dia)])
+    valores = np.concatenate([np.asarray(anterior.valor)[manter], np.asarray(novo.valor)])
+
+    lojas, codigos_loja = np.unique(nomes_loja.astype(str), return_inverse=True)
+    produtos, codigos_produto = np.unique(nomes_produto.astype(str), return_inverse=True)
+    ordem = np.lexsort((dias, codigos_produto, codigos_loja))
+
+    return CuboVendas(
+        loja=codigos_loja[ordem].astype(np.int32),
+        produto=codigos_produto[ordem].astype(np.int32),
+        dia=dias[ordem].astype(np.int32),
+        valor=valores[ordem].astype(np.float64),
+        lojas=lojas.tolist(),
+        produtos=produtos.tolist(),
+    )
+
+
+def detectar_alteracoes(
+    anterior: CuboVendas,
+    novo: CuboVendas,
+    corte_dia: int,
+    dias_extra: Iterable[int] = ()
+) -> pd.DataFrame:
+    """
+    Compara os dias relidos com os guardados e retorna as (loja, dia) alteradas.
+
+    Uma (loja, dia) muda quando algum produto aparece, some ou tem o valor
+    alterado (em centavos).
+
+    Returns:
+        DataFrame com loja e dia (dias desde 1970-01-01), sem repetições
+    """
+    dias_extra = list(dias_extra)
+    antes = _celulas(anterior, corte_dia, dias_extra)
+    depois = _celulas(novo, corte_dia, dias_extra)
+    comparacao = antes.merge(depois, on=['loja', 'produto', 'dia'], how='outer', suffixes=('_antes', '_depois'))
+
+    diferente = (
+        comparacao['valor_antes'].round(CASAS_COMPARACAO)
+        .ne(comparacao['valor_depois'].round(CASAS_COMPARACAO))
+    )
+    return (
+        comparacao.loc[diferente, ['loja', 'dia']]
+        .drop_duplicates()
+        .sort_values(['loja', 'dia'])
+        .reset_index(drop=True)
+    )
+
+
+def dias_divergentes(anterior: CuboVendas, controle: list[pd.DataFrame], corte_dia: int) -> list[int]:
+    """
+    Dias anteriores ao corte cujas somas por (loja, dia) mudaram no extrato.
+
+    Args:
+        anterior: Cubo guardado
+        controle: Somas por (loja, dia) do extrato atual antes do corte
+            (preenchidas por `filtrar_desde`)
+        corte_dia: Primeiro dia relido (dias desde 1970-01-01)
+
+    Returns:
+        Dias (desde 1970-01-01) com alguma loja divergente, em ordem
+    """
+    manter = np.asarray(anterior.dia) < corte_dia
+    guardado = (
+        pd.DataFrame({
+            'loja': np.asarray(anterior.lojas, dtype=object)[np.asarray(anterior.loja)[manter]],
+            'dia': np.asarray(anterior.dia)[manter],
+            'valor': np.asarray(anterior.valor)[manter],
+        })
+        .groupby(['loja', 'dia'], sort=False)['valor']
+        .sum()
+        .reset_index()
+    )
+    atual = (
+        pd.concat(controle, ignore_index=True)
+        .groupby(['loja', 'dia'], sort=False)['valor']
+        .sum()
+        .reset_index()
+    ) if controle else guardado.iloc[:0]
+
+    comparacao = guardado.astype({'loja': str}).merge(
+        atual.astype({'loja': str}), on=['loja', 'dia'], how='outer', suffixes=('_antes', '_depois')
+    )
+    diferente = (
+        comparacao['valor_antes'].round(CASAS_COMPARACAO)
+        .ne(comparacao['valor_depois'].round(CASAS_COMPARACAO))
+    )
+    return sorted(int(dia) for dia in comparacao.loc[diferente, 'dia'].unique())
+
+
+def resumir_alteracoes(alteradas: pd.DataFrame) -> dict[str, dict[str, list[str]]]:
+    """
+    Converte as (loja, dia) alteradas nos períodos afetados de cada granularidade.
+
+    Returns:
+        {granularidade: {loja: [períodos alterados, em ordem]}}
+    """
+    resumo = {}
+    for granularidade in GRANULARIDADES:
+        periodos = pd.DataFrame({
+            'loja': alteradas['loja'].to_numpy(),
+            'periodo': rotular_dias(alteradas['dia'].to_numpy(), granularidade),
+        }).drop_duplicates()
+        resumo[granularidade] = {
+            str(loja): sorted(grupo['periodo'])
+            for loja, grupo in periodos.groupby('loja', sort=True)
+        }
+    return resumo
+
+
+def salvar_alteracoes(caminho: str, relatorio: dict) -> None:
+    """Grava o relatório de alterações ao lado do staging."""
+    destino = caminho_alteracoes(caminho)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    temporario = destino.with_name(f"{destino.name}.{os.getpid()}.tmp")
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+    os.replace(temporario, destino)
+
+
+# ==========================================
+# EXECUÇÃO INCREMENTAL
+# ==========================================
+
+def atualizar_incremental(caminho: str) -> Optional[CuboVendas]:
+    """
+    Atualiza o cubo do extrato a partir do estado da execução anterior.
+
+    Sem estado guardado, faz a construção completa em lotes
+    (`construir_cubo_completo`) e grava o estado para as próximas execuções;
+    o relatório sai com `completo: true`. Com o mesmo extrato da última
+    execução, o cubo guardado no estado é reaproveitado.
+
+    Args:
+        caminho: Caminho do arquivo de origem
+
+    Returns:
+        Cubo do extrato atual ou None em caso de erro
+    """
+    hash_arquivo = calcular_hash_arquivo(caminho)
+    guardado = carregar_estado(caminho)
+    if guardado is not None and guardado[1].get('hash_arquivo') == hash_arquivo:
+        logger.info("Extrato igual ao da última execução incremental - nada a atualizar")
+        cubo = carregar_cubo(caminho)
+        if cubo is None:
+            # Só o estado foi restaurado (ex.: cache do CI): o cubo dele é o deste extrato
+            cubo = guardado[0]
+            salvar_cubo(caminho, cubo)
+        return cubo
+
+    relatorio = {
+        'hash_arquivo': hash_arquivo,
+        'gerado_em': datetime.now().isoformat(),
+        'marca_dagua_anterior': None,
+        'corte': None,
+        'completo': True,
+        'alteracoes': {},
+    }
+
+    if guardado is None or guardado[1].get('marca_dagua') is None:
+        logger.info("Sem estado incremental - construção completa do cubo (leitura em lotes)")
+        cubo = construir_cubo_completo(caminho)
+        if cubo is None:
+            return None
+    else:
+        anterior, estado = guardado
+        marca = np.datetime64(estado['marca_dagua'], 'D')
+        corte = marca - np.timedelta64(JANELA_REVISAO_DIAS, 'D')
+        logger.info(f"Marca d'água anterior: {marca} - relendo o extrato a partir de {corte}")
+
+        controle: list[pd.DataFrame] = []
+        diario = ler_extrato_desde(caminho, corte, controle)
+        if diario is None:
+            return None
+
+        # Dias antigos que mudaram no extrato são relidos e substituídos também
+        corte_dia = int(corte.astype(np.int64))
+        divergentes = dias_divergentes(anterior, controle, corte_dia)
+        if divergentes:
+            logger.warning(
+                f"{len(divergentes)} dias anteriores a {corte} mudaram no extrato - relendo esses dias"
+            )
+            extra = ler_extrato(caminho, filtrar_dias(divergentes))
+            if extra is None:
+                return None
+            diario = combinar_agregados([diario, extra])
+
+        base = preparar_base(diario)
+        if base is None:
+            return None
+
+        novo = construir_cubo(base)
+        alteradas = detectar_alteracoes(anterior, novo, corte_dia, divergentes)
+        cubo = mesclar_cubos(anterior, novo, corte_dia, divergentes)
+        salvar_cubo(caminho, cubo)
+
+        relatorio.update({
+            'marca_dagua_anterior': str(marca),
+            'corte': str(corte),
+            'dias_fora_janela': len(divergentes),
+            'completo': False,
+            'alteracoes': resumir_alteracoes(alteradas),
+        })
+        logger.info(
+            f"Incremental: {len(novo.valor)} células relidas, "
+            f"{len(alteradas)} (loja, dia) alterados em {alteradas['loja'].nunique()} lojas"
+        )
+
+    salvar_estado(caminho, cubo)
+    relatorio['marca_dagua'] = str(np.datetime64(int(cubo.dia.max()), 'D')) if len(cubo.dia) else None
+    salvar_alteracoes(caminho, relatorio)
+    return cubo
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+LEITURA DO EXTRATO EM CSV: ENCODING DETECTADO E COLUNAS PROJETADAS
+Detecta o encoding por uma amostra de bytes e lê o arquivo uma única vez,
+somente com as quatro colunas usadas pelas análises.
+
+Substitui o laço ['latin1', 'utf-8', 'cp1252'], que relia o arquivo inteiro a
+cada UnicodeDecodeError e, como latin1 nunca falha, decodificava arquivos
+UTF-8 com acentos errados.
+
+Para extratos grandes, `agregar_csv_em_blocos` lê em blocos (chunksize) e
+reduz cada um ao agregado diário combinável de `vendas_core.agregado`.
+"""
+
+from __future__ import annotations
+
+import codecs
+import logging
+import os
+import time
+from typing import Callable, Optional
+
+import pandas as pd
+
+from vendas_core.agregado import dobrar_lotes
+from vendas_core.colunas import COL_DATA, COL_LOJA, COL_PRODUTO, COL_VALOR, COLUNAS_EXTRATO
+from vendas_core.staging import PYARROW_DISPONIVEL
+
+logger = logging.getLogger(__name__)
+
+SEPARADOR_CSV = ';'
+TAMANHO_AMOSTRA_ENCODING = 1024 * 1024  # bytes lidos do início e do fim do arquivo
+TAMANHO_BLOCO_CSV = 200_000  # linhas por bloco na leitura agregada
+
+# Tudo é lido como texto: valor (1.234,56) e data (DD/MM/YYYY) são convertidos depois
+DTYPES_CSV = {COL_LOJA: str, COL_PRODUTO: str, COL_VALOR: str, COL_DATA: str}
+
+# Bytes sem caractere definido no cp1252; se aparecerem, só latin1 decodifica
+_BYTES_INDEFINIDOS_CP1252 = frozenset(b'\x81\x8d\x8f\x90\x9d')
+
+
+def _amostra_e_utf8(amostra: bytes, inicio_parcial: bool) -> bool:
+    """Verifica se a amostra é UTF-8 válido, tolerando caracteres cortados nas bordas."""
+    if inicio_parcial:
+        # Descarta bytes de continuação de um caractere cortado no início
+        descartar = 0
+        while descartar < 3 and descartar < len(amostra) and 0x80 <= amostra[descartar] <= 0xBF:
+            descartar += 1
+        amostra = amostra[descartar:]
+
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(amostra, final=False)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def detectar_encoding(caminho: str, tamanho_amostra: int = TAMANHO_AMOSTRA_ENCODING) -> str:
+    """
+    Detecta o encoding do arquivo a partir de amostras do início e do fim.
+
+    Ordem de decisão: BOM UTF-8 -> UTF-8 válido -> cp1252 -> latin1.
+
+    Args:
+        caminho: Caminho do arquivo CSV
+        tamanho_amostra: Bytes lidos em cada extremidade
+
+    Returns:
+        Nome do encoding para o pandas
+    """
+    with open(caminho, 'rb') as f:
+        inicio = f.read(tamanho_amostra)
+        tamanho = f.seek(0, os.SEEK_END)
+        fim = b''
+        if tamanho > 2 * tamanho_amostra:
+            f.seek(tamanho - tamanho_amostra)
+            fim = f.read()
+
+    if inicio.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+
+    if _amostra_e_utf8(inicio, inicio_parcial=False) and _amostra_e_utf8(fim, inicio_parcial=True):
+        return 'utf-8'
+
+    if _BYTES_INDEFINIDOS_CP1252.intersection(inicio + fim):
+        return 'latin1'
+    return 'cp1252'
+
+
+def _ler_csv(caminho: str, encoding: str, engine: str, **kwargs) -> pd.DataFrame:
+    """Leitura única do CSV com colunas projetadas e tipos declarados."""
+    return pd.read_csv(
+        caminho,
+        sep=SEPARADOR_CSV,
+        encoding=encoding,
+        engine=engine,
+        usecols=COLUNAS_EXTRATO,
+        dtype=DTYPES_CSV,
+        on_bad_lines='skip',
+        **kwargs
+    )
+
+
+def _validar_cabecalho(caminho: str, encoding: str) -> bool:
+    """Confere se o cabeçalho tem as colunas do extrato antes de projetá-las."""
+    cabecalho = pd.read_csv(caminho, sep=SEPARADOR_CSV, encoding=encoding, nrows=0)
+    faltantes = [c for c in COLUNAS_EXTRATO if c not in cabecalho.columns]
+    if faltantes:
+        logger.error(f"Colunas faltantes no CSV: {faltantes}")
+        logger.info(f"Colunas disponíveis: {list(cabecalho.columns)}")
+        return False
+    return True
+
+
+def _encoding_alternativo(encoding: str) -> str:
+    """Encoding da nova leitura quando bytes fora da amostra não decodificam."""
+    alternativo = 'cp1252' if encoding.startswith('utf-8') else 'latin1'
+    logger.warning(f"Encoding da amostra não vale para o arquivo todo; relendo com {alternativo}")
+    return alternativo
+
+
+def ler_csv_vendas(caminho: str, engine: Optional[str] = None) -> Optional[pd.DataFrame]:
+    """
+    Lê o extrato CSV em uma única passada.
+
+    Args:
+        caminho: Caminho do arquivo CSV
+        engine: 'pyarrow' ou 'c'; por padrão usa pyarrow quando instalado
+
+    Returns:
+        DataFrame com as quatro colunas do extrato ou None em caso de erro
+    """
+    engine = engine or ('pyarrow' if PYARROW_DISPONIVEL else 'c')
+    encoding = detectar_encoding(caminho)
+    inicio = time.time()
+
+    try:
+        if not _validar_cabecalho(caminho, encoding):
+            return None
+
+        try:
+            df = _ler_csv(caminho, encoding, engine)
+        except UnicodeDecodeError:
+            encoding = _encoding_alternativo(encoding)
+            df = _ler_csv(caminho, encoding, engine)
+
+    except Exception as e:
+        logger.error(f"Erro ao carregar CSV: {e}")
+        return None
+
+    logger.info(
+        f"CSV carregado (encoding: {encoding}, engine: {engine}) - "
+        f"{len(df)} registros em {time.time() - inicio:.1f}s"
+    )
+    return df
+
+
+def agregar_csv_em_blocos(
+    caminho: str,
+    tamanho_bloco: int = TAMANHO_BLOCO_CSV,
+    filtro: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None
+) -> Optional[pd.DataFrame]:
+    """
+    Lê o CSV em blocos e reduz tudo a somas por (loja, produto, dia).
+
+    Só um bloco bruto fica na memória por vez, então o consumo não depende do
+    tamanho da exportação. Usa o engine c, o único com suporte a chunksize.
+
+    Args:
+        caminho: Caminho do arquivo CSV
+        tamanho_bloco: Linhas por bloco
+        filtro: Função aplicada a cada bloco bruto (ver `dobrar_lotes`)
+
+    Returns:
+        Agregado diário com as colunas do staging ou None em caso de erro
+    """
+    encoding = detectar_encoding(caminho)
+    inicio = time.time()
+
+    try:
+        if not _validar_cabecalho(caminho, encoding):
+            return None
+
+        try:
+            agregado, total_linhas = dobrar_lotes(_ler_csv(caminho, encoding, 'c', chunksize=tamanho_bloco), filtro)
+        except UnicodeDecodeError:
+            encoding = _encoding_alternativo(encoding)
+            agregado, total_linhas = dobrar_lotes(_ler_csv(caminho, encoding, 'c', chunksize=tamanho_bloco), filtro)
+
+    except Exception as e:
+        logger.error(f"Erro ao agregar CSV em blocos: {e}")
+        return None
+
+    logger.info(
+        f"CSV agregado em blocos (encoding: {encoding}) em {time.time() - inicio:.1f}s: "
+        f"{total_linhas} linhas -> {len(agregado)} registros diários"
+    )
+    return agregado
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+LIMPEZA E PREPARAÇÃO DO EXTRATO DE VENDAS
+Converte valores e datas, padroniza nomes e produz a base preparada comum a
+todas as análises (ABC, temporal mensal e multi-granularidade).
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import Optional
+
+import pandas as pd
+
+from vendas_core.colunas import COL_DATA, COL_LOJA, COL_PRODUTO, COL_VALOR, COLUNAS_EXTRATO
+from vendas_core.datas import converter_datas, derivar_chaves_datas
+
+# Texto em Arrow acelera as operações .str; sem pyarrow usa o caminho object
+try:
+    import pyarrow  # noqa: F401
+    TEXTO_ARROW: Optional[str] = 'string[pyarrow]'
+except ImportError:
+    TEXTO_ARROW = None
+
+logger = logging.getLogger(__name__)
+
+# Número já normalizado (sem milhar, ponto decimal), ex.: '-1234.56' ou '1e3'
+PADRAO_NUMERO = r'[+-]?(\d+(\.\d*)?|\.\d+)([eE][+-]?\d+)?'
+
+# Tipos inferidos (pd.api.types.infer_dtype) de colunas object só com números
+TIPOS_NUMERICOS = {'integer', 'floating', 'mixed-integer-float', 'decimal', 'boolean', 'empty'}
+
+
+def _normalizar_texto_monetario(texto: pd.Series) -> pd.Series:
+    """Remove 'R$', espaços e pontos de milhar e troca a vírgula decimal por ponto."""
+    return (
+        texto.str.replace('R$', '', regex=False)
+        .str.replace(' ', '', regex=False)
+        .str.strip()
+        .str.replace('.', '', regex=False)
+        .str.replace(',', '.', regex=False)
+    )
+
+
+def converter_valores_monetarios(valores: pd.Series) -> pd.Series:
+    """
+    Converte uma coluna de valores monetários brasileiros (R$ 1.234,56) para float.
+
+    - Colunas numéricas seguem direto, sem cópia quando já são float64
+    - Colunas de texto passam por limpeza vetorizada (em Arrow quando o
+      pyarrow está instalado) e conversão numérica em bloco
+    - Colunas object só com números ou booleanos seguem por `pd.to_numeric`
+    - Colunas mistas (números e textos) limpam só os elementos de texto;
+      outros objetos (datas, listas...) contam como inválidos
+    - Valores impossíveis de converter viram 0.0 e são reportados em um
+      único aviso com a contagem, em vez de um log por linha
+
+    Args:
+        valores: Coluna de valores (texto, numérica ou mista)
+
+    Returns:
+        Série float64 com o mesmo índice
+    """
+    if pd.api.types.is_bool_dtype(valores):
+        return valores.astype('float64')
+
+    if pd.api.types.is_numeric_dtype(valores):
+        return valores.astype('float64', copy=False).fillna(0.0)
+
+    tipo = pd.api.types.infer_dtype(valores, skipna=True)
+
+    if tipo in TIPOS_NUMERICOS:
+        # Coluna object só com números (ou booleanos): conversão direta
+        convertidos = pd.to_numeric(valores.astype(object), errors='coerce').astype('float64')
+    elif TEXTO_ARROW and tipo == 'string':
+        texto = _normalizar_texto_monetario(valores.astype(TEXTO_ARROW))
+        numeros_validos = texto.str.fullmatch(PADRAO_NUMERO).fillna(False).astype(bool)
+        convertidos = texto.where(numeros_validos).astype('float64[pyarrow]').astype('float64')
+    else:
+        # Colunas mistas: só os elementos de texto passam pela limpeza monetária;
+        # números (e booleanos) são convertidos direto e o resto vira inválido
+        eh_texto = valores.map(lambda valor: isinstance(valor, str)).astype(bool)
+        convertidos = pd.Series(float('nan'), index=valores.index, dtype='float64')
+        if eh_texto.any():
+            texto = _normalizar_texto_monetario(valores[eh_texto].astype(str))
+            convertidos[eh_texto] = pd.to_numeric(texto, errors='coerce')
+        eh_numero = valores.map(lambda valor: isinstance(valor, (int, float))).astype(bool) & ~eh_texto
+        if eh_numero.any():
+            convertidos[eh_numero] = pd.to_numeric(valores[eh_numero].astype(object), errors='coerce')
+
+    invalidos = int((convertidos.isna() & valores.notna()).sum())
+    if invalidos > 0:
+        logger.warning(f"{invalidos} valores monetários não puderam ser convertidos (considerados 0)")
+
+    return convertidos.fillna(0.0)
+
+
+def validar_colunas(df: pd.DataFrame) -> bool:
+    """
+    Valida se o DataFrame contém todas as colunas necessárias.
+
+    Args:
+        df: DataFrame a ser validado
+
+    Returns:
+        True se válido, False caso contrário
+    """
+    colunas_faltantes = [col for col in COLUNAS_EXTRATO if col not in df.columns]
+
+    if colunas_faltantes:
+        logger.error(f"Colunas faltantes no arquivo: {colunas_faltantes}")
+        logger.info(f"Colunas disponíveis: {list(df.columns)}")
+        return False
+
+    return True
+
+
+def normalizar_produtos(produtos: pd.Series) -> pd.Series:
+    """Padroniza nomes de produtos: sem espaços nas bordas, maiúsculas, espaços simples."""
+    return (
+        produtos
+        .astype(str)
+        .str.strip()
+        .str.upper()
+        .str.replace(r'\s+', ' ', regex=True)
+    )
+
+
+def codificar_nomes(nomes: pd.Series) -> pd.Series:
+    """
+    Codifica nomes já padronizados como categoria com dicionário ordenado.
+
+    Agrupamentos, ordenações e junções passam a operar nos códigos inteiros;
+    como as categorias estão em ordem alfabética, a ordem dos códigos é a
+    mesma dos textos.
+
+    Args:
+        nomes: Série de textos (lojas ou produtos)
+
+    Returns:
+        Série categórica com os mesmos valores
+    """
+    return nomes.astype(pd.CategoricalDtype(sorted(nomes.unique())))
+
+
+def preparar_base(df: pd.DataFrame) -> Optional[pd.DataFrame]:
+    """
+    Limpa o extrato e produz a base preparada usada por todas as análises.
+
+    Colunas da base:
+    - loja_id: ID da loja (categórica: código inteiro + dicionário de nomes)
+    - produto: nome padronizado (categórica, idem)
+    - valor_limpo: valor em float (somente > 0)
+    - data_obj: data da venda
+    - dia, semana, mes_ano: períodos 'YYYY-MM-DD', 'YYYY-Www', 'YYYY-MM'
+      (categóricas, calculadas por data distinta)
+    - dia_semana: 0 = segunda ... 6 = domingo
+
+    Args:
+        df: DataFrame bruto (ou staging) com as colunas do extrato
+
+    Returns:
+        Base preparada ou None em caso de erro
+    """
+    if not validar_colunas(df):
+        return None
+
+    # Converte valores monetários e remove registros com valor zero ou negativo
+    valores = converter_valores_monetarios(df[COL_VALOR])
+    validos = valores > 0
+
+    registros_removidos = int((~validos).sum())
+    if registros_removidos > 0:
+        logger.info(f"Removidos {registros_removidos} registros com valor <= 0")
+
+    lojas = df.loc[validos, COL_LOJA]
+    base = pd.DataFrame({
+        'loja_id': lojas.where(lojas.isna(), lojas.astype(str)),
+        'produto': normalizar_produtos(df.loc[validos, COL_PRODUTO]),
+        'valor_limpo': valores[validos],
+        'data_obj': converter_datas(df.loc[validos, COL_DATA]),
+    })
+
+    # Verifica datas inválidas
+    datas_invalidas = int(base['data_obj'].isna().sum())
+    if datas_invalidas > 0:
+        logger.warning(f"Encontradas {datas_invalidas} datas inválidas")
+
+    # Registros sem loja ficam de fora, como no groupby por loja do agregado
+    lojas_vazias = int(base['loja_id'].isna().sum())
+    if lojas_vazias > 0:
+        logger.warning(f"Removidos {lojas_vazias} registros sem loja")
+
+    # Remove lojas vazias, datas inválidas e produtos vazios ou inválidos
+    base = base[
+        base['loja_id'].notna()
+        & base['data_obj'].notna()
+        & (base['produto'] != '')
+        & (base['produto'] != 'NAN')
+    ]
+
+    base = base.reset_index(drop=True)
+    base = base.join(derivar_chaves_datas(base['data_obj']))
+    base['loja_id'] = codificar_nomes(base['loja_id'])
+    base['produto'] = codificar_nomes(base['produto'])
+
+    logger.info(f"Dados preparados: {len(base)} registros válidos")
+    return base
+
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+PLANEJAMENTO DE LOTES DA IA POR ORÇAMENTO DE TOKENS
+Em vez de cortar os itens em grupos de tamanho fixo, cada item tem o seu
+custo estimado em tokens de prompt (os dados serializados) e de resposta
+(a linha JSON que a IA devolve), e os itens são empacotados no menor número
+de requisições que cabem no orçamento de cada lado.
+
+O empacotamento é o first-fit decreasing (mais caros primeiro, cada um no
+primeiro lote onde couber): não é garantidamente ótimo, mas fica perto
+disso e é determinístico. Itens que sozinhos estouram o orçamento vão em um
+lote próprio. Dentro de cada lote a ordem original dos itens é mantida.
+
+Respostas truncadas ou com um elemento malformado não são descartadas
+inteiras: `recuperar_array_json` aproveita cada objeto completo do array, e
+só os itens que faltarem são pedidos de novo, em lotes menores.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any, NamedTuple
+
+from vendas_core.cliente_ia import CARACTERES_POR_TOKEN
+
+logger = logging.getLogger(__name__)
+
+
+class OrcamentoLote(NamedTuple):
+    """Limites de uma requisição em lote."""
+    tokens_prompt: int       # dados dos itens (sem o texto fixo do template)
+    tokens_resposta: int     # resposta esperada (abaixo do limite de saída do modelo)
+    max_itens: int = 0       # itens por lote (0 = sem limite)
+
+
+def estimar_tokens_texto(texto: str) -> int:
+    """Estimativa de tokens de um texto (arredondada para cima)."""
+    return -(-len(texto) // CARACTERES_POR_TOKEN)
+
+
+def estimar_tokens_item(item: dict) -> int:
+    """Tokens de prompt de um item: o seu JSON, como entra no prompt."""
+    return estimar_tokens_texto(json.dumps(item, ensure_ascii=False)) + 1
+
+
+def planejar_lotes(
+    itens: list[Any],
+    custos_prompt: list[int],
+    custos_resposta: list[int],
+    orcamento: OrcamentoLote
+) -> list[list[Any]]:
+    """
+    Empacota os itens no menor número de lotes que respeitam o orçamento.
+
+    Args:
+        itens: Itens a enviar
+        custos_prompt: Tokens de prompt estimados de cada item
+        custos_resposta: Tokens de resposta estimados de cada item
+        orcamento: Limites por requisição
+
+    Returns:
+        Lotes de itens, cada um na ordem original; vazio se não houver itens
+    """
+    # Mais caros primeiro, pelo lado do orçamento que o item mais ocupa
+    ordem = sorted(
+        range(len(itens)),
+        key=lambda i: max(custos_prompt[i] / orcamento.tokens_prompt,
+                          custos_resposta[i] / orcamento.tokens_resposta),
+        reverse=True,
+    )
+
+    lotes: list[list[int]] = []
+    ocupacao: list[list[int]] = []  # [tokens_prompt, tokens_resposta] de cada lote
+    for i in ordem:
+        destino = next(
+            (
+                k for k, (prompt, resposta) in enumerate(ocupacao)
+                if prompt + custos_prompt[i] <= orcamento.tokens_prompt
+                and resposta + custos_resposta[i] <= orcamento.tokens_resposta
+                and not (orcamento.max_itens and len(lotes[k]) >= orcamento.max_itens)
+            ),
+            None,
+        )
+        if destino is None:
+            destino = len(lotes)
+            lotes.append([])
+            ocupacao.append([0, 0])
+        lotes[destino].append(i)
+        ocupacao[destino][0] += custos_prompt[i]
+        ocupacao[destino][1] += custos_resposta[i]
+
+    # Lotes na ordem do primeiro item, itens na ordem original
+    return [[itens[i] for i in sorted(lote)] for lote in sorted(lotes, key=min)]
+
+
+# ==========================================
+# RESPOSTAS PARCIAIS
+# ==========================================
+
+def recuperar_array_json(texto: str) -> Any:
+    """
+    Interpreta a resposta da IA, aproveitando os elementos completos de um
+    array JSON truncado ou com elementos malformados.
+
+    Args:
+        texto: Texto da resposta
+
+    Returns:
+        O JSON interpretado; se inválido, a lista dos elementos legíveis do array
+
+    Raises:
+        json.JSONDecodeError: Se nenhum elemento puder ser lido
+    """
+    try:
+        return json.loads(texto)
+    except json.JSONDecodeError as erro:
+        inicio = texto.find('[')
+        if inicio < 0:
+            raise
+        decodificador = json.JSONDecoder()
+        elementos = []
+        posicao = inicio + 1
+        while posicao < len(texto):
+            # Pula separadores entre elementos
+            while posicao < len(texto) and texto[posicao] in ' \t\r\n,':
+                posicao += 1
+            if posicao >= len(texto) or texto[posicao] == ']':
+                break
+            try:
+                elemento, posicao = decodificador.raw_decode(texto, posicao)
+                elementos.append(elemento)
+            except json.JSONDecodeError:
+                # Elemento malformado (ou cortado): segue para o próximo objeto
+                proximo = texto.find('{', posicao + 1)
+                if proximo < 0:
+                    break
+                posicao = proximo
+
+        if not elementos:
+            raise erro
+        logger.warning(f"Resposta JSON inválida ({erro.msg}) - {len(elementos)} elementos aproveitados")
+        return elementos
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+PARTIÇÕES CONTÍGUAS (FATIAS POR LOJA E POR PERÍODO)
+Os agregados já saem ordenados por (loja, período, produto) - ver
+`vendas_core.cubo.agregar_cubo`. Em vez de filtrar com máscaras booleanas
+sobre a coluna inteira (custo O(lojas × períodos × linhas)), as fronteiras de
+cada valor são calculadas uma vez a partir dos códigos e cada fatia vira um
+`df.iloc[inicio:fim]`, localizado em O(1).
+"""
+
+from __future__ import annotations
+
+from typing import Any, Iterator
+
+import numpy as np
+import pandas as pd
+
+
+def _codigos(chaves: pd.Series) -> np.ndarray:
+    """Códigos inteiros da coluna (-1 para nulos)."""
+    if isinstance(chaves.dtype, pd.CategoricalDtype):
+        return chaves.cat.codes.to_numpy()
+    codigos, _ = pd.factorize(chaves)
+    return codigos
+
+
+def _fronteiras(codigos: np.ndarray) -> np.ndarray:
+    """Posições onde começa cada sequência de códigos iguais, mais o fim."""
+    inicios = np.flatnonzero(codigos[1:] != codigos[:-1]) + 1
+    return np.concatenate(([0], inicios, [len(codigos)])).astype(np.intp)
+
+
+def indexar_particoes(chaves: pd.Series) -> dict[Any, slice]:
+    """
+    Mapeia cada valor da coluna à fatia posicional contígua que ele ocupa.
+
+    A coluna precisa estar agrupada (cada valor em uma única sequência), como
+    acontece com loja e período nos agregados do cubo. Linhas com chave nula
+    ficam de fora, assim como ficariam em um filtro por igualdade.
+
+    Args:
+        chaves: Coluna agrupada por valor (ex.: df['loja_id'])
+
+    Returns:
+        Dicionário {valor: slice(inicio, fim)} na ordem em que os valores
+        aparecem; use com `df.iloc[fatia]`
+
+    Raises:
+        ValueError: Se algum valor aparecer em mais de uma sequência
+    """
+    if chaves.empty:
+        return {}
+
+    codigos = _codigos(chaves)
+    fronteiras = _fronteiras(codigos)
+    inicios, fins = fronteiras[:-1], fronteiras[1:]
+
+    codigos_sequencia = codigos[inicios]
+    if len(np.unique(codigos_sequencia)) != len(codigos_sequencia):
+        raise ValueError(f"Coluna '{chaves.name}' não está agrupada por valor")
+
+    valores = chaves.iloc[inicios].tolist()
+    return {
+        valor: slice(int(inicio), int(fim))
+        for valor, codigo, inicio, fim in zip(valores, codigos_sequencia, inicios, fins)
+        if codigo >= 0
+    }
+
+
+def iterar_particoes(df: pd.DataFrame, coluna: str) -> Iterator[tuple[Any, pd.DataFrame]]:
+    """
+    Percorre as fatias de `df` com o mesmo valor em `coluna`.
+
+    Se a coluna não estiver agrupada, o DataFrame é reordenado por ela uma
+    única vez (ordenação estável, preservando a ordem interna das linhas).
+
+    Args:
+        df: DataFrame de origem
+        coluna: Coluna de particionamento
+
+    Yields:
+        Tuplas (valor, fatia do DataFrame)
+    """
+    try:
+        particoes = indexar_particoes(df[coluna])
+    except ValueError:
+        df = df.sort_values(coluna, kind='stable')
+        particoes = indexar_particoes(df[coluna])
+
+    for valor, fatia in particoes.items():
+        yield valor, df.iloc[fatia]
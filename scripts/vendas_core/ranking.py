@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+RANKING TOP/BOTTOM DE TODOS OS GRUPOS EM UMA ÚNICA ORDENAÇÃO
+O agregado é ordenado uma vez por (grupo, valor decrescente); a posição de
+cada produto no seu grupo sai de `groupby().cumcount()` e os rótulos
+TOP/BOTTOM/GERAL são atribuídos por máscaras vetorizadas, sem um
+`sort_values` + `concat` por (loja, período).
+"""
+
+from __future__ import annotations
+
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+
+def ranquear_top_bottom(
+    df: pd.DataFrame,
+    chaves: list[str],
+    top_n: int,
+    bottom_n: int,
+    rotulo_top: str = 'TOP',
+    rotulo_bottom: str = 'BOTTOM',
+    rotulo_geral: Optional[str] = None,
+    bottom_apenas_positivos: bool = False,
+    coluna_tipo: str = 'tipo',
+    coluna_valor: str = 'valor_limpo',
+) -> pd.DataFrame:
+    """
+    Seleciona os TOP N e BOTTOM N produtos de cada grupo.
+
+    Em cada grupo, a saída traz primeiro os TOP e depois os BOTTOM, ambos em
+    ordem decrescente de valor (empates na ordem original das linhas).
+
+    Args:
+        df: Agregado com as colunas de `chaves` e `coluna_valor`
+        chaves: Colunas que definem o grupo (ex.: ['loja_id', 'mes_ano'])
+        top_n: Quantidade de maiores valores por grupo
+        bottom_n: Quantidade de menores valores por grupo
+        rotulo_top: Rótulo dos maiores
+        rotulo_bottom: Rótulo dos menores
+        rotulo_geral: Se informado, grupos com até top_n + bottom_n produtos
+            saem inteiros com este rótulo
+        bottom_apenas_positivos: Considera só valores > 0 para o BOTTOM (um
+            produto pode então aparecer como TOP e como BOTTOM)
+        coluna_tipo: Nome da coluna de rótulo na saída
+        coluna_valor: Coluna usada no ranking
+
+    Returns:
+        Linhas selecionadas, ordenadas por grupo, com a coluna de rótulo e
+        `total_grupo` (soma de todos os produtos do grupo)
+    """
+    ordenado = df.sort_values(
+        [*chaves, coluna_valor],
+        ascending=[True] * len(chaves) + [False],
+        kind='stable',
+    )
+    grupos = ordenado.groupby(chaves, observed=True, sort=False)
+
+    posicao = grupos.cumcount().to_numpy()
+    tamanho = grupos[coluna_valor].transform('size').to_numpy()
+    ordenado = ordenado.assign(total_grupo=grupos[coluna_valor].transform('sum'))
+
+    if bottom_apenas_positivos:
+        positivos = ordenado[coluna_valor].to_numpy() > 0
+        # Ordem decrescente: os positivos ocupam as primeiras posições do grupo
+        qtd_positivos = pd.Series(positivos, index=ordenado.index).groupby(
+            [ordenado[c] for c in chaves], observed=True, sort=False
+        ).transform('sum').to_numpy()
+        eh_bottom = positivos & (posicao >= qtd_positivos - bottom_n)
+    else:
+        eh_bottom = posicao >= tamanho - bottom_n
+    eh_top = posicao < top_n
+
+    if rotulo_geral is not None:
+        geral = tamanho <= top_n + bottom_n
+        eh_top &= ~geral
+        eh_bottom &= ~geral
+    else:
+        geral = np.zeros(len(ordenado), dtype=bool)
+
+    # Blocos por grupo: 0 = TOP/GERAL, 1 = BOTTOM (concatenados e reordenados)
+    partes = [
+        ordenado[geral].assign(**{coluna_tipo: rotulo_geral, '_bloco': 0}),
+        ordenado[eh_top].assign(**{coluna_tipo: rotulo_top, '_bloco': 0}),
+        ordenado[eh_bottom].assign(**{coluna_tipo: rotulo_bottom, '_bloco': 1}),
+    ]
+    selecao = pd.concat(partes)
+    selecao['_posicao'] = np.concatenate([posicao[geral], posicao[eh_top], posicao[eh_bottom]])
+
+    return (
+        selecao.sort_values([*chaves, '_bloco', '_posicao'], kind='stable')
+        .drop(columns=['_bloco', '_posicao'])
+    )
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+STAGING COLUNAR DO EXTRATO DE VENDAS
+Converte a planilha de vendas (XLSX ou CSV) uma única vez para um arquivo
+Parquet tipado, identificado pelo hash do conteúdo do arquivo de origem.
+
+Enquanto o extrato não mudar, todos os scripts reaproveitam o mesmo Parquet
+em vez de repetir o `pd.read_excel`, que leva minutos em 500k+ linhas.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+
+from vendas_core.colunas import COL_DATA, COL_LOJA, COL_PRODUTO, COL_VALOR, COLUNAS_EXTRATO
+from vendas_core.datas import converter_datas
+from vendas_core.limpeza import converter_valores_monetarios
+
+# Parquet depende do pyarrow; sem ele o staging é simplesmente ignorado
+try:
+    import pyarrow  # noqa: F401
+    PYARROW_DISPONIVEL = True
+except ImportError:
+    PYARROW_DISPONIVEL = False
+
+logger = logging.getLogger(__name__)
+
+# ==========================================
+# CONFIGURAÇÕES
+# ==========================================
+
+PASTA_STAGING = '.staging'  # criada ao lado do arquivo de origem
+VERSAO_STAGING = 1  # incrementar quando o esquema do Parquet mudar
+TAMANHO_BLOCO_HASH = 1024 * 1024  # 1 MB por leitura ao calcular o hash
+
+# Hashes já calculados neste processo: (caminho, tamanho, mtime) -> sha256
+_hashes_calculados: dict[tuple[str, int, float], str] = {}
+
+
+# ==========================================
+# HASH E LOCALIZAÇÃO DO STAGING
+# ==========================================
+
+def calcular_hash_arquivo(caminho: str) -> str:
+    """
+    Calcula o SHA-256 do conteúdo do arquivo, lendo em blocos.
+
+    O resultado é memorizado por (caminho, tamanho, mtime) para que o mesmo
+    processo não leia o arquivo duas vezes.
+
+    Args:
+        caminho: Caminho do arquivo de origem
+
+    Returns:
+        Hash hexadecimal do conteúdo
+    """
+    info = os.stat(caminho)
+    chave = (os.path.abspath(caminho), info.st_size, info.st_mtime)
+    if chave in _hashes_calculados:
+        return _hashes_calculados[chave]
+
+    sha = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(TAMANHO_BLOCO_HASH), b''):
+            sha.update(bloco)
+
+    _hashes_calculados[chave] = sha.hexdigest()
+    return _hashes_calculados[chave]
+
+
+def caminho_staging(caminho: str, hash_arquivo: Optional[str] = None) -> Path:
+    """
+    Retorna o caminho do Parquet de staging correspondente ao arquivo.
+
+    Args:
+        caminho: Caminho do arquivo de origem
+        hash_arquivo: Hash já calculado (opcional)
+
+    Returns:
+        Caminho do arquivo Parquet (pode ainda não existir)
+    """
+    origem = Path(caminho)
+    hash_arquivo = hash_arquivo or calcular_hash_arquivo(caminho)
+    nome = f"{origem.name}.v{VERSAO_STAGING}.{hash_arquivo[:16]}.parquet"
+    return origem.parent / PASTA_STAGING / nome
+
+
+# ==========================================
+# TIPAGEM DAS COLUNAS
+# ==========================================
+
+def tipar_colunas(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Projeta as colunas usadas pelas análises e fixa seus tipos.
+
+    - loja e produto como texto
+    - valor como float (formato brasileiro já convertido)
+    - data como datetime (dia primeiro; inválidas viram NaT)
+
+    Args:
+        df: DataFrame bruto lido do extrato
+
+    Returns:
+        DataFrame apenas com as colunas do staging, já tipadas
+    """
+    df = df[COLUNAS_EXTRATO].copy()
+
+    df[COL_LOJA] = df[COL_LOJA].where(df[COL_LOJA].isna(), df[COL_LOJA].astype(str))
+    df[COL_PRODUTO] = df[COL_PRODUTO].astype(str)
+
+    if not pd.api.types.is_float_dtype(df[COL_VALOR]):
+        df[COL_VALOR] = converter_valores_monetarios(df[COL_VALOR])
+
+    if not pd.api.types.is_datetime64_any_dtype(df[COL_DATA]):
+        df[COL_DATA] = converter_datas(df[COL_DATA])
+
+    return df
+
+
+# ==========================================
+# LEITURA E ESCRITA DO STAGING
+# ==========================================
+
+def carregar_staging(caminho: str) -> Optional[pd.DataFrame]:
+    """
+    Carrega o Parquet de staging se ele corresponder ao conteúdo atual do arquivo.
+
+    Args:
+        caminho: Caminho do arquivo de origem (XLSX ou CSV)
+
+    Returns:
+        DataFrame tipado ou None se não houver staging válido
+    """
+    if not PYARROW_DISPONIVEL:
+        return None
+
+    try:
+        destino = caminho_staging(caminho)
+        if not destino.exists():
+            return None
+
+        df = pd.read_parquet(destino)
+        logger.info(f"Staging reaproveitado ({destino.name}) - {len(df)} registros")
+        return df
+    except Exception as e:
+        logger.warning(f"Erro ao ler staging, recarregando o arquivo original: {e}")
+        return None
+
+
+def salvar_staging(caminho: str, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Tipa o DataFrame carregado e grava o Parquet de staging.
+
+    Se faltarem colunas, o DataFrame é devolvido intacto para que a validação
+    de cada script reporte o problema. Falhas de escrita apenas geram aviso.
+
+    Args:
+        caminho: Caminho do arquivo de origem
+        df: DataFrame bruto lido do arquivo
+
+    Returns:
+        DataFrame tipado (ou o original, se não for possível tipar)
+    """
+    if any(col not in df.columns for col in COLUNAS_EXTRATO):
+        return df
+
+    df = tipar_colunas(df)
+
+    if not PYARROW_DISPONIVEL:
+        logger.info("pyarrow não instalado - staging Parquet desativado")
+        return df
+
+    try:
+        destino = caminho_staging(caminho)
+        destino.parent.mkdir(parents=True, exist_ok=True)
+
+        # Escrita atômica: outro script nunca lê um Parquet pela metade
+        temporario = destino.with_name(f"{destino.name}.{os.getpid()}.tmp")
+        df.to_parquet(temporario, index=False)
+        os.replace(temporario, destino)
+
+        # Remove staging de versões anteriores do mesmo extrato
+        for antigo in destino.parent.glob(f"{Path(caminho).name}.v*.parquet"):
+            if antigo != destino:
+                antigo.unlink(missing_ok=True)
+
+        logger.info(f"Staging gravado: {destino}")
+    except Exception as e:
+        logger.warning(f"Não foi possível gravar staging: {e}")
+
+    return df
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+INGESTÃO EM STREAMING DO EXCEL COM AGREGAÇÃO DIÁRIA
+Percorre a planilha em modo read-only do openpyxl, limpa valor e data a cada
+lote de linhas e soma direto em (loja, produto, dia).
+
+O pico de memória passa a acompanhar o número de chaves distintas, e não o
+número de linhas: nunca existe um DataFrame com o extrato inteiro.
+
+A saída usa as mesmas colunas do staging, então qualquer `preparar_dados`
+existente funciona sobre ela sem alteração (todas as análises somam por
+períodos de um dia ou mais).
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from typing import Callable, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+from vendas_core.agregado import dobrar_lotes
+from vendas_core.colunas import COLUNAS_EXTRATO
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_LOTE_STREAMING = 50_000  # linhas lidas antes de cada agregação parcial
+
+
+def iterar_lotes_xlsx(
+    caminho: str,
+    tamanho_lote: int = TAMANHO_LOTE_STREAMING
+) -> Iterator[pd.DataFrame]:
+    """
+    Lê a primeira planilha em modo read-only e devolve lotes de linhas.
+
+    Apenas as quatro colunas usadas pelas análises são mantidas; células
+    vazias viram NaN, como no `pd.read_excel`. As colunas ficam como object:
+    inferir o tipo por lote transformaria a loja 1 em 1.0 nos lotes com
+    alguma loja vazia, e a mesma loja viraria duas chaves.
+
+    Args:
+        caminho: Caminho do arquivo XLSX
+        tamanho_lote: Número de linhas por lote
+
+    Yields:
+        DataFrame com as colunas do staging, ainda sem tipagem
+    """
+    wb = load_workbook(caminho, read_only=True, data_only=True)
+    try:
+        linhas = wb.worksheets[0].iter_rows(values_only=True)
+
+        cabecalho = [str(c) if c is not None else '' for c in next(linhas, ())]
+        faltantes = [c for c in COLUNAS_EXTRATO if c not in cabecalho]
+        if faltantes:
+            raise ValueError(f"Colunas faltantes no Excel: {faltantes}")
+        indices = [cabecalho.index(c) for c in COLUNAS_EXTRATO]
+
+        lote = []
+        for linha in linhas:
+            lote.append(tuple(linha[i] if i < len(linha) else None for i in indices))
+            if len(lote) >= tamanho_lote:
+                yield pd.DataFrame(lote, columns=COLUNAS_EXTRATO, dtype=object).fillna(np.nan)
+                lote = []
+
+        if lote:
+            yield pd.DataFrame(lote, columns=COLUNAS_EXTRATO, dtype=object).fillna(np.nan)
+    finally:
+        wb.close()
+
+
+def agregar_xlsx_streaming(
+    caminho: str,
+    tamanho_lote: int = TAMANHO_LOTE_STREAMING,
+    filtro: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None
+) -> Optional[pd.DataFrame]:
+    """
+    Agrega o Excel inteiro em somas diárias sem carregá-lo na memória.
+
+    Args:
+        caminho: Caminho do arquivo XLSX
+        tamanho_lote: Número de linhas por lote
+        filtro: Função aplicada a cada lote bruto (ver `dobrar_lotes`)
+
+    Returns:
+        DataFrame com (loja, produto, dia, valor) ou None em caso de erro
+    """
+    inicio = time.time()
+
+    try:
+        agregado, total_linhas = dobrar_lotes(iterar_lotes_xlsx(caminho, tamanho_lote), filtro)
+    except Exception as e:
+        logger.error(f"Erro na leitura em streaming do Excel: {e}")
+        return None
+
+    logger.info(
+        f"Streaming concluído em {time.time() - inicio:.1f}s: "
+        f"{total_linhas} linhas -> {len(agregado)} registros diários"
+    )
+    return agregado
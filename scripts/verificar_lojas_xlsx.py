@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+VERIFICAÇÃO: CHAVES DE LOJA NO XLSX EM STREAMING x CSV EM BLOCOS
+Gera o mesmo extrato sintético em XLSX (lojas como números, como no Excel) e
+em CSV, com algumas células de loja vazias espalhadas pelos lotes, e confere
+que `agregar_xlsx_streaming` e `agregar_csv_em_blocos` produzem as mesmas
+lojas e os mesmos totais por loja.
+
+Uso:
+    python verificar_lojas_xlsx.py [linhas]   (padrão: 20.000)
+
+Sai com código 1 se as chaves ou os totais divergirem.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+from vendas_core.colunas import COL_DATA, COL_LOJA, COL_PRODUTO, COL_VALOR, COLUNAS_EXTRATO
+from vendas_core.leitura_csv import SEPARADOR_CSV, agregar_csv_em_blocos
+from vendas_core.streaming import agregar_xlsx_streaming
+
+LINHAS_PADRAO = 20_000
+TAMANHO_LOTE = 1_000  # lotes pequenos: vários com e sem loja vazia
+LINHAS_SEM_LOJA = 5
+
+
+def gerar_extrato(linhas: int) -> pd.DataFrame:
+    """Extrato com lojas inteiras e algumas lojas vazias em lotes diferentes."""
+    rng = np.random.default_rng(7)
+    datas = pd.date_range('2024-01-01', '2024-12-31', freq='D').strftime('%d/%m/%Y').to_numpy()
+    lojas = rng.choice([1, 2, 3, 12, 14, 15, 20], linhas).astype(object)
+    lojas[rng.choice(linhas, LINHAS_SEM_LOJA, replace=False)] = None
+
+    return pd.DataFrame({
+        COL_LOJA: lojas,
+        COL_PRODUTO: rng.choice([f"PRODUTO {i:03d}" for i in range(50)], linhas),
+        COL_VALOR: pd.Series(rng.gamma(2.0, 40.0, linhas)).map('{:.2f}'.format).str.replace('.', ',', regex=False),
+        COL_DATA: rng.choice(datas, linhas),
+    })[COLUNAS_EXTRATO]
+
+
+def gravar_xlsx(df: pd.DataFrame, caminho: str) -> None:
+    """Grava o extrato com lojas numéricas e células vazias, como o Excel exportado."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(COLUNAS_EXTRATO)
+    for linha in df.itertuples(index=False):
+        ws.append(list(linha))
+    wb.save(caminho)
+
+
+def totais_por_loja(agregado: pd.DataFrame) -> pd.Series:
+    """Total de vendas por chave de loja, arredondado em centavos."""
+    return agregado.groupby(COL_LOJA)[COL_VALOR].sum().round(2).sort_index()
+
+
+def main() -> int:
+    linhas = int(sys.argv[1]) if len(sys.argv) > 1 else LINHAS_PADRAO
+    df = gerar_extrato(linhas)
+
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho_xlsx = os.path.join(pasta, 'extrato.xlsx')
+        caminho_csv = os.path.join(pasta, 'extrato.csv')
+        gravar_xlsx(df, caminho_xlsx)
+        df.to_csv(caminho_csv, sep=SEPARADOR_CSV, index=False, encoding='utf-8')
+
+        xlsx = totais_por_loja(agregar_xlsx_streaming(caminho_xlsx, tamanho_lote=TAMANHO_LOTE))
+        csv = totais_por_loja(agregar_csv_em_blocos(caminho_csv, tamanho_bloco=TAMANHO_LOTE))
+
+    print(f"Lojas no XLSX: {list(xlsx.index)}")
+    print(f"Lojas no CSV:  {list(csv.index)}")
+
+    if list(xlsx.index) != list(csv.index):
+        print("❌ As chaves de loja divergem entre XLSX e CSV")
+        return 1
+    if not np.allclose(xlsx.to_numpy(), csv.to_numpy()):
+        print("❌ Os totais por loja divergem entre XLSX e CSV")
+        return 1
+
+    print("✅ XLSX e CSV produzem as mesmas lojas e os mesmos totais")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())